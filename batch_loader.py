@@ -0,0 +1,90 @@
+'''
+Parallel loading of a batch of WFCore workflows: every file is parsed in
+a pool of processes into the graph of its receipe, ready to be given to
+the schedulers. The graphs keep the order of the files (sorted by name
+when a directory is given), whatever the order the workers finish in,
+and a file that can't be parsed doesn't stop the others: its error is
+reported with its path.
+
+On Windows the pool starts new interpreters, so the calling script must
+load the workflows under "if __name__ == '__main__':".
+'''
+
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+
+load_result_type = collections.namedtuple('load_result_type', 'path receipt error')
+
+# below this size a batch is parsed faster by a single process than by
+# starting the pool and sending the graphs back (about 15 MB/s serially)
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+
+def workflow_paths(source):
+    '''
+    The given paths, or the json files of the given directory sorted by name
+    '''
+    if isinstance(source, str):
+        if os.path.isdir(source):
+            return [os.path.join(source, name) for name in sorted(os.listdir(source))
+                    if name.endswith(".json")]
+        return [source]
+    return list(source)
+
+
+def _load_workflow(path, order=None):
+    from utils import WFCoreUtils
+
+    try:
+        return load_result_type(path=path, receipt=WFCoreUtils(path, order).create_graph(), error=None)
+    except Exception as e:
+        return load_result_type(path=path, receipt=None, error="%s: %s" % (type(e).__name__, e))
+
+
+def load_workflows(source, max_workers=None):
+    '''
+    Parses the workflows of source (a list of paths or a directory) with
+    max_workers processes. By default, as many as the CPUs, and a single one
+    if the files are less than PARALLEL_MIN_BYTES in total. Returns a
+    load_result_type for every file, in the order of the files: the
+    receipe graph, or the error met parsing it
+    '''
+    paths = workflow_paths(source)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+        if sum([os.path.getsize(path) for path in paths if os.path.isfile(path)]) < PARALLEL_MIN_BYTES:
+            max_workers = 1
+    max_workers = min(max_workers, len(paths))
+
+    if max_workers <= 1:
+        return [_load_workflow(path, order) for order, path in enumerate(paths)]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_load_workflow, paths, range(len(paths))))
+
+
+def load_receipts_parallel(source, max_workers=None, skip_errors=False):
+    '''
+    Receipes of the workflows of source, as the schedulers want them
+    (as scheduler_graph.load_receipts, but parsed in parallel).
+    If a file can't be parsed a ValueError lists every error, unless
+    skip_errors is True: then the receipes of the other files are returned.
+    Returns the receipes and the load_result_type of the files with errors
+    '''
+    results = load_workflows(source, max_workers)
+    errors = [result for result in results if result.error is not None]
+    if errors and not skip_errors:
+        raise ValueError("Workflows not loaded:\n" +
+                         "\n".join(["%s: %s" % (result.path, result.error) for result in errors]))
+    return [result.receipt for result in results if result.error is None], errors
+
+
+if __name__ == '__main__':
+    # python batch_loader.py <directory or files>
+    for result in load_workflows(sys.argv[1] if len(sys.argv) == 2 else sys.argv[1:]):
+        if result.error is None:
+            print("%s: %i steps" % (result.path, result.receipt.number_of_nodes()))
+        else:
+            print("%s: %s" % (result.path, result.error))
@@ -0,0 +1,12 @@
+'''
+Synthetic workloads and scaling benchmark of the schedulers.
+Run from the repository root:
+
+    python -m benchmark --receipts 2 4 8 --steps 4 8 --ovens 1 2 --output results.json
+'''
+
+from benchmark.generator import instance_spec_type, generate_instance, generate_workflows, generate_machines
+from benchmark.suite import benchmark_result_type, spec_grid, run_instance, run_benchmark
+
+__all__ = ["instance_spec_type", "generate_instance", "generate_workflows", "generate_machines",
+           "benchmark_result_type", "spec_grid", "run_instance", "run_benchmark"]
@@ -0,0 +1,24 @@
+import argparse
+
+from benchmark.suite import spec_grid, run_benchmark
+from solver_config import DEFAULT_CONFIG_PATH
+
+parser = argparse.ArgumentParser(prog="python -m benchmark",
+                                 description="Scaling benchmark of SIAF_scheduler on synthetic receipes")
+parser.add_argument("--receipts", type=int, nargs="+", default=[2, 4], help="numbers of receipes")
+parser.add_argument("--steps", type=int, nargs="+", default=[4, 8], help="steps per receipe")
+parser.add_argument("--temperatures", type=int, nargs="+", default=[2], help="distinct oven temperatures")
+parser.add_argument("--ovens", type=int, nargs="+", default=[1, 2], help="numbers of ovens")
+parser.add_argument("--chillers", type=int, nargs="+", default=[1], help="numbers of blast chillers")
+parser.add_argument("--vacuums", type=int, nargs="+", default=[1], help="numbers of vacuum machines")
+parser.add_argument("--humans", type=int, nargs="+", default=[1], help="numbers of chefs")
+parser.add_argument("--repeat", type=int, default=1, help="instances (seeds) of every size")
+parser.add_argument("--seed", type=int, default=0, help="seed of the first instance")
+parser.add_argument("--config", default=DEFAULT_CONFIG_PATH, help="solver configuration file")
+parser.add_argument("--time-limit", type=float, default=None, help="time limit of every solve, in seconds")
+parser.add_argument("--output", default="benchmark_results.json", help="JSON file of the results")
+arguments = parser.parse_args()
+
+specs = spec_grid(arguments.receipts, arguments.steps, arguments.temperatures, arguments.ovens,
+                  arguments.chillers, arguments.vacuums, arguments.humans, arguments.repeat, arguments.seed)
+run_benchmark(specs, arguments.config, arguments.output, max_time_in_seconds=arguments.time_limit)
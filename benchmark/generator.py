@@ -0,0 +1,187 @@
+'''
+Synthetic workload: random but realistic receipes, written as WFCore
+workflows (the same files the schedulers read in production), and
+machine inventories to schedule them on.
+
+A receipe is a sequence of units: a human step, a vacuum step, a cook
+(preheat and oven cook) or a blast (preblast and blast). Some units are
+split in parallel branches joining on the following unit, as in the
+exported workflows.
+'''
+
+import collections
+import json
+import os
+import random
+
+from machine import BlastChiller, Oven, VacuumMachine, Human
+from utils import WFCoreUtils
+
+WAIT_STEP_ID = "WorkflowCore.Primitives.WaitFor, WorkflowCore"
+SEQUENCE_STEP_ID = "WorkflowCore.Primitives.Sequence, WorkflowCore"
+
+# oven temperatures drawn by the receipes, the first n_temperatures are used
+TEMPERATURE_LEVELS = [180, 220, 120, 250, 150, 200, 90, 280]
+BLAST_TEMPERATURES = [3, -18]
+
+UNIT_KINDS = ["human", "vacuum", "cook", "blast"]
+
+# size of every unit, in scheduled steps
+UNIT_SIZES = {"human": 1, "vacuum": 1, "cook": 2, "blast": 2}
+
+instance_spec_type = collections.namedtuple('instance_spec_type',
+                                            'n_receipts n_steps n_temperatures n_ovens '
+                                            'n_chillers n_vacuums n_humans seed')
+instance_spec_type.__new__.__defaults__ = (1, 1, 1, 0)
+
+workload_type = collections.namedtuple('workload_type', 'workflows machines')
+
+
+class _WorkflowWriter:
+    '''
+    Writes the json of a single receipe: every step gets the id of
+    the WFCore exports (prefix and counter, a prestep is followed by its
+    next step) and a wait step pointing to the step coming next
+    '''
+
+    def __init__(self, name, temperatures, max_duration, rng):
+        self.name = name
+        self.temperatures = temperatures
+        self.max_duration = max_duration
+        self.rng = rng
+        self.counters = {}
+        self.n_parallels = 0
+
+    '''
+    Next id of the given prefix
+    '''
+    def __new_id(self, prefix):
+        self.counters[prefix] = self.counters.get(prefix, 0) + 1
+        return "%s_%i" % (prefix, self.counters[prefix])
+
+    def __duration(self):
+        return self.rng.randint(1, self.max_duration)
+
+    '''
+    Step and wait json of a single step
+    '''
+    def __step(self, prefix, step_type, inputs):
+        step_id = self.__new_id(prefix)
+        inputs["Duration"] = self.__duration()
+        return [
+            {"Id": step_id, "StepType": step_type, "Inputs": inputs, "NextStepId": "wait_" + step_id},
+            {"Id": "wait_" + step_id, "StepType": WAIT_STEP_ID, "Inputs": {}}
+        ]
+
+    '''
+    List of json nodes of a unit, linked to each other
+    '''
+    def __unit(self, kind):
+        if kind == "human":
+            nodes = self.__step("human", WFCoreUtils.HUMAN_STEP_ID, {})
+        elif kind == "vacuum":
+            nodes = self.__step("vacuum", WFCoreUtils.VACUUM_STEP_ID, {})
+        elif kind == "cook":
+            nodes = (self.__step("oven", WFCoreUtils.OVEN_STEP_ID,
+                                 {"OvenValue1": WFCoreUtils.PREHEAT_STEP_ID})
+                     + self.__step("oven", WFCoreUtils.OVEN_STEP_ID,
+                                   {"OvenValue1": "\"Cuoci\"",
+                                    "OvenValue2": self.rng.choice(self.temperatures)}))
+        else:
+            nodes = (self.__step("blast", WFCoreUtils.BLAST_STEP_ID,
+                                 {"BlastValue1": WFCoreUtils.PREBLAST_STEP_ID})
+                     + self.__step("blast", WFCoreUtils.BLAST_STEP_ID,
+                                   {"BlastValue1": "\"Abbatti\"",
+                                    "BlastValue2": self.rng.choice(BLAST_TEMPERATURES)}))
+        if len(nodes) == 4:
+            nodes[1]["NextStepId"] = nodes[2]["Id"]
+        return nodes
+
+    '''
+    Appends the nodes to the sequence, the open wait steps point to the first one.
+    Returns the new open wait steps
+    '''
+    def __append(self, sequence, open_waits, nodes):
+        for wait in open_waits:
+            wait["NextStepId"] = nodes[0]["Id"]
+        sequence.extend(nodes)
+        return [nodes[-1]]
+
+    def workflow(self, n_steps):
+        '''
+        Json of a receipe with about n_steps scheduled steps
+        '''
+        kinds = []
+        size = 0
+        while size < n_steps:
+            kinds.append(self.rng.choice(UNIT_KINDS))
+            size += UNIT_SIZES[kinds[-1]]
+
+        steps = []
+        open_waits = []
+        position = 0
+        while position < len(kinds):
+            # a parallel block of two or three branches, never the first unit
+            n_branches = self.rng.choice([2, 3])
+            if position > 0 and position + n_branches <= len(kinds) and self.rng.random() < 0.3:
+                self.n_parallels += 1
+                parallel = {"Id": "par_%i" % self.n_parallels, "StepType": SEQUENCE_STEP_ID, "Do": []}
+                self.__append(steps, open_waits, [parallel])
+                open_waits = []
+                for kind in kinds[position:position + n_branches]:
+                    branch = []
+                    open_waits += self.__append(branch, [], self.__unit(kind))
+                    parallel["Do"].append(branch)
+                position += n_branches
+            else:
+                open_waits = self.__append(steps, open_waits, self.__unit(kinds[position]))
+                position += 1
+
+        return {"Id": self.name, "Version": 1, "Steps": steps}
+
+
+def generate_workflows(n_receipts, n_steps, n_temperatures, seed, max_duration=10):
+    '''
+    Json of n_receipts random receipes of about n_steps steps, cooking at
+    n_temperatures different oven temperatures
+    '''
+    rng = random.Random(seed)
+    temperatures = TEMPERATURE_LEVELS[:n_temperatures]
+    return [_WorkflowWriter("Synthetic_%i" % rec_id, temperatures, max_duration, rng).workflow(n_steps)
+            for rec_id in range(n_receipts)]
+
+
+def generate_machines(n_ovens, n_chillers=1, n_vacuums=1, n_humans=1, n_temperatures=1,
+                      oven_capacity=2, chiller_capacity=2):
+    '''
+    Machine inventory able to perform every synthetic receipe
+    '''
+    max_temperature = max(TEMPERATURE_LEVELS[:n_temperatures])
+    return ([Oven(oven_capacity, max_temperature, False) for _ in range(n_ovens)]
+            + [BlastChiller(chiller_capacity) for _ in range(n_chillers)]
+            + [VacuumMachine(1) for _ in range(n_vacuums)]
+            + [Human(1) for _ in range(n_humans)])
+
+
+def generate_instance(spec):
+    '''
+    Workflows and machines of an instance_spec_type
+    '''
+    return workload_type(
+        workflows=generate_workflows(spec.n_receipts, spec.n_steps, spec.n_temperatures, spec.seed),
+        machines=generate_machines(spec.n_ovens, spec.n_chillers, spec.n_vacuums, spec.n_humans,
+                                   spec.n_temperatures)
+    )
+
+
+def write_workflows(workflows, directory):
+    '''
+    Writes every workflow to a json file in directory, returning the paths
+    '''
+    paths = []
+    for workflow in workflows:
+        path = os.path.join(directory, workflow["Id"] + ".json")
+        with open(path, "w") as f:
+            json.dump(workflow, f, indent=4)
+        paths.append(path)
+    return paths
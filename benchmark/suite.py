@@ -0,0 +1,148 @@
+'''
+Scaling benchmark of SIAF_scheduler on synthetic instances: parsing of
+the WFCore workflows, construction of the CP-SAT model, solve and export
+of the new workflow are timed separately, and the results are written as
+JSON, to compare the versions of the scheduler.
+'''
+
+import collections
+import itertools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+from benchmark.generator import instance_spec_type, generate_instance, write_workflows
+from instrumentation import PipelineReport
+from solver_config import DEFAULT_CONFIG_PATH, load_solver_config, apply_solver_config
+
+PHASES = ["parse", "build", "solve", "export"]
+
+benchmark_result_type = collections.namedtuple('benchmark_result_type',
+                                               'spec times status objective best_bound lower_bound '
+                                               'horizon n_variables n_constraints families error')
+
+
+def spec_grid(n_receipts, n_steps, n_temperatures, n_ovens, n_chillers=[1], n_vacuums=[1], n_humans=[1],
+              repeat=1, seed=0):
+    '''
+    Every combination of the given sizes, repeat times with different seeds
+    '''
+    specs = []
+    for values in itertools.product(n_receipts, n_steps, n_temperatures, n_ovens,
+                                    n_chillers, n_vacuums, n_humans):
+        for run in range(repeat):
+            specs.append(instance_spec_type(*values, seed=seed + run))
+    return specs
+
+
+def run_instance(spec, config):
+    '''
+    Parses, schedules and exports the instance of spec, timing every phase.
+    An error stops the instance: it is reported in the result, with the
+    phases completed until then
+    '''
+    from ortools.sat.python import cp_model
+    from scheduler_graph import load_receipts, build_model, extract_schedule, write_schedule
+
+    workload = generate_instance(spec)
+    # only the model size, tracing the memory would slow down the phases
+    report = PipelineReport(trace_memory=False)
+    times = {}
+    status, objective, best_bound = None, None, None
+    lower_bound, horizon, n_variables, n_constraints = None, None, None, None
+    phase = PHASES[0]
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_workflows(workload.workflows, directory)
+        try:
+            start = time.perf_counter()
+            receipts, exporter = load_receipts(paths)
+            times["parse"] = time.perf_counter() - start
+
+            phase = "build"
+            start = time.perf_counter()
+            instance = build_model(receipts, workload.machines, report=report)
+            times["build"] = time.perf_counter() - start
+            proto = instance.model.Proto()
+            n_variables, n_constraints = len(proto.variables), len(proto.constraints)
+            lower_bound, horizon = instance.bounds.lb, instance.bounds.eoh
+
+            phase = "solve"
+            solver = apply_solver_config(cp_model.CpSolver(), config)
+            start = time.perf_counter()
+            solve_status = solver.Solve(instance.model)
+            times["solve"] = time.perf_counter() - start
+            status = solver.StatusName(solve_status)
+
+            if solve_status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+                objective, best_bound = solver.ObjectiveValue(), solver.BestObjectiveBound()
+
+                phase = "export"
+                start = time.perf_counter()
+                write_schedule(receipts, extract_schedule(solver, instance, workload.machines))
+                exporter.create_graph_from_schedule(receipts,
+                                                    output_path=os.path.join(directory, "new_workflow.json"))
+                times["export"] = time.perf_counter() - start
+            error = None
+        except Exception as e:
+            error = "%s: %s: %s" % (phase, type(e).__name__, e)
+
+    return benchmark_result_type(spec=spec, times=times, status=status, objective=objective,
+                                 best_bound=best_bound, lower_bound=lower_bound, horizon=horizon,
+                                 n_variables=n_variables, n_constraints=n_constraints,
+                                 families={family: size._asdict() for family, size in report.families.items()},
+                                 error=error)
+
+
+def environment():
+    '''
+    Versions of the code and of the libraries the results refer to
+    '''
+    import ortools
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "ortools": ortools.__version__,
+        "machine": platform.machine(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+
+def run_benchmark(specs, config_path=DEFAULT_CONFIG_PATH, output_path=None, **solver_parameters):
+    '''
+    Runs every instance, printing a line per instance. The solver
+    parameters override the ones of config_path, as in SIAF_scheduler.
+    If output_path is given, environment and results are written there as JSON.
+    Returns the list of benchmark_result_type
+    '''
+    config = load_solver_config(config_path, **solver_parameters)
+
+    results = []
+    for spec in specs:
+        result = run_instance(spec, config)
+        results.append(result)
+        print("%s %s %s" % (
+            " ".join(["%s=%i" % (name, value) for name, value in spec._asdict().items()]),
+            " ".join(["%s=%.3fs" % (phase, result.times[phase]) for phase in PHASES if phase in result.times]),
+            result.error if result.error is not None else "%s makespan=%s" % (result.status, result.objective)
+        ))
+
+    if output_path is not None:
+        with open(output_path, "w") as f:
+            json.dump({
+                "environment": environment(),
+                "solver_config": config._asdict(),
+                "results": [dict(result._asdict(), spec=result.spec._asdict()) for result in results]
+            }, f, indent=4)
+
+    return results
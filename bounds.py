@@ -0,0 +1,201 @@
+'''
+Bounds used to size the scheduling models: the critical path of every
+receipe, a load bound for every group of machines and an upper bound
+given by a quick list schedule of all the receipes. The horizon of
+the models (EOH) is the upper bound, the lower bound is fed to the
+makespan variable, and the list schedule defining EOH can be the
+first solution of the models.
+'''
+
+import collections
+import math
+import networkx as nx
+from receipt import PreStep
+
+
+bounds_type = collections.namedtuple('bounds_type', 'lb eoh heads tails heuristic')
+heuristic_type = collections.namedtuple('heuristic_type', 'makespan rule scheduled')
+
+
+def as_graph(receipt):
+    '''
+    Receipes given as a list of steps are chains: every step precedes the next one
+    '''
+    if isinstance(receipt, nx.DiGraph):
+        return receipt
+    graph = nx.DiGraph()
+    graph.add_nodes_from(receipt)
+    graph.add_edges_from(zip(receipt[:-1], receipt[1:]))
+    return graph
+
+
+def min_duration(step):
+    '''
+    Presteps can be shortened (or skipped) when the machine is already
+    at the right temperature, so they are not counted in the lower bounds
+    '''
+    if isinstance(step, PreStep):
+        return 0
+    return step.duration
+
+
+def get_heads(receipt, fixed=None, release=0):
+    '''
+    Earliest start of every step: a step starts at least one
+    instant after the end of each of its predecessors.
+    The steps in fixed (step -> (start, end)) keep their start,
+    the other ones can't start before release
+    '''
+    if fixed is None:
+        fixed = {}
+    graph = as_graph(receipt)
+    heads = {}
+    ends = {}
+    for step in nx.topological_sort(graph):
+        if step in fixed:
+            heads[step], ends[step] = fixed[step]
+            continue
+        heads[step] = max([ends[pred] + 1 for pred in graph.predecessors(step)] + [release])
+        ends[step] = heads[step] + min_duration(step)
+    return heads
+
+
+def get_tails(receipt):
+    '''
+    Minimum time between the start of every step and the end of its receipe
+    '''
+    graph = as_graph(receipt)
+    tails = {}
+    for step in reversed(list(nx.topological_sort(graph))):
+        tails[step] = min_duration(step) + max([1 + tails[succ] for succ in graph.successors(step)],
+                                               default=0)
+    return tails
+
+
+def critical_path(receipt):
+    '''
+    Length of the longest chain of steps in the receipe
+    '''
+    tails = get_tails(receipt)
+    return max(tails.values(), default=0)
+
+
+def load_bound(receipts, compatibility_index):
+    '''
+    Every group of machines must perform all the steps that can only be
+    performed by machines of the group: the makespan is at least their
+    total duration divided by the capacity of the group
+    '''
+    loads = {}
+    for receipt in receipts:
+        for step in as_graph(receipt):
+            compatible_machines = compatibility_index.compatible_machines(step)
+            if not compatible_machines in loads:
+                loads[compatible_machines] = 0
+            loads[compatible_machines] += min_duration(step)
+
+    bound = 0
+    for group in loads:
+        capacity = sum([compatibility_index.machines[m_id].capacity for m_id in group])
+        if capacity == 0:
+            continue
+        group_load = sum([load for other_group, load in loads.items() if set(other_group).issubset(group)])
+        bound = max(bound, math.ceil(group_load / capacity))
+    return bound
+
+
+def serial_upper_bound(receipts):
+    '''
+    Every step performed after the end of the previous one
+    '''
+    return sum([step.duration + 1 for receipt in receipts for step in as_graph(receipt)])
+
+
+def default_class(step):
+    '''
+    Steps of the same kind at the same temperature
+    '''
+    return (type(step), step.temperature)
+
+
+def heuristic_upper_bound(receipts, compatibility_index, class_of=default_class):
+    '''
+    Best of the list schedules given by the priority rules: a
+    heuristic_type with its makespan, its rule and its steps
+    ((rec_id, step) -> list_scheduler.scheduled_type), or None if the
+    receipes can't be handled by the list scheduler
+    '''
+    # imported here, the list scheduler relies on the functions above
+    from list_scheduler import PRIORITY_RULES, list_schedule
+
+    best = None
+    for rule in PRIORITY_RULES:
+        scheduled = list_schedule(receipts, compatibility_index, rule, class_of)
+        if scheduled is None:
+            return None
+        makespan = max([scheduled_step.end for scheduled_step in scheduled.values()], default=0)
+        if best is None or makespan < best.makespan:
+            best = heuristic_type(makespan=makespan, rule=rule, scheduled=scheduled)
+    return best
+
+
+def compute_bounds(receipts, compatibility_index, class_of=default_class, frozen=None, current_time=0,
+                   releases=None, busy_until=0):
+    '''
+    Lower bound on the makespan, horizon (EOH) of the model and, for every
+    receipe, the earliest start (head) and the minimum remaining time (tail)
+    of each step. heuristic is the list schedule whose makespan is EOH
+    ((rec_id, step) -> list_scheduler.scheduled_type, the remaining steps
+    only), or None if EOH is the serial bound.
+
+    class_of gives the exclusivity class of a step: steps of different
+    classes are never overlapped on a machine by the heuristic schedule.
+    By default only steps of the same kind at the same temperature share a machine.
+
+    When rescheduling, frozen gives for every receipe the steps already
+    started (step -> (start, end)), and the other steps can't start
+    before current_time.
+
+    releases gives the time every receipe can start from (if after
+    current_time), busy_until the time the machines are freed by the
+    activities outside the receipes.
+    '''
+    if frozen is None:
+        frozen = [{} for _ in receipts]
+    if releases is None:
+        releases = [current_time for _ in receipts]
+    graphs = [as_graph(receipt) for receipt in receipts]
+
+    heads = [get_heads(graph, frozen[rec_id], max(current_time, releases[rec_id]))
+             for rec_id, graph in enumerate(graphs)]
+    tails = [get_tails(graph) for graph in graphs]
+
+    # the steps still to be scheduled
+    remaining = [graph.subgraph([step for step in graph if not step in frozen[rec_id]])
+                 for rec_id, graph in enumerate(graphs)]
+
+    lb = max([heads[rec_id][step] + tails[rec_id][step] for rec_id, graph in enumerate(remaining) for step in graph]
+             + [end for steps in frozen for _, end in steps.values()], default=0)
+    if any([graph.number_of_nodes() > 0 for graph in remaining]):
+        lb = max(lb, current_time + load_bound(remaining, compatibility_index))
+
+    # the remaining steps are scheduled after the end of the frozen ones,
+    # the releases of the receipes and the activities busying the machines
+    offset = max([current_time, busy_until] + list(releases) +
+                 [end + 1 for steps in frozen for _, end in steps.values()])
+    eoh = serial_upper_bound(remaining)
+
+    # a started prestep binds the machine of its next step: only the
+    # serial schedule (next steps first) is guaranteed to be feasible
+    split = [step for rec_id, steps in enumerate(frozen) for step in steps
+             if isinstance(step, PreStep) and step.next_step in remaining[rec_id]]
+    heuristic = None
+    if split == []:
+        best = heuristic_upper_bound(remaining, compatibility_index, class_of)
+        if best is not None and best.makespan < eoh:
+            eoh = best.makespan
+            heuristic = {key: scheduled_step._replace(start=scheduled_step.start + offset,
+                                                      end=scheduled_step.end + offset)
+                         for key, scheduled_step in best.scheduled.items()}
+
+    return bounds_type(lb=lb, eoh=offset + eoh, heads=heads, tails=tails, heuristic=heuristic)
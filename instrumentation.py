@@ -0,0 +1,151 @@
+'''
+Instrumentation of the scheduling pipeline. A PipelineReport given to the
+schedulers collects, for every phase (parsing of the workflows, bounds,
+model construction, solve, extraction and export of the schedule), wall
+time, CPU time and peak memory, and the number of variables and
+constraints added to the CP-SAT model by every family of constraints.
+Without a report nothing is measured.
+'''
+
+import collections
+import contextlib
+import json
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+phase_report_type = collections.namedtuple('phase_report_type',
+                                           'name wall_time cpu_time peak_memory max_rss')
+family_size_type = collections.namedtuple('family_size_type', 'variables constraints')
+
+
+def _max_rss():
+    if resource is None:
+        return None
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PipelineReport:
+    '''
+    Report of a run of the pipeline. Phases can be nested (the bounds are
+    computed while the model is built), each one is measured on its own.
+    peak_memory is the largest amount of memory allocated by Python during
+    the phase above the one allocated when it started (None if
+    trace_memory is False, tracing the allocations slows down the run);
+    max_rss is the peak resident memory of the process at the end of the
+    phase, the CP-SAT solver included
+    '''
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.phases = []
+        self.families = {}
+        self.__open_peaks = []
+        self.__started_tracing = False
+        self.__last_size = None
+
+    '''
+    Peak of the traced memory since the last reset, given to the open phases
+    '''
+    def __update_open_peaks(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        self.__open_peaks = [(start, max(open_peak, peak)) for start, open_peak in self.__open_peaks]
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.__started_tracing = True
+            self.__update_open_peaks()
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            self.__open_peaks.append((current, current))
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield self
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = time.process_time() - cpu_start
+
+            peak_memory = None
+            if self.trace_memory:
+                self.__update_open_peaks()
+                start, peak = self.__open_peaks.pop()
+                peak_memory = peak - start
+                if self.__open_peaks == [] and self.__started_tracing:
+                    tracemalloc.stop()
+                    self.__started_tracing = False
+
+            self.phases.append(phase_report_type(name=name, wall_time=wall_time, cpu_time=cpu_time,
+                                                 peak_memory=peak_memory, max_rss=_max_rss()))
+
+    def start_model(self, model):
+        '''
+        The next count_family attributes to its family what is added to
+        model from now on
+        '''
+        proto = model.Proto()
+        self.__last_size = (len(proto.variables), len(proto.constraints))
+
+    def count_family(self, model, family):
+        '''
+        Variables and constraints added to model since the previous count
+        (or start_model) are added to the family
+        '''
+        proto = model.Proto()
+        size = (len(proto.variables), len(proto.constraints))
+        variables, constraints = self.families.get(family, family_size_type(0, 0))
+        self.families[family] = family_size_type(variables=variables + size[0] - self.__last_size[0],
+                                                 constraints=constraints + size[1] - self.__last_size[1])
+        self.__last_size = size
+
+    def as_dict(self):
+        return {
+            "phases": [phase._asdict() for phase in self.phases],
+            "families": {family: size._asdict() for family, size in self.families.items()},
+            "variables": sum([size.variables for size in self.families.values()]),
+            "constraints": sum([size.constraints for size in self.families.values()])
+        }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=4)
+
+    def __str__(self):
+        lines = ["%-10s %10s %10s %12s" % ("Phase", "Wall [s]", "CPU [s]", "Peak [KiB]")]
+        for phase in self.phases:
+            lines.append("%-10s %10.3f %10.3f %12s" % (
+                phase.name, phase.wall_time, phase.cpu_time,
+                "-" if phase.peak_memory is None else "%i" % (phase.peak_memory // 1024)))
+        lines.append("")
+        lines.append("%-22s %10s %12s" % ("Family", "Variables", "Constraints"))
+        for family, size in self.families.items():
+            lines.append("%-22s %10i %12i" % (family, size.variables, size.constraints))
+        return "\n".join(lines)
+
+
+# Shortcuts for the functions taking an optional report
+
+def phase(report, name):
+    if report is None:
+        return contextlib.nullcontext()
+    return report.phase(name)
+
+
+def start_model(report, model):
+    if report is not None:
+        report.start_model(model)
+
+
+def count_family(report, model, family):
+    if report is not None:
+        report.count_family(model, family)
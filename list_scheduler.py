@@ -0,0 +1,228 @@
+'''
+Greedy list scheduler: a fast alternative to the CP-SAT model of
+scheduler_graph, that gives a (not optimal) schedule in a few milliseconds.
+
+The steps are taken one at a time, following a priority rule, among the
+steps whose predecessors are already scheduled. Every step is placed as
+soon as possible on the compatible machine where it can start first,
+respecting capacities and exclusivity classes. A prestep (PreHeat,
+PreBlast) is placed together with its next step on the same machine, and
+the machine is reserved to them from one instant before the start of the
+prestep to one instant after the end of the next step, so nothing can
+happen on the machine between the two steps.
+'''
+
+import collections
+import heapq
+import time
+import networkx as nx
+from receipt import PreStep
+from bounds import as_graph, get_heads, get_tails, default_class, critical_path, load_bound
+from solver_config import solve_result_type
+from scheduler_graph import assigned_step_type
+
+placed_type = collections.namedtuple('placed_type', 'start end step_class exclusive')
+scheduled_type = collections.namedtuple('scheduled_type', 'start end machine')
+
+
+def shortest_processing_time(graph, step, heads, tails):
+    duration = step.duration
+    if isinstance(step, PreStep) and step.next_step in graph:
+        duration += step.next_step.duration
+    return (duration, heads[step])
+
+
+def critical_path_first(graph, step, heads, tails):
+    return (-tails[step], heads[step])
+
+
+def most_successors(graph, step, heads, tails):
+    return (-len(nx.descendants(graph, step)), heads[step])
+
+
+PRIORITY_RULES = {
+    "spt": shortest_processing_time,
+    "critical_path": critical_path_first,
+    "most_successors": most_successors
+}
+
+
+def _overlapping(items, start, end):
+    # an empty interval still conflicts with the intervals containing it
+    end = max(end, start + 1)
+    return [item for item in items if item.start < end and start < max(item.end, item.start + 1)]
+
+
+def fits(items, capacity, start, end, step_class, exclusive):
+    '''
+    True if an activity of step_class can be placed from start to end on
+    a machine of the given capacity, already holding the placed items.
+    An exclusive activity can't share the machine at all
+    '''
+    overlapping = _overlapping(items, start, end)
+    if exclusive:
+        return overlapping == []
+    for item in overlapping:
+        if item.exclusive or item.step_class != step_class:
+            return False
+    # the load is maximum at the beginning of one of the intervals
+    for instant in [start] + [item.start for item in overlapping if item.start > start]:
+        if 1 + len([item for item in overlapping if item.start <= instant < item.end]) > capacity:
+            return False
+    return True
+
+
+def _is_paired(graph, step):
+    return isinstance(step, PreStep) and step.next_step in graph
+
+
+def list_schedule(receipts, compatibility_index, rule="critical_path", class_of=default_class):
+    '''
+    Returns a dictionary (rec_id, step) -> scheduled_type, or None if the
+    receipes can't be handled by the heuristic (a prestep must precede only
+    its next step, and every step can have at most one prestep)
+    '''
+    priority = PRIORITY_RULES[rule]
+    graphs = [as_graph(receipt) for receipt in receipts]
+    machines = compatibility_index.machines
+    placed = [[] for _ in machines]
+    scheduled = {}
+
+    # the steps scheduled together with their prestep are not units on their own
+    owner = {}
+    for rec_id, graph in enumerate(graphs):
+        for step in graph:
+            if _is_paired(graph, step):
+                if list(graph.successors(step)) != [step.next_step] or (rec_id, step.next_step) in owner:
+                    return None
+                owner[(rec_id, step.next_step)] = step
+
+    # number of predecessors not yet scheduled of every unit
+    heap = []
+    waiting = {}
+    for rec_id, graph in enumerate(graphs):
+        heads = get_heads(graph)
+        tails = get_tails(graph)
+        for order, step in enumerate(graph):
+            if (rec_id, step) in owner:
+                continue
+            # one for every edge: a step can precede both a prestep and its next step
+            preds = list(graph.predecessors(step))
+            if _is_paired(graph, step):
+                preds += [pred for pred in graph.predecessors(step.next_step) if pred != step]
+            waiting[(rec_id, step)] = [len(preds), priority(graph, step, heads, tails) + (rec_id, order)]
+            if not preds:
+                heapq.heappush(heap, (waiting[(rec_id, step)][1], rec_id, step))
+
+    while heap:
+        _, rec_id, step = heapq.heappop(heap)
+        graph = graphs[rec_id]
+        est = max([scheduled[(rec_id, pred)].end + 1 for pred in graph.predecessors(step)], default=0)
+
+        best = None
+        for m_id in compatibility_index.compatible_machines(step):
+            items = placed[m_id]
+            capacity = machines[m_id].capacity
+
+            if _is_paired(graph, step):
+                pre_dur = step.duration
+                next_dur = step.next_step.duration
+                next_est = max([scheduled[(rec_id, pred)].end + 1 for pred in graph.predecessors(step.next_step)
+                                if pred != step], default=0)
+                # t is the start of the next step
+                first = max(est + pre_dur + 1, next_est)
+                candidates = [first] + sorted([item.end + pre_dur + 2 for item in items
+                                               if item.end + pre_dur + 2 > first])
+                for t in candidates:
+                    if fits(items, capacity, t - pre_dur - 2, t + next_dur + 1, None, True):
+                        if best is None or t < best[0]:
+                            best = (t, m_id)
+                        break
+            else:
+                duration = step.duration
+                candidates = [est] + sorted([item.end for item in items if item.end > est])
+                for t in candidates:
+                    if fits(items, capacity, t, t + duration, class_of(step), isinstance(step, PreStep)):
+                        if best is None or t < best[0]:
+                            best = (t, m_id)
+                        break
+
+        if best is None:
+            return None
+
+        t, m_id = best
+        if _is_paired(graph, step):
+            pre_dur = step.duration
+            next_dur = step.next_step.duration
+            placed[m_id].append(placed_type(start=t - pre_dur - 2, end=t + next_dur + 1,
+                                            step_class=None, exclusive=True))
+            scheduled[(rec_id, step)] = scheduled_type(start=t - pre_dur - 1, end=t - 1, machine=m_id)
+            scheduled[(rec_id, step.next_step)] = scheduled_type(start=t, end=t + next_dur, machine=m_id)
+            done = [step.next_step]
+        else:
+            duration = step.duration
+            placed[m_id].append(placed_type(start=t, end=t + duration, step_class=class_of(step),
+                                            exclusive=isinstance(step, PreStep)))
+            scheduled[(rec_id, step)] = scheduled_type(start=t, end=t + duration, machine=m_id)
+            done = [step]
+
+        # release the units waiting for the steps just scheduled
+        for done_step in done:
+            for succ in graph.successors(done_step):
+                unit = owner.get((rec_id, succ), succ)
+                waiting[(rec_id, unit)][0] -= 1
+                if waiting[(rec_id, unit)][0] == 0:
+                    heapq.heappush(heap, (waiting[(rec_id, unit)][1], rec_id, unit))
+
+    if len(scheduled) != sum([graph.number_of_nodes() for graph in graphs]):
+        return None
+    return scheduled
+
+
+def list_scheduler(receipts, compatibility_index, rule="critical_path", class_of=default_class):
+    '''
+    Same output of the CP-SAT scheduler: a solve_result_type where the
+    schedule is the list of steps assigned to every machine, sorted by start
+    '''
+    # only for the status codes, the list scheduler doesn't need the solver
+    from ortools.sat.python import cp_model
+
+    start_time = time.perf_counter()
+    scheduled = list_schedule(receipts, compatibility_index, rule, class_of)
+
+    if scheduled is None:
+        return solve_result_type(status=cp_model.UNKNOWN,
+                                 status_name=cp_model.CpSolver().StatusName(cp_model.UNKNOWN),
+                                 objective=None,
+                                 best_bound=None,
+                                 wall_time=time.perf_counter() - start_time,
+                                 schedule=None)
+
+    return solve_result_type(status=cp_model.FEASIBLE,
+                             status_name=cp_model.CpSolver().StatusName(cp_model.FEASIBLE),
+                             objective=max([scheduled_step.end for scheduled_step in scheduled.values()], default=0),
+                             best_bound=max([critical_path(receipt) for receipt in receipts]
+                                            + [load_bound(receipts, compatibility_index)]),
+                             wall_time=time.perf_counter() - start_time,
+                             schedule=schedule_by_machine(receipts, scheduled, len(compatibility_index.machines)))
+
+
+def schedule_by_machine(receipts, scheduled, n_machines):
+    '''
+    The list of steps assigned to every machine, sorted by start, of a
+    dictionary (rec_id, step) -> scheduled_type
+    '''
+    indices = [{step: index for index, step in enumerate(as_graph(receipt))} for receipt in receipts]
+    assigned_receipts = [[] for _ in range(n_machines)]
+    for (rec_id, step), scheduled_step in scheduled.items():
+        assigned_receipts[scheduled_step.machine].append(
+            assigned_step_type(
+                start=scheduled_step.start,
+                duration=scheduled_step.end - scheduled_step.start,
+                receipt=rec_id,
+                index=indices[rec_id][step]
+            )
+        )
+    for assigned_steps in assigned_receipts:
+        assigned_steps.sort()
+    return assigned_receipts
@@ -1,3 +1,6 @@
+from receipt import OvenCook, PreHeat, VacuumStep, BlastStep, OvenFry, HumanStep
+
+
 class Machine:
     def __init__(self, capacity):
         self.capacity = capacity
@@ -28,3 +31,53 @@ class Human(Machine):
     def __str__(self):
         return "Chef"
     pass
+
+
+'''
+Key under which the compatibility of a step is resolved: two steps
+with the same key can be hosted by exactly the same machines
+'''
+def compatibility_key(step):
+    if isinstance(step, OvenCook) or isinstance(step, PreHeat):
+        return (Oven, step.temperature, False)
+    elif isinstance(step, VacuumStep):
+        return (VacuumMachine, None, False)
+    elif isinstance(step, BlastStep):
+        return (BlastChiller, None, False)
+    elif isinstance(step, OvenFry):
+        return (Oven, None, True)
+    elif isinstance(step, HumanStep):
+        return (Human, None, False)
+
+    return (None, None, False)
+
+
+class CompatibilityIndex:
+    '''
+    Index of the machine inventory: the compatible machines of every
+    (step type, temperature, fry flag) key are resolved only once, then
+    every lookup is a dictionary access
+    '''
+
+    def __init__(self, machines):
+        self.machines = machines
+        self.__index = {}
+
+    def __resolve(self, key):
+        machine_type, temperature, is_frying = key
+        if machine_type is None:
+            return ()
+        candidates = [m_id for m_id, machine in enumerate(self.machines)
+                      if isinstance(machine, machine_type)]
+        if temperature is not None:
+            candidates = [m_id for m_id in candidates
+                          if self.machines[m_id].max_temperature >= temperature]
+        if is_frying:
+            candidates = [m_id for m_id in candidates if self.machines[m_id].can_fry]
+        return tuple(candidates)
+
+    def compatible_machines(self, step):
+        key = compatibility_key(step)
+        if not key in self.__index:
+            self.__index[key] = self.__resolve(key)
+        return self.__index[key]
@@ -0,0 +1,161 @@
+'''
+On-disk cache of the CP-SAT models built by scheduler_graph: the same
+receipes on the same machines are scheduled many times, and loading the
+saved model is much faster than building it again in Python.
+
+Every entry is stored under the fingerprint of the instance (the
+structure of the receipes, the machines, the frozen steps and the code
+building the model), as the model in protobuf text format and the map
+from the steps to the indices of their variables. When the entries take
+more than max_bytes, the least recently used ones are removed.
+'''
+
+import collections
+import hashlib
+import json
+import os
+import tempfile
+
+# the files whose code determines the model, a change invalidates the cache
+MODEL_SOURCES = ["scheduler_graph.py", "bounds.py", "list_scheduler.py", "machine.py", "receipt.py"]
+
+_sources_digest = None
+
+cached_model_type = collections.namedtuple('cached_model_type', 'model_text index')
+
+
+def _sources():
+    global _sources_digest
+    if _sources_digest is None:
+        import ortools
+
+        digest = hashlib.sha256(ortools.__version__.encode())
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for source in MODEL_SOURCES:
+            with open(os.path.join(directory, source), "rb") as f:
+                digest.update(f.read())
+        _sources_digest = digest.hexdigest()
+    return _sources_digest
+
+
+def instance_fingerprint(receipts, machines, current_time=0, frozen_steps=None, releases=None, machine_states=None):
+    '''
+    Canonical fingerprint of what the model depends on. The names of the
+    receipes and of the steps are not part of it: the variables are
+    identified by the position of the steps
+    '''
+    from scheduler_graph import get_index_from_graph, get_node_from_graph
+
+    description = {
+        "sources": _sources(),
+        "receipts": [],
+        "machines": [[type(machine).__name__, machine.capacity,
+                      getattr(machine, "max_temperature", None), getattr(machine, "can_fry", None)]
+                     for machine in machines],
+        "current_time": current_time,
+        "frozen": sorted([[rec_id, step_id, frozen_step.start, frozen_step.end, frozen_step.machine]
+                          for (rec_id, step_id), frozen_step in (frozen_steps or {}).items()]),
+        "releases": releases,
+        "machine_states": None if machine_states is None else [
+            None if state is None else list(state) for state in machine_states]
+    }
+    for receipt in receipts:
+        steps = [get_node_from_graph(receipt, step_id) for step_id in range(receipt.number_of_nodes())]
+        description["receipts"].append({
+            "steps": [[type(step).__name__, step.duration, step.temperature,
+                       get_index_from_graph(receipt, step.next_step) if getattr(step, "next_step", None) in receipt
+                       else None]
+                      for step in steps],
+            "edges": sorted([[get_index_from_graph(receipt, source), get_index_from_graph(receipt, target)]
+                             for source, target in receipt.edges()])
+        })
+
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+class ModelCache:
+    '''
+    Directory of cached models, at most max_bytes large
+    '''
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def __paths(self, fingerprint):
+        base = os.path.join(self.directory, fingerprint)
+        return base + ".pbtxt", base + ".json"
+
+    def load(self, fingerprint):
+        '''
+        The cached_model_type of the fingerprint, None if it isn't cached
+        '''
+        model_path, index_path = self.__paths(fingerprint)
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            with open(model_path) as f:
+                model_text = f.read()
+        except (OSError, ValueError):
+            return None
+
+        # the access time of the entry, for the LRU eviction
+        os.utime(index_path)
+        return cached_model_type(model_text=model_text, index=index)
+
+    '''
+    Writes the file so that a concurrent reader sees it whole or not at all
+    '''
+    def __write(self, path, write):
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w") as f:
+                write(f)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def store(self, fingerprint, model, index):
+        '''
+        Saves the model (a CpModel) and its index, then evicts the least
+        recently used entries exceeding the size of the cache
+        '''
+        model_path, index_path = self.__paths(fingerprint)
+        # the model is written by the solver library, then moved
+        temporary_path = model_path + ".tmp.pbtxt"
+        model.ExportToFile(temporary_path)
+        os.replace(temporary_path, model_path)
+        # the index last: it marks the entry as complete
+        self.__write(index_path, lambda f: json.dump(index, f))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                fingerprint = name[:-len(".json")]
+                paths = self.__paths(fingerprint)
+                try:
+                    size = sum([os.path.getsize(path) for path in paths])
+                    entries.append((os.path.getmtime(paths[1]), fingerprint, size))
+                except OSError:
+                    continue
+                total += size
+
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _, fingerprint, size = entries.pop(0)
+            for path in self.__paths(fingerprint):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json") or name.endswith(".pbtxt"):
+                os.remove(os.path.join(self.directory, name))
@@ -1,35 +1,144 @@
-import copy
+from collections.abc import MutableMapping
+
+# short names of the receipes in the printed schedules
+RECEIPE_INITIALS = {'"Sous-Vide_Lemon_Curd"': "S", '"Bistecca_Perfetta"': "B"}
+
+# attributes kept in their own slot, by name in the attributes dictionary
+_FIELDS = {"receipe": "receipe", "step": "step_id", "duration": "duration", "temperature": "temperature"}
+_IDENTITY_FIELDS = ("receipe", "step")
+
+
+class StepAttributes(MutableMapping):
+    '''
+    Dictionary view of the attributes of a step, for the code (and the
+    export) reading them by name: known attributes are read from and
+    written to the fields of the step, the others to its extra dictionary.
+    The missing attributes are the ones set to None
+    '''
+
+    __slots__ = ("step",)
+
+    def __init__(self, step):
+        self.step = step
+
+    def __getitem__(self, key):
+        if key in _FIELDS:
+            value = getattr(self.step, _FIELDS[key])
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self.step.extra is None:
+            raise KeyError(key)
+        return self.step.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _IDENTITY_FIELDS:
+            raise KeyError("%s is part of the identity of the step, it can't change" % key)
+        if key in _FIELDS:
+            setattr(self.step, _FIELDS[key], Step._typed(key, value))
+        else:
+            if self.step.extra is None:
+                self.step.extra = {}
+            self.step.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _IDENTITY_FIELDS:
+            raise KeyError("%s is part of the identity of the step, it can't change" % key)
+        self[key]
+        if key in _FIELDS:
+            setattr(self.step, _FIELDS[key], None)
+        else:
+            del self.step.extra[key]
+
+    def __iter__(self):
+        for key, field in _FIELDS.items():
+            if getattr(self.step, field) is not None:
+                yield key
+        if self.step.extra is not None:
+            yield from self.step.extra
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __repr__(self):
+        return repr(dict(self))
+
 
 class Step:
+    '''
+    A step of a receipe. Receipe, step id, duration and temperature are
+    typed fields, any other attribute goes in the extra dictionary (None
+    if there isn't any). The order attribute, if given, tells apart the
+    orders of the same receipe: it is not an attribute of the step, and
+    it isn't exported. A step is identified by its type, its receipe, its
+    step id and its order: two objects with the same identity (loaded
+    again, or copied in another process) are equal and have the same
+    hash, while two orders of the same receipe have different steps. A
+    step without receipe or step id is equal only to itself
+    '''
+
+    __slots__ = ("receipe", "step_id", "duration", "temperature", "order", "extra", "__weakref__")
+
     def __init__(self, attributes):
-        self.attributes = attributes
+        self.extra = None
+        self.order = attributes.get("order")
+        for key, field in _FIELDS.items():
+            setattr(self, field, Step._typed(key, attributes.get(key)))
+        for key, value in attributes.items():
+            if not key in _FIELDS and key != "order":
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    @staticmethod
+    def _typed(key, value):
+        if value is None or key in _IDENTITY_FIELDS:
+            return value
+        return int(value)
+
+    @property
+    def attributes(self):
+        return StepAttributes(self)
+
+    def identity(self):
+        '''
+        Key of the step, None if it has no receipe or step id
+        '''
+        if self.receipe is None or self.step_id is None:
+            return None
+        return (type(self).__name__, self.receipe, self.step_id, self.order)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Step):
+            return NotImplemented
+        identity = self.identity()
+        return identity is not None and identity == other.identity()
+
+    def __hash__(self):
+        identity = self.identity()
+        if identity is None:
+            return object.__hash__(self)
+        return hash(identity)
 
     def __str__(self):
-        r = ""
-        if self.attributes["receipe"] == '"Sous-Vide_Lemon_Curd"':
-            r = "S"
-        elif self.attributes["receipe"] == '"Bistecca_Perfetta"':
-            r = "B"
-        else:
-            return self.attributes["receipe"] + ";" + self.attributes["step"]
-        return r + ";" + self.attributes["step"]
-
-    # def __eq__(self, other):
-    #     if isinstance(other, self.__class__):
-    #         return self.attributes == other.attributes
-    #     else:
-    #         return False
-
-    # def __hash__(self):
-    #     return hash(frozenset(self.attributes.items()))
+        initial = RECEIPE_INITIALS.get(self.receipe)
+        if initial is None:
+            return self.receipe + ";" + self.step_id
+        return initial + ";" + self.step_id
 
 
 class FakeActivity(Step):
+    __slots__ = ()
+
     def __init__(self, attributes):
         super().__init__(attributes)
 
 
 class HumanStep(Step):
+    __slots__ = ()
+
     def __init__(self, attributes):
         super().__init__(attributes)
 
@@ -37,33 +146,28 @@ class HumanStep(Step):
     #     return "HumanStep"
 
 class PreStep(Step):
+    __slots__ = ("next_step",)
+
     def __init__(self, attributes, next_step):
         super().__init__(attributes)
         self.next_step = next_step
 
-    # def __eq__(self, other):
-    #     if isinstance(other, self.__class__):
-    #         return (self.attributes == other.attributes
-    #                 and
-    #                 self.next_step == other.next_step)
-    #     else:
-    #         return False
-
-    # def __hash__(self):
-    #     hashable_dict = copy.copy(self.attributes)
-    #     hashable_dict["next"] = self.next_step
-    #     return hash(frozenset(hashable_dict.items()))
-
 
 class OvenStep(Step):
+    __slots__ = ()
+
     def __init__(self, attributes):
         super().__init__(attributes)
 
 class BlastStep(Step):
+    __slots__ = ()
+
     def __init__(self, attributes):
         super().__init__(attributes)
 
 class OvenCook(OvenStep):
+    __slots__ = ()
+
     def __init__(self, attributes):
         super().__init__(attributes)
 
@@ -71,6 +175,8 @@ class OvenCook(OvenStep):
     #     return "OvenCook"
 
 class OvenFry(OvenStep):
+    __slots__ = ()
+
     def __init__(self, attributes):
         super().__init__(attributes)
 
@@ -79,6 +185,8 @@ class OvenFry(OvenStep):
 
 
 class VacuumStep(Step):
+    __slots__ = ()
+
     def __init__(self, attributes):
         super().__init__(attributes)
 
@@ -87,6 +195,8 @@ class VacuumStep(Step):
 
 
 class PreBlast(PreStep, BlastStep):
+    __slots__ = ()
+
     def __init__(self, attirbutes, blast):
         super().__init__(attirbutes, blast)
 
@@ -94,6 +204,8 @@ class PreBlast(PreStep, BlastStep):
     #     return "Preblast"
 
 class Blast(BlastStep):
+     __slots__ = ()
+
      def __init__(self, attributes):
          super().__init__(attributes)
 
@@ -101,6 +213,8 @@ class Blast(BlastStep):
     #     return "Blast"
 
 class PreHeat(PreStep, OvenStep):
+    __slots__ = ()
+
     def __init__(self, attributes, oven_cook):
         super().__init__(attributes, oven_cook)
 
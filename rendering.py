@@ -0,0 +1,48 @@
+'''
+Rendering of the receipe graphs. Nothing is drawn unless it is requested:
+the images are written to files by a background thread, and matplotlib is
+imported only when the first image is rendered, so parsing, scheduling and
+exporting the workflows never touch it.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import networkx as nx
+
+# a single worker, matplotlib is not meant to draw from many threads at once
+_executor = None
+_pending = []
+
+
+def _draw(graph, labels, path):
+    # no pyplot: a bare figure doesn't need a GUI backend
+    from matplotlib.figure import Figure
+
+    figure = Figure()
+    ax = figure.add_subplot()
+    nx.draw(graph, ax=ax, labels=labels, with_labels=True)
+    figure.savefig(path)
+    return path
+
+
+def render_graph(graph, path):
+    '''
+    Writes the picture of the graph to path without blocking the caller.
+    Returns a future resolved with the path once the file is written
+    '''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1)
+
+    # the caller can go on changing the graph while it is drawn
+    labels = {node: str(node) for node in graph}
+    future = _executor.submit(_draw, nx.DiGraph(graph), labels, path)
+    _pending.append(future)
+    return future
+
+
+def wait_renderings():
+    '''
+    Waits for every requested picture, raising the first error met
+    '''
+    while _pending:
+        _pending.pop(0).result()
@@ -0,0 +1,176 @@
+'''
+Rolling-horizon planning of a full service day. The orders (receipes
+with the time they come in) are scheduled window by window, each window
+being a CP-SAT model of the orders known before its end. The orders
+starting in the first stride of the window are committed as planned,
+the other ones are planned again by the next window, which starts a
+stride later and overlaps this one.
+
+A committed order leaves the models: the next windows only see the
+state it leaves the machines in (busy until a time, with a load, at a
+temperature). So every model holds the orders of a window, whatever the
+length of the day, and with the time limit of the solver so does the
+time of every solve.
+'''
+
+import collections
+import sys
+
+from scheduler_graph import (build_model, extract_schedule, exclusivity_class, busy_class, sequenced_kind,
+                             get_node_from_graph, machine_state_type)
+from solver_config import DEFAULT_CONFIG_PATH, load_solver_config, apply_solver_config
+
+order_type = collections.namedtuple('order_type', 'release receipt')
+window_type = collections.namedtuple('window_type', 'start orders committed status objective wall_time')
+day_plan_type = collections.namedtuple('day_plan_type', 'schedule windows machine_states')
+
+
+def machine_states_at(schedule, receipts, machines, time):
+    '''
+    State of every machine at time (a machine_state_type, None if the
+    machine was never used) left by the committed schedule, a list of
+    assigned steps for each machine. The load is the largest number of
+    activities running together after time; the machine is fully busy if
+    they can't be shared by the activities at its temperature
+    '''
+    states = []
+    for machine, assigned_steps in zip(machines, schedule):
+        if assigned_steps == []:
+            states.append(None)
+            continue
+
+        last = max(assigned_steps, key=lambda assigned_step: assigned_step.start + assigned_step.duration)
+        temperature = None
+        if sequenced_kind(machine) is not None:
+            temperature = get_node_from_graph(receipts[last.receipt], last.index).temperature
+
+        running = [assigned_step for assigned_step in assigned_steps
+                   if assigned_step.start + assigned_step.duration > time]
+        load = max([len([assigned_step for assigned_step in running
+                         if assigned_step.start <= instant < assigned_step.start + assigned_step.duration])
+                    for instant in set([max(time, assigned_step.start) for assigned_step in running])], default=0)
+        state = machine_state_type(busy_until=last.start + last.duration, load=load, temperature=temperature)
+
+        running_classes = set([exclusivity_class(get_node_from_graph(receipts[assigned_step.receipt],
+                                                                     assigned_step.index))
+                               for assigned_step in running])
+        if running_classes - set([busy_class(machine, state)]) != set():
+            state = state._replace(load=machine.capacity)
+        states.append(state)
+    return states
+
+
+def _committed(window_schedule, machines, cutoff):
+    # The orders starting before cutoff, and the ones with an activity
+    # starting before a committed one on a sequenced machine: the
+    # prestep of an activity depends on the activities before it
+    committed = set()
+    for assigned_steps in window_schedule:
+        for assigned_step in assigned_steps:
+            if assigned_step.start < cutoff:
+                committed.add(assigned_step.receipt)
+
+    changed = True
+    while changed:
+        changed = False
+        for machine, assigned_steps in zip(machines, window_schedule):
+            if sequenced_kind(machine) is None:
+                continue
+            latest = max([assigned_step.start for assigned_step in assigned_steps
+                          if assigned_step.receipt in committed], default=None)
+            for assigned_step in assigned_steps:
+                if latest is not None and assigned_step.start <= latest and not assigned_step.receipt in committed:
+                    committed.add(assigned_step.receipt)
+                    changed = True
+    return committed
+
+
+def plan_day(orders, machines, window=120, stride=60, config_path=DEFAULT_CONFIG_PATH, max_orders=None,
+             **solver_parameters):
+    '''
+    Schedules the orders (order_type) on the machines with windows of the
+    given length, every one starting stride after the previous one (in
+    the time unit of the durations). At most max_orders orders, the
+    first ones to come in, are planned by a window. The solver parameters
+    override the ones of config_path, as in SIAF_scheduler: the time
+    limit bounds the solve of every window.
+    Returns a day_plan_type: the committed schedule (a list of assigned
+    steps for each machine, the receipt of a step being the index of its
+    order), a window_type for every window and the final state of the
+    machines
+    '''
+    from ortools.sat.python import cp_model
+
+    if not 0 < stride <= window:
+        raise ValueError("The stride must be positive and not longer than the window")
+
+    config = load_solver_config(config_path, **solver_parameters)
+    receipts = [order.receipt for order in orders]
+    schedule = [[] for _ in machines]
+    windows = []
+
+    pending = sorted(range(len(orders)), key=lambda order_id: orders[order_id].release)
+    start = 0
+    while pending != []:
+        # nothing to plan until the next order comes in
+        start = max(start, orders[pending[0]].release)
+        in_window = [order_id for order_id in pending if orders[order_id].release < start + window]
+        if max_orders is not None:
+            in_window = in_window[:max_orders]
+
+        instance = build_model([receipts[order_id] for order_id in in_window], machines, current_time=start,
+                               releases=[orders[order_id].release for order_id in in_window],
+                               machine_states=machine_states_at(schedule, receipts, machines, start))
+        solver = apply_solver_config(cp_model.CpSolver(), config)
+        status = solver.Solve(instance.model)
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            raise RuntimeError("No schedule found for the window starting at %i: %s" % (
+                start, solver.StatusName(status)))
+        window_schedule = extract_schedule(solver, instance, machines)
+
+        # the orders starting before the next window are committed, all
+        # of them if the window plans every order left
+        if len(in_window) == len(pending):
+            committed = set(range(len(in_window)))
+        else:
+            committed = _committed(window_schedule, machines, start + stride)
+        for m_id, assigned_steps in enumerate(window_schedule):
+            for assigned_step in assigned_steps:
+                if assigned_step.receipt in committed:
+                    schedule[m_id].append(assigned_step._replace(receipt=in_window[assigned_step.receipt]))
+
+        committed_orders = [in_window[rec_id] for rec_id in sorted(committed)]
+        pending = [order_id for order_id in pending if not order_id in committed_orders]
+        windows.append(window_type(start=start, orders=in_window, committed=committed_orders,
+                                   status=solver.StatusName(status), objective=solver.ObjectiveValue(),
+                                   wall_time=solver.WallTime()))
+        start += stride
+
+    end = max([assigned_step.start + assigned_step.duration
+               for assigned_steps in schedule for assigned_step in assigned_steps], default=0)
+    return day_plan_type(schedule=schedule, windows=windows,
+                         machine_states=machine_states_at(schedule, receipts, machines, end))
+
+
+if __name__ == '__main__':
+    # python rolling_horizon.py [orders] [time between two orders]:
+    # plans a day of synthetic orders
+    import tempfile
+    from benchmark.generator import instance_spec_type, generate_instance, write_workflows
+    from scheduler_graph import load_receipts
+
+    n_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    interval = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+    workload = generate_instance(instance_spec_type(n_receipts=n_orders, n_steps=6, n_temperatures=3, n_ovens=2,
+                                                    n_chillers=1, n_vacuums=1, n_humans=1, seed=0))
+    with tempfile.TemporaryDirectory() as directory:
+        receipts, _ = load_receipts(write_workflows(workload.workflows, directory))
+    orders = [order_type(release=order_id * interval, receipt=receipt) for order_id, receipt in enumerate(receipts)]
+
+    plan = plan_day(orders, workload.machines, max_time_in_seconds=10)
+    for planned_window in plan.windows:
+        print("Window at %i: %i orders, %i committed, %s in %.2fs" % (
+            planned_window.start, len(planned_window.orders), len(planned_window.committed),
+            planned_window.status, planned_window.wall_time))
+    print("End of the day: %i" % max([assigned_step.start + assigned_step.duration
+                                       for assigned_steps in plan.schedule for assigned_step in assigned_steps]))
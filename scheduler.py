@@ -1,7 +1,9 @@
-from ortools.sat.python import cp_model
+# ortools and the bounds module are imported by the scheduler when it is
+# called: importing this module does nothing, the receipes and the
+# machines are given at call time
 import collections
 from receipt import *
-from machine import BlastChiller, Oven, VacuumMachine, Human
+from machine import BlastChiller, Oven, VacuumMachine, CompatibilityIndex
 import warnings
 
 # Some useful types used below
@@ -18,39 +20,37 @@ assigned_step_type = collections.namedtuple('assigned_step_type',
 #     [(2, [3])]
 # ]
 
-oven_cook = OvenCook({"duration": 3, "temperature": 120})
-oven_cook_1 = OvenCook({"duration": 3, "temperature": 120})
+def example_receipts():
+    oven_cook = OvenCook({"duration": 3, "temperature": 120})
+    oven_cook_1 = OvenCook({"duration": 3, "temperature": 120})
 
-receipts = [
-    # [OvenCook({"duration": 1, "temperature": 150})],#, OvenCook({"duration": 3, "temperature": 150}), BlastStep({"duration": 3})],
-    [PreHeat({"duration": 6, "temperature": 120}, oven_cook), oven_cook],# OvenCook({"duration": 2, "temperature": 75}), VacuumStep({"duration": 5})],
-    [PreHeat({"duration": 6, "temperature": 120}, oven_cook_1), oven_cook_1] #, VacuumStep({"duration": 2})]
-]
+    return [
+        # [OvenCook({"duration": 1, "temperature": 150})],#, OvenCook({"duration": 3, "temperature": 150}), BlastStep({"duration": 3})],
+        [PreHeat({"duration": 6, "temperature": 120}, oven_cook), oven_cook],# OvenCook({"duration": 2, "temperature": 75}), VacuumStep({"duration": 5})],
+        [PreHeat({"duration": 6, "temperature": 120}, oven_cook_1), oven_cook_1] #, VacuumStep({"duration": 2})]
+    ]
 
-N_STEPS = 0
-for receipt in receipts:
-    for step in receipt:
-        N_STEPS = N_STEPS+1
+# Macchine: composte da capacità e capabilities
+# machines_old = [(1,[2]), (1,[1,2]), (2,[3])]
 
-EOH = sum([step.attributes["duration"] for receipt in receipts for step in receipt]) + sum([1]*N_STEPS)
-print("End of Horizon (Upper Bound): %i" % EOH)
+def example_machines():
+    return [Oven(1, 300, True), BlastChiller(2), VacuumMachine(1)]
 
-lb = 0
-for receipt in receipts:
-    dur_receipt = 0
-    for step in receipt:
-        dur_receipt += step.attributes["duration"]+1
-    if dur_receipt > lb:
-        lb = dur_receipt
+def SIAF_scheduler(receipts, machines):
+    from ortools.sat.python import cp_model
+    from bounds import compute_bounds
 
-print("Lower Bound: %i" % (lb-1))
+    compatibility_index = CompatibilityIndex(machines)
+    find_compatible_machines = compatibility_index.compatible_machines
 
-# Macchine: composte da capacità e capabilities
-# machines_old = [(1,[2]), (1,[1,2]), (2,[3])]
+    # The horizon is the makespan of a list schedule of all the receipes,
+    # the lower bound is given by the critical paths and the machine loads
+    bounds = compute_bounds(receipts, compatibility_index)
+    EOH = bounds.eoh
+    lb = bounds.lb
+    print("End of Horizon (Upper Bound): %i" % EOH)
+    print("Lower Bound: %i" % lb)
 
-machines = [Oven(1, 300, True), BlastChiller(2), VacuumMachine(1)]
-
-def SIAF_scheduler():
     # create the model
     model = cp_model.CpModel()
 
@@ -287,19 +287,17 @@ def SIAF_scheduler():
 
 
     # Cumulative constraints for the machines' capacities
+    interval_lists = [[] for _ in machines]
+    for rec_id, receipt in enumerate(receipts):
+        for step_id, step in enumerate(receipt):
+            for m_id in find_compatible_machines(step):
+                if not isinstance(machines[m_id], Oven):
+                    interval_lists[m_id].append(all_steps[(rec_id, step_id, m_id)].interval)
+                else:
+                    for is_frying in range(2):
+                        interval_lists[m_id].append(all_steps[(rec_id, step_id, m_id, is_frying)].interval)
     for m_id, machine in enumerate(machines):
-        interval_list = []
-        for rec_id, receipt in enumerate(receipts):
-            for step_id, step in enumerate(receipt):
-                # if set(step[1]).issubset(machine[1]):
-                if m_id in find_compatible_machines(step):
-                    if not isinstance(machines[m_id], Oven):
-                        interval_list.append(all_steps[(rec_id, step_id, m_id)].interval)
-                    else:
-                        for is_frying in range(2):
-                            interval_list.append(all_steps[(rec_id, step_id, m_id, is_frying)].interval)
-        # for rec_id, receipt in enumerate(receipts):
-            # interval_list = [all_steps[(rec_id, step_id)].interval for step_id in range(len(receipt))]
+        interval_list = interval_lists[m_id]
         model.AddCumulative(interval_list, [1]*len(interval_list), machine.capacity)
             
 
@@ -444,7 +442,7 @@ def SIAF_scheduler():
 
     # Objective function
     # Our goal is to minimize the makespan, that is the total time of execution
-    obj_var = model.NewIntVar(0, EOH, 'makespan')
+    obj_var = model.NewIntVar(lb, EOH, 'makespan')
 
     end_steps = []
     for rec_id in range(len(receipts)):
@@ -631,24 +629,5 @@ def create_flatten_domain(compatible_machines):
     return flatten_domain
 
 
-def find_compatible_machines(step):
-    if isinstance(step, OvenCook) or isinstance(step, PreHeat):
-        return [m_id 
-                for m_id, machine in enumerate(machines)
-                if isinstance(machine, Oven) and
-                   machine.max_temperature >= step.attributes['temperature']]
-    elif isinstance(step, VacuumStep):
-        return [m_id for m_id, machine in enumerate(machines) if isinstance(machine, VacuumMachine)]
-    elif isinstance(step, BlastStep):
-        return [m_id for m_id, machine in enumerate(machines) if isinstance(machine, BlastChiller)]
-    elif isinstance(step, OvenFry):
-        return [m_id for m_id, machine in enumerate(machines) if isinstance(machine, Oven) and
-                                                                 machine.can_fry]
-    elif isinstance(step, HumanStep):
-        return [m_id for m_id, machine in enumerate(machines) if isinstance(machine, Human)]
-
-    return []
-
-
 if __name__ == '__main__':
-    SIAF_scheduler()
+    SIAF_scheduler(example_receipts(), example_machines())
@@ -1,17 +1,29 @@
-from ortools.sat.python import cp_model
-import networkx as nx
-from matplotlib import pyplot as plt
+# ortools, networkx and the modules using them are imported by the
+# functions needing them: importing the scheduler is immediate and
+# does nothing, the receipes and the machines are given at call time
 import collections
-import json
 from receipt import *
-from machine import BlastChiller, Oven, VacuumMachine, Human
-from utils import WFCoreUtils
-import warnings
+from machine import BlastChiller, Oven, VacuumMachine, Human, CompatibilityIndex
+from solver_config import DEFAULT_CONFIG_PATH, load_solver_config, apply_solver_config, solve_result_type
+from instrumentation import phase, start_model, count_family
+import sys
 
 # Some useful types used below
 step_type = collections.namedtuple('step_type', 'start duration end interval')
+task_type = collections.namedtuple('task_type', 'start duration end')
 assigned_step_type = collections.namedtuple('assigned_step_type',
                                             'start duration receipt index')
+frozen_step_type = collections.namedtuple('frozen_step_type', 'start end machine')
+# load units of a machine are busy until busy_until with activities
+# outside the receipes, that left it at temperature (None at rest)
+machine_state_type = collections.namedtuple('machine_state_type', 'busy_until load temperature')
+cp_instance_type = collections.namedtuple('cp_instance_type',
+                                          'model all_tasks all_steps all_machines obj_var bounds')
+
+# Machines performing their activities in sequence, with the kind of
+# steps they perform: a prestep brings the machine from the temperature
+# left by the previous activity
+SEQUENCED_MACHINES = {Oven: OvenStep, BlastChiller: BlastStep}
 
 
 # Ricetta: composta da step che consistono di 
@@ -50,8 +62,6 @@ vacuum_1 = VacuumStep({"duration": 2})
 vacuum_2 = VacuumStep({"duration": 3})
 vacuum_3 = VacuumStep({"duration": 4})
 
-r1 = nx.DiGraph()
-
 # Ricetta Sous-Vide Lemon Curd
 
 # r1.add_edges_from([(preblast_1, blast_step_1), 
@@ -74,12 +84,10 @@ r1 = nx.DiGraph()
 # Ricetta Bistecca
 #
 
-wfcore_utils_cream = WFCoreUtils("C:\\Users\\Riccardo Minato\\Desktop\\Universita\\SIAF\\BPMN\\Sous-Vide Lemon Curd_globals.json")
-
-r1 = wfcore_utils_cream.create_graph()
-
-wfcore_utils_meat = WFCoreUtils("C:\\Users\\Riccardo Minato\\Desktop\\Universita\\SIAF\\BPMN\\Bistecca Perfetta.json")
-r2 = wfcore_utils_meat.create_graph()
+EXAMPLE_WORKFLOWS = [
+    "C:\\Users\\Riccardo Minato\\Desktop\\Universita\\SIAF\\BPMN\\Sous-Vide Lemon Curd_globals.json",
+    "C:\\Users\\Riccardo Minato\\Desktop\\Universita\\SIAF\\BPMN\\Bistecca Perfetta.json"
+]
 
 # r1.add_edges_from([(preblast_1, blast_step_1),
 #                    (blast_step_1, preblast_2),
@@ -94,7 +102,8 @@ r2 = wfcore_utils_meat.create_graph()
 # r1.add_edges_from([(pre_heat_1, oven_cook_1),
 #                    (oven_cook_1, blast_step_2)])
 
-machines = [Oven(5, 300, True), BlastChiller(4), VacuumMachine(1), Human(1)]
+def example_machines():
+    return [Oven(5, 300, True), BlastChiller(4), VacuumMachine(1), Human(1)]
 
 # r2 = nx.DiGraph()
 # r1.add_edges_from([(blast_step, pre_heat_2), (pre_heat_2, oven_cook_1), (oven_cook_1, vacuum)])
@@ -103,272 +112,286 @@ machines = [Oven(5, 300, True), BlastChiller(4), VacuumMachine(1), Human(1)]
 
 # r1 = nx.DiGraph()
 # r1.add_edge(pre_heat_1, oven_cook_1)
-receipts = [
-    r1 , r2
-]
 
-N_STEPS = 0
-for receipt in receipts:
-    N_STEPS += receipt.number_of_nodes()
 
-EOH = sum([step.attributes["duration"] for receipt in receipts for step in receipt]) + sum([1]*N_STEPS)
-print("End of Horizon (Upper Bound): %i" % EOH)
+def load_receipts(wfcore_paths, report=None):
+    '''
+    Graphs of the given WFCore workflows, and the WFCoreUtils of the
+    first one, that exports the schedule as a new workflow. The order of
+    every receipe is its position in wfcore_paths, so a path given twice
+    is two orders
+    '''
+    from utils import WFCoreUtils
+
+    with phase(report, "parse"):
+        wfcore_utils = [WFCoreUtils(wfcore_path, order) for order, wfcore_path in enumerate(wfcore_paths)]
+        return [utils.create_graph() for utils in wfcore_utils], wfcore_utils[0]
+
+
+def SIAF_scheduler(receipts, machines, config_path=DEFAULT_CONFIG_PATH, num_search_workers=None,
+                   max_time_in_seconds=None, relative_gap_limit=None, absolute_gap_limit=None, random_seed=None,
+                   initial_schedule=None, current_time=0, frozen_steps=None, exporter=None, render_path=None,
+                   report=None, cache=None):
+    '''
+    Solves the scheduling of the receipes (graphs) on the machines. The solver parameters are read from
+    config_path and overridden by the arguments that are not None.
+    initial_schedule (the schedule of a previous result, from any engine)
+    is given to the solver as a hint: by default, the list schedule
+    defining the horizon.
+    frozen_steps ((rec_id, step_id) -> frozen_step_type) are the steps already
+    started: they keep start, end and machine, and the other steps can't
+    start before current_time.
+    The new workflow is exported by exporter (a WFCoreUtils), if given,
+    and its picture is written to render_path.
+    If a report (instrumentation.PipelineReport) is given, the phases
+    and the size of the model are measured in it.
+    With a cache (model_cache.ModelCache) the model of an instance already
+    scheduled is loaded instead of being built.
+    Returns a solve_result_type: the schedule is the list of steps assigned
+    to every machine, or None if no solution has been found
+    '''
+    from ortools.sat.python import cp_model
+
+    config = load_solver_config(config_path,
+                                num_search_workers=num_search_workers,
+                                max_time_in_seconds=max_time_in_seconds,
+                                relative_gap_limit=relative_gap_limit,
+                                absolute_gap_limit=absolute_gap_limit,
+                                random_seed=random_seed)
+
+    with phase(report, "build"):
+        instance = build_model(receipts, machines, initial_schedule, current_time, frozen_steps, report, cache)
+
+    # Solve model
+    solver = apply_solver_config(cp_model.CpSolver(), config)
+    with phase(report, "solve"):
+        status = solver.Solve(instance.model)
+
+    if not status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return solve_result_type(status=status,
+                                 status_name=solver.StatusName(status),
+                                 objective=None,
+                                 best_bound=None,
+                                 wall_time=solver.WallTime(),
+                                 schedule=None)
+
+    # Display results
+
+    # for key, value in preheat_starts_after.items():
+    #     print(key)
+    #     print(solver.Value(value))
+    #     print()
+
+    # for key, value in min_dist_preheat_vars.items():
+    #     print(key)
+    #     print(solver.Value(value))
+    #     print()
+
+    with phase(report, "extract"):
+        assigned_receipts = extract_schedule(solver, instance, machines)
+
+    with phase(report, "export"):
+        display_schedule(receipts, machines, assigned_receipts, exporter, render_path)
+
+    return solve_result_type(status=status,
+                             status_name=solver.StatusName(status),
+                             objective=solver.ObjectiveValue(),
+                             best_bound=solver.BestObjectiveBound(),
+                             wall_time=solver.WallTime(),
+                             schedule=assigned_receipts)
+
+
+def build_model(receipts, machines, initial_schedule=None, current_time=0, frozen_steps=None, report=None,
+                cache=None, releases=None, machine_states=None):
+    '''
+    Builds the CP-SAT model of the scheduling, without solving it: the
+    arguments are the ones of SIAF_scheduler. The variables and the
+    constraints of every family are counted in report, if given.
+    With a cache (model_cache.ModelCache), the model of an instance
+    already seen is loaded instead of being built again.
+    releases gives the time every receipe can start from, machine_states
+    a machine_state_type (or None) for every machine: from current_time
+    to busy_until only activities of the class left at temperature can
+    share the machine, within the free capacity, and the first prestep
+    starts from that temperature.
+    Returns a cp_instance_type
+    '''
+    if frozen_steps is None:
+        frozen_steps = {}
+
+    instance = None
+    if cache is not None:
+        from model_cache import instance_fingerprint
+
+        with phase(report, "cache"):
+            fingerprint = instance_fingerprint(receipts, machines, current_time, frozen_steps, releases,
+                                               machine_states)
+            cached = cache.load(fingerprint)
+            if cached is not None:
+                instance = instance_from_cache(receipts, cached)
+    if instance is None:
+        instance = create_model(receipts, machines, current_time, frozen_steps, report, releases, machine_states)
+        if cache is not None:
+            cache.store(fingerprint, instance.model, model_index(receipts, instance))
+
+    # Warm start from a previous schedule (the cached model has no hints),
+    # or from the list schedule whose makespan is the horizon
+    if initial_schedule is None and instance.bounds.heuristic is not None:
+        from list_scheduler import schedule_by_machine
+        initial_schedule = schedule_by_machine(receipts, instance.bounds.heuristic, len(machines))
+    if initial_schedule is not None:
+        add_schedule_hints(instance.model, initial_schedule, instance.all_tasks, instance.all_machines,
+                           instance.obj_var)
+
+    return instance
+
+
+def create_model(receipts, machines, current_time, frozen_steps, report=None, releases=None, machine_states=None):
+    '''
+    The model of build_model, created from scratch
+    '''
+    from ortools.sat.python import cp_model
+    from bounds import compute_bounds, min_duration
+
+    if machine_states is None:
+        machine_states = [None for _ in machines]
+    busy_until = max([state.busy_until for state in machine_states if state is not None], default=0)
 
-lb = 0
-for receipt in receipts:
-    dur_receipt = 0
-    for step in receipt:
-        dur_receipt += step.attributes["duration"]+1
-    if dur_receipt > lb:
-        lb = dur_receipt
+    compatibility_index = CompatibilityIndex(machines)
+    find_compatible_machines = compatibility_index.compatible_machines
 
-# print("Lower Bound: %i" % (lb-1))
+    frozen = [{} for _ in receipts]
+    for (rec_id, step_id), frozen_step in frozen_steps.items():
+        frozen[rec_id][get_node_from_graph(receipts[rec_id], step_id)] = (frozen_step.start, frozen_step.end)
 
+    # The horizon is the makespan of a list schedule of all the receipes,
+    # the lower bound is given by the critical paths and the machine loads
+    with phase(report, "bounds"):
+        bounds = compute_bounds(receipts, compatibility_index, exclusivity_class, frozen, current_time,
+                                releases, busy_until)
+    EOH = bounds.eoh
+    lb = bounds.lb
 
-def SIAF_scheduler():
     # create the model
     model = cp_model.CpModel()
+    start_model(report, model)
 
-    # It will contain every task in their interval representation
+    # It will contain the start and end of every step, shared by
+    # all the machines that can perform it
+    all_tasks = {}
+
+    # It will contain every task in their interval representation,
+    # one optional interval for each compatible machine
     all_steps = {}
-    all_steps_start_literals = {}
-    all_steps_dur_literals = {}
 
-    # It will contain every machine variable
+    # It will contain every machine variable: it is the presence literal
+    # of the corresponding optional interval
     all_machines = {}
 
-    # interval variables for fry steps
-    all_fries = {}
+    # States of the sequenced machines: at rest (None) or at a temperature
+    # left by one of their activities (or by the ones before current_time)
+    sequence_states = {}
+    for machine_type, step_kind in SEQUENCED_MACHINES.items():
+        temperatures = set([step.temperature for receipt in receipts for step in receipt
+                            if isinstance(step, step_kind) and not isinstance(step, PreStep)])
+        temperatures |= set([state.temperature for machine, state in zip(machines, machine_states)
+                             if isinstance(machine, machine_type) and state is not None])
+        sequence_states[step_kind] = [None] + sorted(temperatures - set([None]))
 
-    # interval variables for cooking steps
-    all_cooks = {}
+    # It will contain, for every prestep, the index of the state its
+    # machine is in when the prestep starts
+    previous_states = {}
 
     # Create variables
     for rec_id, receipt in enumerate(receipts):
         for step_id, step in enumerate(receipt):
+            duration = step.duration
+
+            frozen_step = frozen_steps.get((rec_id, step_id))
+            if frozen_step is not None:
+                # started steps are constants, not decision variables
+                duration = frozen_step.end - frozen_step.start
+                start_var = model.NewConstant(frozen_step.start)
+                end_var = start_var + duration
+                if isinstance(step, PreStep) and \
+                        not (rec_id, get_index_from_graph(receipt, step.next_step)) in frozen_steps:
+                    # the next step is still to be placed in the machine
+                    # sequence: the state it finds must be reached in the
+                    # time the started prestep was given
+                    states = sequence_states[sequenced_kind(step)]
+                    durations = [prestep_duration(step, temperature) for temperature in states]
+                    needed = model.NewIntVarFromDomain(cp_model.Domain.FromValues(sorted(set(durations))),
+                                                       'duration_%i_%i' % (rec_id, step_id))
+                    previous_state = model.NewIntVar(0, len(states) - 1, 'previous_state_%i_%i' % (rec_id, step_id))
+                    model.AddElement(previous_state, durations, needed)
+                    model.Add(needed <= duration)
+                    previous_states[rec_id, step_id] = previous_state
+            else:
+                # each step starts after the chain of its predecessors and
+                # ends leaving enough time to complete the chain of its
+                # successors: every variable lies within the horizon
+                head = bounds.heads[rec_id][step]
+                latest_end = EOH - (bounds.tails[rec_id][step] - min_duration(step))
+                if isinstance(step, PreStep):
+                    # the prestep only brings the machine from the state left
+                    # by its previous activity, given by the machine sequence:
+                    # its duration is an element of the table of the states
+                    states = sequence_states[sequenced_kind(step)]
+                    durations = [prestep_duration(step, temperature) for temperature in states]
+                    shortest = min(durations)
+                    duration = model.NewIntVarFromDomain(cp_model.Domain.FromValues(sorted(set(durations))),
+                                                         'duration_%i_%i' % (rec_id, step_id))
+                    previous_state = model.NewIntVar(0, len(states) - 1, 'previous_state_%i_%i' % (rec_id, step_id))
+                    model.AddElement(previous_state, durations, duration)
+                    previous_states[rec_id, step_id] = previous_state
+                    start_var = model.NewIntVar(head, latest_end - shortest, 'start_%i_%i' % (rec_id, step_id))
+                    end_var = model.NewIntVar(head + shortest, latest_end, 'end_%i_%i' % (rec_id, step_id))
+                else:
+                    start_var = model.NewIntVar(head, latest_end - duration, 'start_%i_%i' % (rec_id, step_id))
+                    end_var = start_var + duration
+            all_tasks[rec_id, step_id] = task_type(start=start_var, duration=duration, end=end_var)
 
             compatible_machines = find_compatible_machines(step)
             for compatible_machine in compatible_machines:
 
-                if isinstance(machines[compatible_machine], Oven):
-
-                    for is_frying in range(2):
-
-                        duration_var = 0
-                        if isinstance(step, PreHeat):
-                            warnings.warn("RIMETTERE QUESTO PER MODIFICARE LA DURATA DEI PREHEAT!!")
-                            # duration_var = model.NewIntVar(0, step.attributes["duration"], 
-                            #                           'duration_%i_%i__m_%i_f_%i' % (rec_id, step_id, compatible_machine, is_frying))
-                            duration_var = model.NewIntVarFromDomain(cp_model.Domain.FromValues([0 ,step.attributes["duration"]]), 
-                                                                     'duration_%i_%i__m_%i_f_%i' % (rec_id, step_id, compatible_machine, is_frying))
-
-                        elif step.attributes["duration"] == 1:
-                            duration_var = model.NewIntVarFromDomain(cp_model.Domain.FromValues([0, 1]), 
-                                                      'duration_%i_%i__m_%i_f_%i' % (rec_id, step_id, compatible_machine, is_frying))
-                        else:
-                            duration_var = model.NewIntVarFromDomain(cp_model.Domain.FromValues([0 ,step.attributes["duration"]]), 
-                                                                     'duration_%i_%i__m_%i_f_%i' % (rec_id, step_id, compatible_machine, is_frying))
-
-                        # Creation of boolean variables as support: if dur_literal is True, then duration > 0
-                        dur_literal = model.NewBoolVar('b_dur_%i_%i__m_%i_f_%i' % (rec_id, step_id, compatible_machine, is_frying))
-                        all_steps_dur_literals[rec_id, step_id, compatible_machine, is_frying] = dur_literal
-                        model.Add(duration_var > 0).OnlyEnforceIf(dur_literal)
-                        model.Add(duration_var <= 0).OnlyEnforceIf(dur_literal.Not())
-
-                        # each step can start in every moment
-                        start_var = model.NewIntVar(-1, EOH, 'start_%i_%i__m_%i_f_%i' % (rec_id, step_id, compatible_machine, is_frying))
-
-                        # Creation of boolean variables as support: if start_literal is True, then start time > -1
-                        start_literal = model.NewBoolVar('b_start_%i_%i__m_%i_f_%i' % (rec_id, step_id, compatible_machine, is_frying))
-                        all_steps_start_literals[rec_id, step_id, compatible_machine, is_frying] = start_literal
-                        model.Add(start_var > -1).OnlyEnforceIf(start_literal)
-                        
-                        # each step can end in every moment
-                        end_var = model.NewIntVar(-1, EOH, 'end_%i_%i__m_%i_f_%i' % (rec_id, step_id, compatible_machine, is_frying))
-
-                        # interval variable
-                        interval_var = model.NewIntervalVar(
-                            start_var, duration_var, end_var, 'interval_%i_%i__m_%i_f_%i' % (rec_id, step_id, compatible_machine, is_frying)
-                        )
-
-                        if isinstance(step, OvenCook):
-                            if not compatible_machine in all_cooks:
-                                all_cooks[compatible_machine] = []
-                            all_cooks[compatible_machine].append(interval_var)
-                        elif isinstance(step, OvenFry):
-                            if not compatible_machine in all_fries:
-                                all_fries[compatible_machine] = []
-                            all_fries[compatible_machine].append(interval_var)
-
-                        # update the task dictionary
-                        all_steps[rec_id, step_id, compatible_machine, is_frying] = step_type(
-                            start=start_var, duration=duration_var, end=end_var, interval=interval_var)
-
-                        # What machines can be used for the current step?
-                        # compatible_machines = []
-                        # for m_id, machine in enumerate(machines):
-                        #     if set(step[1]).issubset(machine[1]):
-                        #         compatible_machines.append(m_id)
-
-                        # machine variables
-                        machine_var = model.NewBoolVar( 
-                            'machine_%i_%i__m_%i_f_%i' % (rec_id, step_id, compatible_machine, is_frying)
-                        )
-                        all_machines[rec_id, step_id, compatible_machine, is_frying] = machine_var
+                # machine variables
+                if frozen_step is not None:
+                    machine_var = model.NewConstant(int(compatible_machine == frozen_step.machine))
                 else:
-                    
-                    duration_var = 0
-
-                    if isinstance(step, PreBlast):
-                        warnings.warn("RIMETTERE QUESTO PER RENDERE VARIABILE LA DURATA DEI PREBLAST!!")
-                        # duration_var = model.NewIntVar(0, step.attributes["duration"], 
-                        #                               'duration_%i_%i__m_%i' % (rec_id, step_id, compatible_machine))
-                        duration_var = model.NewIntVarFromDomain(cp_model.Domain.FromValues([0, step.attributes["duration"]]),
-                                                                 'duration_%i_%i__m_%i' % (rec_id, step_id, compatible_machine))
-                    elif step.attributes["duration"] == 1:
-                        duration_var = model.NewIntVarFromDomain(cp_model.Domain.FromValues([0, 1]), 
-                                                                 'duration_%i_%i__m_%i' % (rec_id, step_id, compatible_machine))
-                    else:
-                        duration_var = model.NewIntVarFromDomain(cp_model.Domain.FromValues([0, step.attributes["duration"]]),
-                                                                 'duration_%i_%i__m_%i' % (rec_id, step_id, compatible_machine))
-
-                    # Creation of boolean variables as support: if dur_literal is True, then duration > 0
-                    dur_literal = model.NewBoolVar('b_dur_%i_%i__m_%i' % (rec_id, step_id, compatible_machine))
-                    all_steps_dur_literals[rec_id, step_id, compatible_machine] = dur_literal
-                    model.Add(duration_var > 0).OnlyEnforceIf(dur_literal)
-
-                    # each step can start in every moment
-                    start_var = model.NewIntVar(-1, EOH, 'start_%i_%i__m_%i' % (rec_id, step_id, compatible_machine))
-
-                    # Creation of boolean variables as support: if start_literal is True, then start time > -1
-                    start_literal = model.NewBoolVar('b_start_%i_%i__m_%i' % (rec_id, step_id, compatible_machine))
-                    all_steps_start_literals[rec_id, step_id, compatible_machine] = start_literal
-                    model.Add(start_var > -1).OnlyEnforceIf(start_literal)
-                    
-                    # each step can end in every moment
-                    end_var = model.NewIntVar(-1, EOH, 'end_%i_%i__m_%i' % (rec_id, step_id, compatible_machine))
-
-                    # interval variable
-                    interval_var = model.NewIntervalVar(
-                        start_var, duration_var, end_var, 'interval_%i_%i__m_%i' % (rec_id, step_id, compatible_machine)
-                    )
-
-                    # update the task dictionary
-                    all_steps[rec_id, step_id, compatible_machine] = step_type(
-                        start=start_var, duration=duration_var, end=end_var, interval=interval_var)
-
-                    # What machines can be used for the current step?
-                    # compatible_machines = []
-                    # for m_id, machine in enumerate(machines):
-                    #     if set(step[1]).issubset(machine[1]):
-                    #         compatible_machines.append(m_id)
-
-                    # machine variables
-                    machine_var = model.NewBoolVar( 
+                    machine_var = model.NewBoolVar(
                         'machine_%i_%i__m_%i' % (rec_id, step_id, compatible_machine)
                     )
-                    all_machines[rec_id, step_id, compatible_machine] = machine_var 
-
-    # Constraints definition
+                all_machines[rec_id, step_id, compatible_machine] = machine_var
 
-    # Precedence constraints
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-            if receipt.out_degree(step) != 0:
-                for compatible_machine in find_compatible_machines(step):
-                    for successor in receipt.successors(step):
-                        successor_index = get_index_from_graph(receipt, successor)
-                        for succ_comp_machine in find_compatible_machines(successor):
-                            if (not isinstance(machines[compatible_machine], Oven)
-                                and
-                                not isinstance(machines[succ_comp_machine], Oven)):
-                                model.Add(
-                                    all_steps[(rec_id, successor_index, succ_comp_machine)].start
-                                    >
-                                    all_steps[(rec_id, step_id, compatible_machine)].end
-                                )
-                            elif (isinstance(machines[compatible_machine], Oven)
-                                and
-                                not isinstance(machines[succ_comp_machine], Oven)):
-                                for is_frying in range(2):
-                                    model.Add(
-                                        all_steps[(rec_id, successor_index, succ_comp_machine)].start
-                                        >
-                                        all_steps[(rec_id, step_id, compatible_machine, is_frying)].end
-                                    )
-                            elif (not isinstance(machines[compatible_machine], Oven)
-                                and
-                                isinstance(machines[succ_comp_machine], Oven)):
-                                for is_frying in range(2):
-                                    model.Add(
-                                        all_steps[(rec_id, successor_index, succ_comp_machine, is_frying)].start
-                                        >
-                                        all_steps[(rec_id, step_id, compatible_machine)].end)
-                            else:
-                                for is_frying in range(2):
-                                    for is_frying_succ in range(2):
-                                        model.Add(
-                                            all_steps[(rec_id, successor_index, succ_comp_machine, is_frying_succ)].start
-                                            >
-                                            all_steps[(rec_id, step_id, compatible_machine, is_frying)].end)
-
-
-
-    # Constraints saying "if a step has a valid start time for a machine,
-    # every other start time for the same step on another machine must be -1"
-    # Only for the duration variables
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-                same_step_dur_var = []
-                same_step_dur_lit = []
-                for compatible_machine in find_compatible_machines(step):
-                    if not isinstance(machines[compatible_machine], Oven):
-                        same_step_dur_var.append(all_steps[rec_id, step_id, compatible_machine].duration)
-                        same_step_dur_lit.append(all_steps_dur_literals[rec_id, step_id, compatible_machine])      
-                    else:
-                        for is_frying in range(2):
-                            same_step_dur_var.append(all_steps[rec_id, step_id, compatible_machine, is_frying].duration)
-                            same_step_dur_lit.append(all_steps_dur_literals[rec_id, step_id, compatible_machine, is_frying])
-                
-                warnings.warn("DECOMMENTARE QUI E COMMENTARE SOTTO PER SVILUPPI FUTURI! Stiamo trattando i preriscaldamenti come altre attività")
-                '''
-                if not isinstance(step, PreStep):
-                    # model.AddSumConstraint(same_step_dur_var,
-                    #                         step.attributes["duration"], 
-                    #                         step.attributes["duration"])
-                    model.Add(sum(same_step_dur_var) == step.attributes["duration"])
+                # interval variable, performed only if the step is assigned to the machine
+                if isinstance(duration, int):
+                    interval_var = model.NewOptionalFixedSizeIntervalVar(
+                        start_var, duration, machine_var, 'interval_%i_%i__m_%i' % (rec_id, step_id, compatible_machine)
+                    )
                 else:
-                    # model.AddSumConstraint(same_step_dur_var,
-                    #                         0, 
-                    #                         step.attributes["duration"])
-                    model.AddLinearExpressionInDomain(sum(same_step_dur_var), 
-                                                      cp_model.Domain.FromIntervals([(0, step.attributes["duration"])]))
-                    # exactly one 1
-                    # model.AddBoolOr([lit.Not() for lit in same_step_dur_lit])
-                    model.Add(sum(same_step_dur_lit) == 1)
-                '''
-                model.Add(sum(same_step_dur_var) == step.attributes["duration"])
+                    interval_var = model.NewOptionalIntervalVar(
+                        start_var, duration, end_var, machine_var,
+                        'interval_%i_%i__m_%i' % (rec_id, step_id, compatible_machine)
+                    )
 
+                # update the task dictionary
+                all_steps[rec_id, step_id, compatible_machine] = step_type(
+                    start=start_var, duration=duration, end=end_var, interval=interval_var)
+    count_family(report, model, "steps")
 
+    # Constraints definition
 
-    # Constraints saying "if a step is assigned to a machine, its start time
-    # and duration must be different from -1 and 0 respectively"
+    # Precedence constraints
     for rec_id, receipt in enumerate(receipts):
         for step_id, step in enumerate(receipt):
-                for compatible_machine in find_compatible_machines(step):
-                    if not isinstance(machines[compatible_machine], Oven):
-                        model.AddImplication(all_machines[(rec_id, step_id, compatible_machine)],
-                                            all_steps_start_literals[(rec_id, step_id, compatible_machine)])
-                        model.AddImplication(all_machines[(rec_id, step_id, compatible_machine)],
-                                                all_steps_dur_literals[(rec_id, step_id, compatible_machine)])
-                    else:
-                        for is_frying in range(2):
-                            model.AddImplication(all_machines[rec_id, step_id, compatible_machine, is_frying],
-                                                all_steps_start_literals[rec_id, step_id, compatible_machine, is_frying])
-                            # if not isinstance(step, PreStep):
-                            model.AddImplication(all_machines[rec_id, step_id, compatible_machine, is_frying],
-                                                    all_steps_dur_literals[rec_id, step_id, compatible_machine, is_frying])
-            
+            for successor in receipt.successors(step):
+                successor_index = get_index_from_graph(receipt, successor)
+                model.Add(
+                    all_tasks[(rec_id, successor_index)].start
+                    >
+                    all_tasks[(rec_id, step_id)].end
+                )
+    count_family(report, model, "precedence")
 
     # # # # Constraints saying "if one step is assigned to a machine, it can't be assigned
     # # # # to another machine"
@@ -386,574 +409,75 @@ def SIAF_scheduler():
         for step_id, step in enumerate(receipt):
             same_step_var = []
             for compatible_machine in find_compatible_machines(step):
-                if not isinstance(machines[compatible_machine], Oven):
-                    same_step_var.append(all_machines[rec_id, step_id, compatible_machine])
-                else:
-                    for is_frying in range(2):
-                        same_step_var.append(all_machines[rec_id, step_id, compatible_machine, is_frying])
+                same_step_var.append(all_machines[rec_id, step_id, compatible_machine])
             # model.AddSumConstraint(same_step_var, 1, 1)
             model.Add(sum(same_step_var) == 1)
+    count_family(report, model, "assignment")
 
 
     # Cumulative constraints for the machines' capacities
-    for m_id, machine in enumerate(machines):
-        interval_list = []
-        for rec_id, receipt in enumerate(receipts):
-            for step_id, step in enumerate(receipt):
-                # if set(step[1]).issubset(machine[1]):
-                if m_id in find_compatible_machines(step):
-                    if not isinstance(machines[m_id], Oven):
-                        interval_list.append(all_steps[(rec_id, step_id, m_id)].interval)
-                    else:
-                        for is_frying in range(2):
-                            interval_list.append(all_steps[(rec_id, step_id, m_id, is_frying)].interval)
-        # for rec_id, receipt in enumerate(receipts):
-            # interval_list = [all_steps[(rec_id, step_id)].interval for step_id in range(len(receipt))]
-        model.AddCumulative(interval_list, [1]*len(interval_list), machine.capacity)
-            
-
-    # # If a step is not an OvenFry, the is_frying index of the matrix variables
-    # # should be 0
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-            if isinstance(step, OvenStep) and (not isinstance(step, OvenFry)):
-                for m_id in find_compatible_machines(step):
-                    model.Add(all_machines[rec_id, step_id, m_id, 1] == 0)
-
-    # Cooking and frying activities should not be performed
-    # in the same oven
-    for fry_comp_machine in all_fries.keys():
-        for cook_comp_machine in all_cooks.keys():
-            if fry_comp_machine == cook_comp_machine:
-                for interval_fry_var in all_fries[fry_comp_machine]:
-                    for interval_cook_var in all_cooks[cook_comp_machine]:
-                        model.AddNoOverlap([interval_fry_var, interval_cook_var])
-
-
-    # An Oven cannot be used while it's preheating
-    # # A preheating activity must be performed only if there isn't
-    # # another preheating or cooking activity with the same temperature
-    # # at the same time. Otherwise, preheating is not performed and
-    # # the corresponding cooking activity is performed in the same oven
-    # # where the other step is being cooked
-    # overlap_start_preheats = {}
-    # preHeats_start_after_dict = {}
-    # preHeats_start_before_dict = {}
-    # before_and_after_dict = {}
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-            warnings.warn("Aggiungere la temperatura per il blast")
-            if isinstance(step, PreHeat):
-                for rec_id_1, receipt_1 in enumerate(receipts):
-                    for step_id_1, step_1 in enumerate(receipt_1):
-                        if step != step_1:
-                            preHeat_cms = find_compatible_machines(step)
-                            for compatible_machine in find_compatible_machines(step_1):
-                                if compatible_machine in preHeat_cms:
-                                    if not isinstance(step_1, PreHeat) or step_1.attributes["temperature"] != step.attributes["temperature"]:
-                                        model.AddNoOverlap([all_steps[(rec_id, step_id, compatible_machine, 0)].interval,
-                                                            all_steps[(rec_id_1, step_id_1, compatible_machine, 0)].interval])
-            elif isinstance(step, PreBlast):
-                for rec_id_1, receipt_1 in enumerate(receipts):
-                    for step_id_1, step_1 in enumerate(receipt_1):
-                        if step != step_1:
-                            preBlast_cms = find_compatible_machines(step)
-                            for compatible_machine in find_compatible_machines(step_1):
-                                if compatible_machine in preBlast_cms:
-                                    if not isinstance(step_1, PreBlast) or step_1.attributes["temperature"] != step.attributes["temperature"]:
-                                        model.AddNoOverlap([all_steps[(rec_id, step_id, compatible_machine)].interval,
-                                                            all_steps[(rec_id_1, step_id_1, compatible_machine)].interval])
-                                   
-                                    # if ((isinstance(step_1, OvenCook) or isinstance(step_1, PreStep))
-                                    #     and
-                                    #     step_1.attributes["temperature"] == step.attributes["temperature"]
-                                    #     and
-                                    #     step_1 != step.oven_cook):
-                                        
-                                    #     preHeats_start_after = model.NewBoolVar(
-                                    #         "preHeat_after_%i_%i_%i_%i__m_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine))
-                                    #     preHeats_start_before = model.NewBoolVar(
-                                    #             "preHeat_before_%i_%i_%i_%i__m_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine))
-
-                                    #     preHeats_start_after_dict[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)] = preHeats_start_after
-                                    #     preHeats_start_before_dict[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)] = preHeats_start_before
-
-                                    #     model.Add(all_steps[(rec_id, step_id, compatible_machine, 0)].start 
-                                    #               >
-                                    #               all_steps[(rec_id_1, step_id_1, compatible_machine, 0)].start).OnlyEnforceIf(
-                                    #                             preHeats_start_after
-                                    #                         )
-
-                                    #     model.Add(all_steps[(rec_id, step_id, compatible_machine, 0)].start 
-                                    #               <=
-                                    #               all_steps[(rec_id_1, step_id_1, compatible_machine, 0)].start).OnlyEnforceIf(
-                                    #                             preHeats_start_after.Not()
-                                    #                         )
-
-                                    #     if (isinstance(step_1, OvenCook)):
-                                    #         model.Add(all_steps[(rec_id, step_id, compatible_machine, 0)].start
-                                    #                   <
-                                    #                   all_steps[(rec_id_1, step_id_1, compatible_machine, 0)].end).OnlyEnforceIf(
-                                    #                                   preHeats_start_before
-                                    #                                 )
-                                    #         model.Add(all_steps[(rec_id, step_id, compatible_machine, 0)].start
-                                    #                   >=
-                                    #                   all_steps[(rec_id_1, step_id_1, compatible_machine, 0)].end).OnlyEnforceIf(
-                                    #                                   preHeats_start_before.Not()
-                                    #                                 )
-                                    #     else:
-                                    #         cook_activity_index = get_index_from_graph(receipt_1, step_1.oven_cook)
-                                    #         model.Add(all_steps[(rec_id, step_id, compatible_machine, 0)].start
-                                    #                   <
-                                    #                   all_steps[(rec_id_1, cook_activity_index, compatible_machine, 0)].end).OnlyEnforceIf(
-                                    #                                   preHeats_start_before
-                                    #                                 )
-                                    #         model.Add(all_steps[(rec_id, step_id, compatible_machine, 0)].start
-                                    #                   >=
-                                    #                   all_steps[(rec_id_1, cook_activity_index, compatible_machine, 0)].end).OnlyEnforceIf(
-                                    #                                   preHeats_start_before.Not()
-                                    #                                 )
-                                        
-                                    #     before_and_after_lit = model.NewBoolVar("b_and_a_lit_%i_%i_%i_%i__m_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine))
-                                    #     before_and_after_dict[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)] = before_and_after_lit
-
-
-                                    #     # model.Add(preHeats_start_after == 1).OnlyEnforceIf([before_and_after_lit, all_machines[(rec_id, step_id, compatible_machine, 0)]])
-                                    #     # model.Add(preHeats_start_after == 0).OnlyEnforceIf([before_and_after_lit.Not(), all_machines[(rec_id, step_id, compatible_machine, 0)]])
-
-                                    #     model.AddBoolAnd([preHeats_start_after,
-                                    #                       preHeats_start_before]).OnlyEnforceIf([before_and_after_lit, all_machines[(rec_id, step_id, compatible_machine, 0)]])
-                                    #     model.AddBoolOr([preHeats_start_after.Not(),
-                                    #                      preHeats_start_before.Not()]).OnlyEnforceIf([before_and_after_lit.Not(), all_machines[(rec_id, step_id, compatible_machine, 0)]])
-
-                                    #     preHeat_dur_gt_0 = model.NewBoolVar("preHeat_dur_gt_0_%i_%i_%i_%i__m_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine))
-                                        # model.AddImplication(before_and_after_lit.Not(), all_steps_dur_literals[rec_id, step_id, compatible_machine, 0])
-    
-    # When you preheat an oven, you must use that oven for the
-    # following step and there must be not so much time betweend
-    # the end of the preheat activity and the cook activity
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-            if isinstance(step, PreHeat):
-                cook_index = get_index_from_graph(receipt, step.next_step)
-                for compatible_machine in find_compatible_machines(step):
-                    model.AddImplication(all_machines[(rec_id, step_id, compatible_machine, 0)],
-                                        all_machines[(rec_id, cook_index, compatible_machine, 0)])
-                    # Rimettere
-                    # model.Add(all_steps[(rec_id, step_id, compatible_machine, 0)].end  + 1
-                    #           >=
-                    #           all_steps[(rec_id, cook_index, compatible_machine, 0)].start)
-                    #
-                    # Temporary solution (maybe): there mustn't be any activity between a preheat and its
-                    # ovencook
-                    for rec_id_1, receipt_1 in enumerate(receipts):
-                        for step_id_1, step_1 in enumerate(receipt_1):
-                            if ((step != step_1 and cook_index != step_id_1)
-                                and
-                                ((not isinstance(step_1, PreHeat)) or step.attributes["temperature"] != step_1.attributes["temperature"])
-                                and
-                                ((not isinstance(step_1, OvenCook)) or step.attributes["temperature"] != step_1.attributes["temperature"])):
-                                for compatible_machine_1 in find_compatible_machines(step_1):
-                                    if compatible_machine == compatible_machine_1:
-                                        oven_activity_starts_after = model.NewBoolVar(
-                                            "oven_activity_starts_after_%i_%i_%i_%i_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine)
-                                        )
-                                        model.Add(all_steps[(rec_id_1, step_id_1, compatible_machine, 0)].start
-                                                  > 
-                                                  all_steps[(rec_id, cook_index, compatible_machine, 0)].end).OnlyEnforceIf(
-                                                      oven_activity_starts_after
-                                                  )
-                                        
-                                        oven_activity_ends_before = model.NewBoolVar(
-                                            "oven_activity_ends_before_%i_%i_%i_%i_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine)
-                                        )
-                                        model.Add(all_steps[(rec_id_1, step_id_1, compatible_machine, 0)].end
-                                                  <
-                                                  all_steps[(rec_id, step_id, compatible_machine, 0)].start).OnlyEnforceIf(
-                                                      oven_activity_ends_before
-                                                  )
-
-                                        model.AddBoolOr([oven_activity_starts_after, oven_activity_ends_before])
-
-            elif isinstance(step, PreBlast):
-                blast_index = get_index_from_graph(receipt, step.next_step)
-                for compatible_machine in find_compatible_machines(step):
-                    model.AddImplication(all_machines[(rec_id, step_id, compatible_machine)],
-                                       all_machines[(rec_id, blast_index, compatible_machine)])
-                    # Rimettere
-                    # model.Add(all_steps[(rec_id, step_id, compatible_machine)].end  + 1
-                    #         >=
-                    #         all_steps[(rec_id, blast_index, compatible_machine)].start)
-                    for rec_id_1, receipt_1 in enumerate(receipts):
-                        for step_id_1, step_1 in enumerate(receipt_1):
-                            if ((step != step_1 and blast_index != step_id_1)
-                                and
-                                ((not isinstance(step_1, PreBlast)) or step.attributes["temperature"] != step_1.attributes["temperature"])
-                                and
-                                ((not isinstance(step_1, Blast)) or step.attributes["temperature"] != step_1.attributes["temperature"])):
-                                for compatible_machine_1 in find_compatible_machines(step_1):
-                                    if compatible_machine == compatible_machine_1:
-                                        blast_activity_starts_after = model.NewBoolVar(
-                                            "blast_activity_starts_after_%i_%i_%i_%i_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine)
-                                        )
-                                        model.Add(all_steps[(rec_id_1, step_id_1, compatible_machine)].start
-                                                  > 
-                                                  all_steps[(rec_id, blast_index, compatible_machine)].end).OnlyEnforceIf(
-                                                      blast_activity_starts_after
-                                                  )
-                                        
-                                        blast_activity_ends_before = model.NewBoolVar(
-                                            "blast_activity_ends_before_%i_%i_%i_%i_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine)
-                                        )
-                                        model.Add(all_steps[(rec_id_1, step_id_1, compatible_machine)].end
-                                                  <
-                                                  all_steps[(rec_id, step_id, compatible_machine)].start).OnlyEnforceIf(
-                                                      blast_activity_ends_before
-                                                  )
-
-                                        model.AddBoolOr([blast_activity_starts_after, blast_activity_ends_before])
-
-
-    '''
-    # The preheat duration depends on the temperature the previous step
-    # left on that oven
-    on_same_machine_preheat = {}
-    on_same_machine_preblast = {}
-    preheat_starts_after = {}
-    preblast_starts_after = {}
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-            if isinstance(step, PreHeat):   
-                for rec_id_1, receipt_1 in enumerate(receipts):
-                    for step_id_1, step_1 in enumerate(receipt_1):
-                        if step != step_1 and isinstance(step_1, OvenStep):
-                            preHeat_cms = find_compatible_machines(step)
-                            for compatible_machine in find_compatible_machines(step_1):
-                                if compatible_machine in preHeat_cms:
-                                    for is_frying in range(2):
-
-                                        preheat_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)] = model.NewBoolVar(
-                                            "preheats_starts_after__%i_%i_%i_%i__m_%i_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)
-                                        )
-
-                                        on_same_machine_preheat[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)] = model.NewBoolVar(
-                                            "on_same_machine_preheat_%i_%i_%i_%i__m_%i_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)
-                                        )
-                                        model.AddBoolAnd([all_machines[(rec_id, step_id, compatible_machine, 0)],
-                                                          all_machines[(rec_id_1, step_id_1, compatible_machine, is_frying)]]).OnlyEnforceIf(
-                                                              on_same_machine_preheat[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)]
-                                                          )
-                                        model.AddBoolOr([all_machines[(rec_id, step_id, compatible_machine, 0)].Not(),
-                                                          all_machines[(rec_id_1, step_id_1, compatible_machine, is_frying)].Not()]).OnlyEnforceIf(
-                                                              on_same_machine_preheat[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)].Not()
-                                                          )
-
-                                        model.Add(all_steps[(rec_id, step_id, compatible_machine, 0)].start 
-                                                  >=
-                                                  all_steps[(rec_id_1, step_id_1, compatible_machine, is_frying)].end).OnlyEnforceIf(
-                                                      [on_same_machine_preheat[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)],
-                                                      preheat_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)]]
-                                                  )
-                                        model.Add(all_steps[(rec_id, step_id, compatible_machine, 0)].start 
-                                                  <
-                                                  all_steps[(rec_id_1, step_id_1, compatible_machine, is_frying)].end).OnlyEnforceIf(
-                                                      [on_same_machine_preheat[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)],
-                                                      preheat_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)].Not()]
-                                                  )
-                                        model.AddImplication(preheat_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)],
-                                                            on_same_machine_preheat[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)])
-            elif (isinstance(step, PreBlast)):
-                for rec_id_1, receipt_1 in enumerate(receipts):
-                    for step_id_1, step_1 in enumerate(receipt_1):
-                        if step != step_1 and isinstance(step_1, BlastStep):
-                            preBlast_cms = find_compatible_machines(step)
-                            for compatible_machine in find_compatible_machines(step_1):
-                                if compatible_machine in preBlast_cms:
-
-                                        preblast_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)] = model.NewBoolVar(
-                                            "preblast_starts_after__%i_%i_%i_%i__m_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine)
-                                        )
-
-                                        on_same_machine_preblast[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)] = model.NewBoolVar(
-                                            "on_same_machine_preblast_%i_%i_%i_%i__m_%i" % (rec_id, step_id, rec_id_1, step_id_1, compatible_machine)
-                                        )
-                                        model.AddBoolAnd([all_machines[(rec_id, step_id, compatible_machine)],
-                                                        all_machines[(rec_id_1, step_id_1, compatible_machine)]]).OnlyEnforceIf(
-                                                            on_same_machine_preblast[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)]
-                                                        )
-                                        model.AddBoolOr([all_machines[(rec_id, step_id, compatible_machine)].Not(),
-                                                        all_machines[(rec_id_1, step_id_1, compatible_machine)].Not()]).OnlyEnforceIf(
-                                                            on_same_machine_preblast[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)].Not()
-                                                        )
-
-                                        model.Add(all_steps[(rec_id, step_id, compatible_machine)].start 
-                                                >=
-                                                all_steps[(rec_id_1, step_id_1, compatible_machine)].end).OnlyEnforceIf(
-                                                    [on_same_machine_preblast[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)],
-                                                    preblast_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)]]
-                                                )
-                                        model.Add(all_steps[(rec_id, step_id, compatible_machine)].start 
-                                                <
-                                                all_steps[(rec_id_1, step_id_1, compatible_machine)].end).OnlyEnforceIf(
-                                                    [on_same_machine_preblast[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)],
-                                                    preblast_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)].Not()]
-                                                )
-                                        model.AddImplication(preblast_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)],
-                                                            on_same_machine_preblast[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)])
-
-    end_start_distances_vars_preheat = {}
-    end_start_distances_vars_preblast = {}
-    min_dist_preheat_vars = {}
-    min_dist_preblast_vars = {}
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-            if isinstance(step, PreHeat): 
-                end_start_distances_vars_preheat[(rec_id, step_id)] = []
-                for rec_id_1, receipt_1 in enumerate(receipts):
-                    for step_id_1, step_1 in enumerate(receipt_1):
-                        if step != step_1 and isinstance(step_1, OvenStep):
-                            preHeat_cms = find_compatible_machines(step)
-                            for compatible_machine in find_compatible_machines(step_1):
-                                if compatible_machine in preHeat_cms:
-                                    for is_frying in range(2):
-
-                                        end_start_distances_vars_preheat[(rec_id, step_id)].append(model.NewIntVar(0, 
-                                                                                                           1000000000,
-                                                                                                           "end_start_dist_preheat_%i_%i_%i_%i__m_%i__F_%i" % (
-                                                                                        rec_id, step_id, rec_id_1,step_id_1, compatible_machine, is_frying
-                                                                                    )))
-
-                                        model.Add(end_start_distances_vars_preheat[(rec_id, step_id)][-1]
-                                                  ==
-                                                  (all_steps[(rec_id, step_id, compatible_machine, 0)].start -
-                                                   all_steps[(rec_id_1, step_id_1, compatible_machine, is_frying)].end + 
-                                                   (1 - preheat_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)])*
-                                                   100000)
-                                        )
-                if (end_start_distances_vars_preheat[(rec_id, step_id)] != []):
-                    min_dist_preheat_vars[(rec_id, step_id)] = model.NewIntVar(0, 1000000, "min_dist_preheat_%i_%i" %(rec_id, step_id))
-                    model.AddMinEquality(
-                        min_dist_preheat_vars[(rec_id, step_id)],
-                        end_start_distances_vars_preheat[(rec_id, step_id)]
-                    )
-            elif isinstance(step, PreBlast):
-                end_start_distances_vars_preblast[(rec_id, step_id)] = []
-                for rec_id_1, receipt_1 in enumerate(receipts):
-                    for step_id_1, step_1 in enumerate(receipt_1):
-                        if step != step_1 and isinstance(step_1, BlastStep):
-                            preBlast_cms = find_compatible_machines(step)
-                            for compatible_machine in find_compatible_machines(step_1):
-                                if compatible_machine in preBlast_cms:
-
-                                    end_start_distances_vars_preblast[(rec_id, step_id)].append(model.NewIntVar(0, 
-                                                                                                        10000000,
-                                                                                                        "end_start_dist_preblast_%i_%i_%i_%i__m_%i" % (
-                                                                                    rec_id, step_id, rec_id_1,step_id_1, compatible_machine
-                                                                                )))
-
-                                    model.Add(end_start_distances_vars_preblast[(rec_id, step_id)][-1]
-                                                ==
-                                                (all_steps[(rec_id, step_id, compatible_machine)].start -
-                                                all_steps[(rec_id_1, step_id_1, compatible_machine)].end + 
-                                                (1 - preblast_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)])*
-                                                100000)
-                                    )
-                if (end_start_distances_vars_preblast[(rec_id, step_id)] != []):
-                    min_dist_preblast_vars[(rec_id, step_id)] = model.NewIntVar(0, 10000000, "min_dist_preblast_%i_%i" %(rec_id, step_id))
-                    model.AddMinEquality(
-                        min_dist_preblast_vars[(rec_id, step_id)],
-                        end_start_distances_vars_preblast[(rec_id, step_id)]
-                    )
-
-
-    preheat_domain_literals = {}
-    preblast_domain_literals = {}
+    interval_lists = [[] for _ in machines]
+    demand_lists = [[] for _ in machines]
     for rec_id, receipt in enumerate(receipts):
         for step_id, step in enumerate(receipt):
-            if isinstance(step, PreHeat):
-                for compatible_machine in find_compatible_machines(step):
-                    preheat_dur_var = all_steps[(rec_id, step_id, compatible_machine, 0)].duration
-                    domain = range(preheat_dur_var._IntVar__var.domain[0], preheat_dur_var._IntVar__var.domain[1]+1)
-                    for domain_value in domain:
-                        preheat_domain_literals[(rec_id, step_id, compatible_machine, domain_value)] = model.NewBoolVar(
-                            "preheat_domain_%i_%i__m_%i__v_%i" % (rec_id, step_id, compatible_machine, domain_value)
-                        )
-                        model.Add(all_steps[(rec_id, step_id, compatible_machine, 0)].duration 
-                                    ==
-                                    domain_value).OnlyEnforceIf(
-                                        preheat_domain_literals[(rec_id, step_id, compatible_machine, domain_value)]
-                                    )
-                        model.Add(all_steps[(rec_id, step_id, compatible_machine, 0)].duration 
-                                    !=
-                                    domain_value).OnlyEnforceIf(
-                                        preheat_domain_literals[(rec_id, step_id, compatible_machine, domain_value)].Not()
-                                    )
-            elif isinstance(step, PreBlast):
-                for compatible_machine in find_compatible_machines(step):
-                    preblast_dur_var = all_steps[(rec_id, step_id, compatible_machine)].duration
-                    domain = range(preblast_dur_var._IntVar__var.domain[0], preblast_dur_var._IntVar__var.domain[1]+1)
-                    for domain_value in domain:
-                        preblast_domain_literals[(rec_id, step_id, compatible_machine, domain_value)] = model.NewBoolVar(
-                            "preblast_domain_%i_%i__m_%i__v_%i" % (rec_id, step_id, compatible_machine, domain_value)
-                        )
-                        model.Add(all_steps[(rec_id, step_id, compatible_machine)].duration 
-                                    ==
-                                    domain_value).OnlyEnforceIf(
-                                        preblast_domain_literals[(rec_id, step_id, compatible_machine, domain_value)]
-                                    )
-                        model.Add(all_steps[(rec_id, step_id, compatible_machine)].duration 
-                                    !=
-                                    domain_value).OnlyEnforceIf(
-                                        preblast_domain_literals[(rec_id, step_id, compatible_machine, domain_value)].Not()
-                                    )
+            for m_id in find_compatible_machines(step):
+                interval_lists[m_id].append(all_steps[(rec_id, step_id, m_id)].interval)
+                demand_lists[m_id].append(1)
+    # the machines still busy with the activities before current_time
+    for m_id, (machine, state) in enumerate(zip(machines, machine_states)):
+        if state is not None and state.busy_until > current_time and state.load > 0:
+            busy_interval = model.NewFixedSizeIntervalVar(current_time, state.busy_until - current_time,
+                                                          'busy__m_%i' % m_id)
+            interval_lists[m_id].append(busy_interval)
+            demand_lists[m_id].append(min(state.load, machine.capacity))
+    for m_id, machine in enumerate(machines):
+        model.AddCumulative(interval_lists[m_id], demand_lists[m_id], machine.capacity)
+    count_family(report, model, "cumulative")
             
 
-    
+    # When you preheat an oven (preblast a blast chiller), you must use
+    # it for the following step, and no other activity can come in
+    # between: every oven and blast chiller performs its activities in
+    # sequence, and the prestep lasts as long as the machine takes to
+    # reach the temperature from the one left by the previous activity.
+    # Cooking and frying activities should not be performed in the same
+    # oven, and dishes cooked (or blasted) together must require the same
+    # temperature: only consecutive activities of the same class form a
+    # batch sharing the machine, the next class waits for the batch to end
+    presteps = {}
     for rec_id, receipt in enumerate(receipts):
         for step_id, step in enumerate(receipt):
-            if isinstance(step, PreHeat):
-                for compatible_machine in find_compatible_machines(step):
-                    same_step_var_preheat = []
-                    for rec_id_1, receipt_1 in enumerate(receipts):
-                        for step_id_1, step_1 in enumerate(receipt_1):
-                            if step != step_1 and isinstance(step_1, OvenStep):
-                                for is_frying in range(2):
-                                    # domain = range(preheat_dur_var._IntVar__var.domain[0], preheat_dur_var._IntVar__var.domain[1]+1)
-                                    # for domain_value in domain:
-
-                                    min_dist_preheat_lit = model.NewBoolVar("min_dist_preheat_lit_%i_%i_%i_%i__m_%i__F_%i" % (
-                                                                                        rec_id, step_id, rec_id_1,step_id_1, compatible_machine, is_frying
-                                                                                    ))
-                                    model.Add(min_dist_preheat_vars[(rec_id, step_id)] 
-                                                ==
-                                                (all_steps[(rec_id, step_id, compatible_machine, 0)].start -
-                                                all_steps[(rec_id_1, step_id_1, compatible_machine, is_frying)].end)).OnlyEnforceIf(
-                                                    min_dist_preheat_lit
-                                                )
-                                    model.Add(min_dist_preheat_vars[(rec_id, step_id)] 
-                                                !=
-                                                (all_steps[(rec_id, step_id, compatible_machine, 0)].start -
-                                                all_steps[(rec_id_1, step_id_1, compatible_machine, is_frying)].end)).OnlyEnforceIf(
-                                                    min_dist_preheat_lit.Not()
-                                                )
-
-
-                                    model.Add(preheat_domain_literals[(rec_id, step_id, compatible_machine, 3)] == 1).OnlyEnforceIf(
-                                        [preheat_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)],
-                                         min_dist_preheat_lit]
-                                    )
-
-                                    
-                                    same_step_var_preheat.append(preheat_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine, is_frying)])
-
-                        # if the preheat activity has not a previous oven activity
-                        model.Add(preheat_domain_literals[(rec_id, 
-                                                           step_id, 
-                                                           compatible_machine, 
-                                                           get_node_from_graph(receipt, step_id).attributes["duration"])] == 1).OnlyEnforceIf(
-                            [lit.Not() for lit in same_step_var_preheat] + 
-                            [all_machines[(rec_id, step_id, compatible_machine, 0)]]
-                        )
-            elif isinstance(step, PreBlast):
+            if isinstance(step, PreStep):
+                next_index = get_index_from_graph(receipt, step.next_step)
+                presteps[rec_id, next_index] = ((rec_id, step_id), step)
                 for compatible_machine in find_compatible_machines(step):
-                    same_step_var_preblast = []
-                    for rec_id_1, receipt_1 in enumerate(receipts):
-                        for step_id_1, step_1 in enumerate(receipt_1):
-                            if step != step_1 and isinstance(step_1, BlastStep):
-                                # domain = range(preheat_dur_var._IntVar__var.domain[0], preheat_dur_var._IntVar__var.domain[1]+1)
-                                # for domain_value in domain:
-
-                                min_dist_preblast_lit = model.NewBoolVar("min_dist_preblast_lit_%i_%i_%i_%i__m_%i" % (
-                                                                                    rec_id, step_id, rec_id_1,step_id_1, compatible_machine
-                                                                                ))
-                                model.Add(min_dist_preblast_vars[(rec_id, step_id)] 
-                                            ==
-                                            (all_steps[(rec_id, step_id, compatible_machine)].start -
-                                            all_steps[(rec_id_1, step_id_1, compatible_machine)].end)).OnlyEnforceIf(
-                                                min_dist_preblast_lit
-                                            )
-                                model.Add(min_dist_preblast_vars[(rec_id, step_id)] 
-                                            !=
-                                            (all_steps[(rec_id, step_id, compatible_machine)].start -
-                                            all_steps[(rec_id_1, step_id_1, compatible_machine)].end)).OnlyEnforceIf(
-                                                min_dist_preblast_lit.Not()
-                                            )
-
-
-                                model.Add(preblast_domain_literals[(rec_id, step_id, compatible_machine, 3)] == 1).OnlyEnforceIf(
-                                    [preblast_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)],
-                                        min_dist_preblast_lit]
-                                )
-
-                                
-                                same_step_var_preblast.append(preblast_starts_after[(rec_id, step_id, rec_id_1, step_id_1, compatible_machine)])
-
-                        # if the preheat activity has not a previous oven activity
-                        model.Add(preblast_domain_literals[(rec_id, 
-                                                           step_id, 
-                                                           compatible_machine, 
-                                                           get_node_from_graph(receipt, step_id).attributes["duration"])] == 1).OnlyEnforceIf(
-                            [lit.Not() for lit in same_step_var_preblast] + 
-                            [all_machines[(rec_id, step_id, compatible_machine)]]
-                        )
-    '''
-
-    # Find the nearest step before the preheat
-    # near_steps_distance_vars = {}
-    # for rec_id, receipt in enumerate(receipts):
-    #     for step_id, step in enumerate(receipt):
-    #         if isinstance(step, PreStep):
-    #             for compatible_machine in find_compatible_machines(step):
-    #                 for rec_id_1, receipt_1 in enumerate(receipts):
-    #                     for step_id_1, step_1 in enumerate(receipt_1):
-    #                         if step != step_1 and isinstance(step_1, OvenStep):
-    #                             for is_frying in range(2):
-                                    
-
-
-
-
-    # # If you want to cook two dishes in the same oven
-    # # they must require the same temperature
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-            for rec_id_1, receipt_1 in enumerate(receipts):
-                for step_id_1, step_1 in enumerate(receipt_1):
-                    if rec_id_1 > rec_id:
-                        # t2 = step_1.attributes["temperature"]
-                        if (isinstance(step, OvenCook) and 
-                            isinstance(step_1, OvenCook) and
-                            step.attributes["temperature"] != step_1.attributes["temperature"]):
-                            for m_id in find_compatible_machines(step):
-                                for m_id_1 in find_compatible_machines(step_1):
-                                    if m_id == m_id_1:
-                                        model.AddNoOverlap([all_steps[rec_id, step_id, m_id, 0].interval,
-                                                            all_steps[rec_id_1, step_id_1, m_id_1, 0].interval])
-                        elif (isinstance(step, Blast) and 
-                            isinstance(step_1, Blast) and
-                            step.attributes["temperature"] != step_1.attributes["temperature"]):
-                            for m_id in find_compatible_machines(step):
-                                for m_id_1 in find_compatible_machines(step_1):
-                                    if m_id == m_id_1:
-                                        model.AddNoOverlap([all_steps[rec_id, step_id, m_id].interval,
-                                                            all_steps[rec_id_1, step_id_1, m_id_1].interval])
-
-
+                    model.AddImplication(all_machines[(rec_id, step_id, compatible_machine)],
+                                         all_machines[(rec_id, next_index, compatible_machine)])
+    for m_id, machine in enumerate(machines):
+        step_kind = sequenced_kind(machine)
+        if step_kind is not None:
+            activities = [(rec_id, step_id, step)
+                          for rec_id, receipt in enumerate(receipts) for step_id, step in enumerate(receipt)
+                          if isinstance(step, step_kind) and not isinstance(step, PreStep)
+                          and m_id in find_compatible_machines(step)]
+            activities = sequence_activities(activities, m_id, frozen_steps, current_time)
+            state = machine_states[m_id]
+            add_machine_sequence(model, m_id, activities, all_tasks, all_machines, presteps,
+                                 previous_states, sequence_states[step_kind], EOH, state,
+                                 None if state is None else busy_class(machine, state))
+    count_family(report, model, "machine sequence")
 
     # Objective function
     # Our goal is to minimize the makespan, that is the total time of execution
-    obj_var = model.NewIntVar(0, EOH, 'makespan')
+    obj_var = model.NewIntVar(lb, EOH, 'makespan')
 
+    # every last step of the receipes, the lower bound holds only
+    # if the makespan covers all of them
     end_steps = []
     for rec_id, receipt in enumerate(receipts):
-        last_step = [step for step in receipt if receipt.out_degree(step) == 0][0]
-        last_step_index = get_index_from_graph(receipt, last_step)
-        for m_id in find_compatible_machines(last_step):
-            if not isinstance(machines[m_id], Oven):
-                end_steps.append(all_steps[(rec_id, last_step_index, m_id)].end)
-            else:
-                for is_frying in range(2):
-                    end_steps.append(all_steps[(rec_id, last_step_index, m_id, is_frying)].end)
+        for last_step in [step for step in receipt if receipt.out_degree(step) == 0]:
+            last_step_index = get_index_from_graph(receipt, last_step)
+            end_steps.append(all_tasks[(rec_id, last_step_index)].end)
 
     # warnings.warn("Energy optimization only for ovens")
     # same_temp_steps_dict = {}
@@ -976,101 +500,173 @@ def SIAF_scheduler():
         end_steps
     )
     model.Minimize(obj_var)
+    count_family(report, model, "makespan")
 
-    
-    # Solve model
-    solver = cp_model.CpSolver()
-    status = solver.Solve(model)
+    return cp_instance_type(model=model, all_tasks=all_tasks, all_steps=all_steps,
+                            all_machines=all_machines, obj_var=obj_var, bounds=bounds)
 
-    print("Status of the solver: %i" % status)
 
-    if (status == cp_model.UNKNOWN):
-        print("Schedule doesn't worked well for unknown reason.")
-        return
-    elif (status == cp_model.MODEL_INVALID):
-        print("MODEL INVALID!!")
-        return
-    elif (status == cp_model.INFEASIBLE):
-        print("MODEL INFEASIBLE!!")
-        return
+def model_index(receipts, instance):
+    '''
+    Indices in the model proto of the variables of every step, and the
+    bounds by step index: what is needed to use a cached model
+    '''
+    return {
+        "tasks": [[rec_id, step_id, task.start.Index()] +
+                  ([task.duration, None, None] if isinstance(task.duration, int)
+                   else [None, task.duration.Index(), task.end.Index()])
+                  for (rec_id, step_id), task in instance.all_tasks.items()],
+        "machines": [[rec_id, step_id, m_id, machine_var.Index(), instance.all_steps[rec_id, step_id, m_id].interval.Index()]
+                     for (rec_id, step_id, m_id), machine_var in instance.all_machines.items()],
+        "obj_var": instance.obj_var.Index(),
+        "lb": instance.bounds.lb,
+        "eoh": instance.bounds.eoh,
+        "heuristic": None if instance.bounds.heuristic is None else
+                     [[rec_id, get_index_from_graph(receipts[rec_id], step)] + list(scheduled_step)
+                      for (rec_id, step), scheduled_step in instance.bounds.heuristic.items()],
+        "heads": [[heads[get_node_from_graph(receipt, step_id)] for step_id in range(receipt.number_of_nodes())]
+                  for receipt, heads in zip(receipts, instance.bounds.heads)],
+        "tails": [[tails[get_node_from_graph(receipt, step_id)] for step_id in range(receipt.number_of_nodes())]
+                  for receipt, tails in zip(receipts, instance.bounds.tails)]
+    }
+
+
+def instance_from_cache(receipts, cached):
+    '''
+    The cp_instance_type of a cached model (model_cache.cached_model_type)
+    '''
+    from ortools.sat.python import cp_model
+    from bounds import bounds_type
+    from list_scheduler import scheduled_type
 
-        
-    # Display results
+    model = cp_model.CpModel()
+    model.Proto().parse_text_format(cached.model_text)
+    index = cached.index
+
+    all_tasks = {}
+    for rec_id, step_id, start_index, duration, duration_index, end_index in index["tasks"]:
+        start_var = model.GetIntVarFromProtoIndex(start_index)
+        if duration_index is None:
+            end_var = start_var + duration
+        else:
+            duration = model.GetIntVarFromProtoIndex(duration_index)
+            end_var = model.GetIntVarFromProtoIndex(end_index)
+        all_tasks[rec_id, step_id] = task_type(start=start_var, duration=duration, end=end_var)
 
-    # Print makespan
-    print("Optimal Schedule Length: %i" % solver.ObjectiveValue())
-    print()
+    all_steps = {}
+    all_machines = {}
+    for rec_id, step_id, m_id, machine_index, interval_index in index["machines"]:
+        task = all_tasks[rec_id, step_id]
+        all_machines[rec_id, step_id, m_id] = model.GetBoolVarFromProtoIndex(machine_index)
+        all_steps[rec_id, step_id, m_id] = step_type(start=task.start, duration=task.duration, end=task.end,
+                                                     interval=model.GetIntervalVarFromProtoIndex(interval_index))
+
+    bounds = bounds_type(
+        lb=index["lb"],
+        eoh=index["eoh"],
+        heads=[{get_node_from_graph(receipt, step_id): head for step_id, head in enumerate(heads)}
+               for receipt, heads in zip(receipts, index["heads"])],
+        tails=[{get_node_from_graph(receipt, step_id): tail for step_id, tail in enumerate(tails)}
+               for receipt, tails in zip(receipts, index["tails"])],
+        heuristic=None if index["heuristic"] is None else
+                  {(rec_id, get_node_from_graph(receipts[rec_id], step_id)): scheduled_type(*scheduled_step)
+                   for rec_id, step_id, *scheduled_step in index["heuristic"]}
+    )
 
-    # for key, value in preheat_starts_after.items():
-    #     print(key)
-    #     print(solver.Value(value))
-    #     print()
+    return cp_instance_type(model=model, all_tasks=all_tasks, all_steps=all_steps, all_machines=all_machines,
+                            obj_var=model.GetIntVarFromProtoIndex(index["obj_var"]), bounds=bounds)
 
-    # for key, value in min_dist_preheat_vars.items():
-    #     print(key)
-    #     print(solver.Value(value))
-    #     print()
 
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-            for compatible_machine in find_compatible_machines(step):
-                if (not isinstance(machines[compatible_machine], Oven)):
-                    print()
-                    print(solver.Value(all_steps_start_literals[(rec_id, step_id, compatible_machine)]))
-                    print("*"*15)
-                    print(all_steps[(rec_id, step_id, compatible_machine)])
-                    print(solver.Value(all_steps[(rec_id, step_id, compatible_machine)].start))
-                    print(solver.Value(all_steps[(rec_id, step_id, compatible_machine)].end))
-                    print("*"*15)
-                    print(all_machines[(rec_id, step_id, compatible_machine)])
-                    print(solver.Value(all_machines[(rec_id, step_id, compatible_machine)]))
-                    print("*"*15)
-                    print()
-                else:
-                    for is_frying in range(2):
-                        print()
-                        print("*"*15)
-                        print(all_steps[(rec_id, step_id, compatible_machine, is_frying)])
-                        print(solver.Value(all_steps[(rec_id, step_id, compatible_machine, is_frying)].start))
-                        print(solver.Value(all_steps[(rec_id, step_id, compatible_machine, is_frying)].end))
-                        print("*"*15)
-                        print(all_machines[(rec_id, step_id, compatible_machine, is_frying)])
-                        print(solver.Value(all_machines[(rec_id, step_id, compatible_machine, is_frying)]))
-                        print("*"*15)
-                        print()
-
-    # Create one list of assigned steps per machine
+def extract_schedule(solver, instance, machines):
+    '''
+    One list of assigned steps per machine, from the solution found
+    by the solver for the model of instance (a cp_instance_type)
+    '''
     assigned_receipts = [[] for _ in range(len(machines))]
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-            for compatible_machine in find_compatible_machines(step):
-                for is_frying in range(2):
-                    machine = 0
-                    if not isinstance(machines[compatible_machine], Oven):
-                        machine = solver.Value(all_machines[(rec_id, step_id, compatible_machine)])
-                        if machine == 1:
-                            assigned_receipts[compatible_machine].append(
-                                assigned_step_type(
-                                    start=solver.Value(all_steps[(rec_id, step_id, compatible_machine)].start),
-                                    duration=solver.Value(all_steps[(rec_id, step_id, compatible_machine)].duration),
-                                    receipt=rec_id,
-                                    index=step_id
-                                )
-                            )
-                        # break needed to avoid adding twice not-Oven steps
-                        break
-                    else:
-                        machine = solver.Value(all_machines[(rec_id, step_id, compatible_machine, is_frying)])
-                        if machine == 1:
-                            assigned_receipts[compatible_machine].append(
-                                assigned_step_type(
-                                    start=solver.Value(all_steps[(rec_id, step_id, compatible_machine, is_frying)].start),
-                                    duration=solver.Value(all_steps[(rec_id, step_id, compatible_machine, is_frying)].duration),
-                                    receipt=rec_id,
-                                    index=step_id
-                                )
-                            )
+    for key, machine_var in instance.all_machines.items():
+        if solver.Value(machine_var) == 1:
+            assigned_receipts[key[2]].append(
+                assigned_step_type(
+                    start=solver.Value(instance.all_steps[key].start),
+                    duration=solver.Value(instance.all_steps[key].duration),
+                    receipt=key[0],
+                    index=key[1]
+                )
+            )
+    return assigned_receipts
+
+
+def reschedule(receipts, machines, previous_schedule, current_time, new_receipts=[], **kwargs):
+    '''
+    Schedules again the receipes at current_time, adding new_receipts.
+    The new receipes follow the old ones in the schedule.
+    The steps of the previous schedule started before current_time
+    (executed or in progress) keep their start, end and machine
+    '''
+    frozen_steps = {}
+    for m_id, assigned_steps in enumerate(previous_schedule):
+        for assigned_step in assigned_steps:
+            if assigned_step.start < current_time:
+                frozen_steps[(assigned_step.receipt, assigned_step.index)] = frozen_step_type(
+                    start=assigned_step.start,
+                    end=assigned_step.start + assigned_step.duration,
+                    machine=m_id
+                )
+
+    from utils import index_graph
+
+    receipts = list(receipts) + [index_graph(receipt) for receipt in new_receipts]
+
+    return SIAF_scheduler(receipts, machines, current_time=current_time, frozen_steps=frozen_steps, **kwargs)
+
+
+def greedy_scheduler(receipts, machines, rule="critical_path", exporter=None, render_path=None, report=None):
+    '''
+    Schedules the receipes with the list scheduler, following the given
+    priority rule ("spt", "critical_path" or "most_successors")
+    '''
+    from list_scheduler import list_scheduler
+
+    with phase(report, "solve"):
+        result = list_scheduler(receipts, CompatibilityIndex(machines), rule, exclusivity_class)
+    if result.schedule is not None:
+        with phase(report, "export"):
+            display_schedule(receipts, machines, result.schedule, exporter, render_path)
+    return result
+
+
+def pooled_scheduler(receipts, machines, config_path=DEFAULT_CONFIG_PATH, exporter=None, render_path=None,
+                     report=None, **solver_parameters):
+    '''
+    Schedules the receipes with the aggregated model of
+    scheduler_res_as_places: the timing against the pooled machines,
+    then the assignment of the physical machines. The solver parameters
+    override the ones of config_path, as in SIAF_scheduler
+    '''
+    from scheduler_res_as_places import aggregated_scheduler
+
+    config = load_solver_config(config_path, **solver_parameters)
+    result = aggregated_scheduler(receipts, machines, config, report)
+    if result.schedule is not None:
+        with phase(report, "export"):
+            display_schedule(receipts, machines, result.schedule, exporter, render_path)
+    return result
+
+
+# Every engine returns a solve_result_type
+SCHEDULERS = {
+    "cp": SIAF_scheduler,
+    "list": greedy_scheduler,
+    "pooled": pooled_scheduler
+}
+
+
+def schedule_receipts(receipts, machines, engine="cp", **kwargs):
+    return SCHEDULERS[engine](receipts, machines, **kwargs)
+
 
+# Writes the schedule in the receipes graphs, prints it and exports the new workflow
+def display_schedule(receipts, machines, assigned_receipts, exporter=None, render_path=None):
     disp_col_width = 10
     sol_line = ''
     sol_line_steps = ''
@@ -1097,10 +693,6 @@ def SIAF_scheduler():
             start = assigned_step.start
             duration = assigned_step.duration
 
-            receipts[assigned_step.receipt].nodes[curr_node]['start'] = start
-            receipts[assigned_step.receipt].nodes[curr_node]['end'] = start + duration
-            receipts[assigned_step.receipt].nodes[curr_node]['resource'] = i
-
             sol_tmp = '[%i,%i]' % (start, start + duration)
             if isinstance(curr_node, OvenFry):
                 sol_tmp += "_F"
@@ -1123,7 +715,9 @@ def SIAF_scheduler():
     print(sol_line)
     print()
 
-    wfcore_utils_cream.create_graph_from_schedule(receipts)
+    write_schedule(receipts, assigned_receipts)
+    if exporter is not None:
+        exporter.create_graph_from_schedule(receipts, render_path)
     # with open("schedule.txt", "w+") as schedule_file:
     #     # schedule_file.write(sol_line_steps)
     #     # schedule_file.write('Step Time Intervals\n')
@@ -1132,6 +726,20 @@ def SIAF_scheduler():
     #     schedule_file.write(json.dumps(schedule_dict))
 
 
+def write_schedule(receipts, assigned_receipts):
+    '''
+    Writes start, end and machine (resource) of every assigned step
+    in the node attributes of the receipes graphs, as the exporter wants
+    '''
+    for m_id, assigned_steps in enumerate(assigned_receipts):
+        for assigned_step in assigned_steps:
+            receipt = receipts[assigned_step.receipt]
+            curr_node = get_node_from_graph(receipt, assigned_step.index)
+            receipt.nodes[curr_node]['start'] = assigned_step.start
+            receipt.nodes[curr_node]['end'] = assigned_step.start + assigned_step.duration
+            receipt.nodes[curr_node]['resource'] = m_id
+
+
 # Function required to provide the (improbable) right input format to NewEnumeratedIntVar
 def create_flatten_domain(compatible_machines):
     flatten_domain = []
@@ -1151,37 +759,257 @@ def create_flatten_domain(compatible_machines):
     return flatten_domain
 
 
-def find_compatible_machines(step):
-    if isinstance(step, OvenCook) or isinstance(step, PreHeat):
-        return [m_id 
-                for m_id, machine in enumerate(machines)
-                if isinstance(machine, Oven) and
-                   machine.max_temperature >= step.attributes['temperature']]
-    elif isinstance(step, VacuumStep):
-        return [m_id for m_id, machine in enumerate(machines) if isinstance(machine, VacuumMachine)]
-    elif isinstance(step, BlastStep) or isinstance(step, PreBlast):
-        return [m_id for m_id, machine in enumerate(machines) if isinstance(machine, BlastChiller)]
+'''
+Class of a step for the exclusivity constraints: steps of the same
+class can be performed at the same time on a machine, steps of
+different classes cannot. None if the step is not restricted
+'''
+def exclusivity_class(step):
+    if isinstance(step, PreHeat):
+        return ("PreHeat", step.temperature)
+    elif isinstance(step, OvenCook):
+        return ("OvenCook", step.temperature)
     elif isinstance(step, OvenFry):
-        return [m_id for m_id, machine in enumerate(machines) if isinstance(machine, Oven) and
-                                                                 machine.can_fry]
-    elif isinstance(step, HumanStep):
-        return [m_id for m_id, machine in enumerate(machines) if isinstance(machine, Human)]
+        return ("OvenFry", None)
+    elif isinstance(step, PreBlast):
+        return ("PreBlast", step.temperature)
+    elif isinstance(step, Blast):
+        return ("Blast", step.temperature)
+
+    return None
+
+
+def sequenced_kind(item):
+    '''
+    Kind of steps of a sequenced machine (or of the machines performing
+    a step), None if they aren't sequenced
+    '''
+    for machine_type, step_kind in SEQUENCED_MACHINES.items():
+        if isinstance(item, machine_type) or isinstance(item, step_kind):
+            return step_kind
+    return None
+
+
+def busy_class(machine, state):
+    '''
+    Exclusivity class of the activities busying a machine (a
+    machine_state_type): on a sequenced machine with free capacity, the
+    one of the activities at the temperature of the state. None if the
+    class doesn't restrict the machine
+    '''
+    step_kind = sequenced_kind(machine)
+    if step_kind is None:
+        return None
+    if state.temperature is None or state.load >= machine.capacity:
+        # nothing can share the machine
+        return ("Busy", None)
+    return {OvenStep: ("OvenCook", state.temperature), BlastStep: ("Blast", state.temperature)}[step_kind]
+
+
+def prestep_duration(prestep, temperature):
+    '''
+    Time to bring the machine to the temperature of prestep from the
+    given one, never longer than the prestep of a machine at rest
+    (temperature None)
+    '''
+    if temperature is None or prestep.temperature is None:
+        return prestep.duration
+    return min(prestep.duration, get_dur_from_temperatures(temperature, prestep.temperature))
+
+
+def sequence_activities(activities, m_id, frozen_steps, current_time):
+    '''
+    The activities (rec_id, step_id, step) compatible with the sequenced
+    machine m_id that can still be in its sequence: the started ones
+    (frozen_steps) keep their machine and precede the other ones, so of
+    the ones ended before current_time only the last one is kept, for
+    the state it leaves to the machine
+    '''
+    ended = [(frozen_steps[rec_id, step_id].start, rec_id, step_id) for rec_id, step_id, _ in activities
+             if (rec_id, step_id) in frozen_steps and frozen_steps[rec_id, step_id].machine == m_id
+             and frozen_steps[rec_id, step_id].end < current_time]
+    last = max(ended, default=None)
+
+    kept = []
+    for rec_id, step_id, step in activities:
+        frozen_step = frozen_steps.get((rec_id, step_id))
+        if frozen_step is not None:
+            if frozen_step.machine != m_id:
+                continue
+            if frozen_step.end < current_time and (frozen_step.start, rec_id, step_id) != last:
+                continue
+        kept.append((rec_id, step_id, step))
+    return kept
+
+
+def add_machine_sequence(model, m_id, activities, all_tasks, all_machines, presteps, previous_states, states,
+                         horizon, machine_state=None, state_class=None):
+    '''
+    The activities (rec_id, step_id, step) performed by the sequenced
+    machine m_id form a circuit through a dummy node. The prestep of an
+    activity (presteps: key of the activity -> key and step of its
+    prestep) finds the machine in the state (index in states) left by
+    the previous activity, or by the activities before the model
+    (machine_state, of exclusivity class state_class) if there isn't
+    one. Consecutive activities of the
+    same class form a batch: every one starts (prestep included) after
+    the previous one, and the end of the batch is carried along the
+    sequence. An activity of another class starts, prestep included,
+    after the end of the batch before it: the classes never overlap,
+    with at most three constraints for every arc and a single one for
+    the state found by the prestep of every activity. The arcs join
+    every ordered pair of activities: the time windows of the
+    activities span most of the horizon and can't rule them out
+    '''
+    if activities == []:
+        return
+
+    initial_state = 0
+    busy_until = None
+    if machine_state is not None:
+        initial_state = states.index(machine_state.temperature)
+        if machine_state.load > 0:
+            # the activities before the model are a batch of their own
+            busy_until = machine_state.busy_until
+
+    # the dummy node stays alone if the machine isn't used
+    unused = model.NewBoolVar('unused__m_%i' % m_id)
+    arcs = [(0, 0, unused)]
+
+    # start of every activity, its prestep included, and end of the
+    # batch it closes if the next activity is of another class
+    block_starts = []
+    batch_ends = []
+    for rec_id, step_id, step in activities:
+        prestep_key, _ = presteps.get((rec_id, step_id), (None, None))
+        block_starts.append(all_tasks[rec_id, step_id].start if prestep_key is None else all_tasks[prestep_key].start)
+        batch_end = model.NewIntVar(0, horizon, 'batch_end_%i_%i__m_%i' % (rec_id, step_id, m_id))
+        model.Add(batch_end >= all_tasks[rec_id, step_id].end)
+        batch_ends.append(batch_end)
+
+    for node, (rec_id, step_id, step) in enumerate(activities, 1):
+        performed = all_machines[rec_id, step_id, m_id]
+        model.AddImplication(unused, performed.Not())
+        arcs.append((node, node, performed.Not()))
+        first = model.NewBoolVar('first_%i_%i__m_%i' % (rec_id, step_id, m_id))
+        arcs.append((0, node, first))
+        arcs.append((node, 0, model.NewBoolVar('last_%i_%i__m_%i' % (rec_id, step_id, m_id))))
+
+        task = all_tasks[rec_id, step_id]
+        prestep_key, _ = presteps.get((rec_id, step_id), (None, None))
+        block_start = block_starts[node - 1]
+        previous_state = previous_states.get(prestep_key)
+        # the state index left by the activity of every arc entering the node
+        entering = [(first, initial_state)]
+        if busy_until is not None:
+            if exclusivity_class(step) == state_class:
+                model.Add(batch_ends[node - 1] >= busy_until).OnlyEnforceIf(first)
+            else:
+                model.Add(block_start >= busy_until).OnlyEnforceIf(first)
+
+        for previous_node, (previous_rec_id, previous_step_id, previous_step) in enumerate(activities, 1):
+            if previous_node == node:
+                continue
+            previous_task = all_tasks[previous_rec_id, previous_step_id]
+            follows = model.NewBoolVar('follows_%i_%i__%i_%i__m_%i' % (
+                rec_id, step_id, previous_rec_id, previous_step_id, m_id))
+            arcs.append((previous_node, node, follows))
+            if exclusivity_class(previous_step) == exclusivity_class(step):
+                # an empty prestep can't be left before an activity of another
+                # class. Unless both activities have a prestep, one of the
+                # two orders (of the starts and of the blocks) implies the other
+                if prestep_key is None:
+                    model.Add(task.start >= previous_task.start).OnlyEnforceIf(follows)
+                else:
+                    model.Add(block_start >= block_starts[previous_node - 1]).OnlyEnforceIf(follows)
+                    if (previous_rec_id, previous_step_id) in presteps:
+                        model.Add(task.start >= previous_task.start).OnlyEnforceIf(follows)
+                model.Add(batch_ends[node - 1] >= batch_ends[previous_node - 1]).OnlyEnforceIf(follows)
+            else:
+                model.Add(block_start >= batch_ends[previous_node - 1]).OnlyEnforceIf(follows)
+            entering.append((follows, states.index(previous_step.temperature)))
+
+        # exactly one arc enters a performed activity: a single constraint
+        # links the prestep to the state of all the previous ones
+        if previous_state is not None:
+            model.Add(previous_state == sum([literal * state_index for literal, state_index in entering
+                                             if state_index != 0])).OnlyEnforceIf(performed)
+
+    model.AddCircuit(arcs)
+
+
+def add_schedule_hints(model, schedule, all_tasks, all_machines, obj_var):
+    '''
+    Start, machine and presence of every step of the schedule (a list of
+    assigned steps for each machine) become hints for the solver
+    '''
+    hinted_machines = {}
+    makespan = 0
+    for m_id, assigned_steps in enumerate(schedule):
+        for assigned_step in assigned_steps:
+            key = (assigned_step.receipt, assigned_step.index)
+            if not key in all_tasks:
+                continue
+            model.AddHint(all_tasks[key].start, assigned_step.start)
+            hinted_machines[key] = m_id
+            makespan = max(makespan, assigned_step.start + assigned_step.duration)
+
+    for (rec_id, step_id, m_id), machine_var in all_machines.items():
+        if (rec_id, step_id) in hinted_machines:
+            model.AddHint(machine_var, hinted_machines[(rec_id, step_id)] == m_id)
 
-    return []
+    model.AddHint(obj_var, makespan)
 
 
 def get_index_from_graph(graph, node):
     if node in graph:
-        list_nodes = list(graph.nodes())
-        return list_nodes.index(node)
+        if not "nodes" in graph.graph:
+            from utils import index_graph
+            index_graph(graph)
+        return graph.nodes[node]["index"]
     else:
         return Exception("The required node is not present in given graph")
 
 def get_node_from_graph(graph, index):
-    for i, node in enumerate(graph):
-        if i == index:
-            return node
+    if not "nodes" in graph.graph:
+        from utils import index_graph
+        index_graph(graph)
+    return graph.graph["nodes"][index]
 
 
 if __name__ == '__main__':
-    SIAF_scheduler()
+    # the engine can be chosen from the command line: cp (default), list or pooled.
+    # The CP-SAT model starts from the list schedule defining its horizon.
+    # The picture of the new workflow is drawn only with --render.
+    # With --report the phases and the model are measured, and the
+    # report is printed and written to report.json
+    arguments = [argument for argument in sys.argv[1:] if not argument in ("--render", "--report")]
+    engine = arguments[0] if arguments else "cp"
+    render_path = "new_workflow.png" if "--render" in sys.argv else None
+    report = None
+    if "--report" in sys.argv:
+        from instrumentation import PipelineReport
+        report = PipelineReport()
+
+    from rendering import wait_renderings
+
+    receipts, exporter = load_receipts(EXAMPLE_WORKFLOWS, report)
+    machines = example_machines()
+
+    result = schedule_receipts(receipts, machines, engine, exporter=exporter, render_path=render_path,
+                               report=report)
+    print("Status of the solver: %s" % result.status_name)
+    if result.schedule is not None:
+        if result.status_name == "OPTIMAL":
+            print("Optimal Schedule Length: %i" % result.objective)
+        else:
+            print("Schedule Length: %i" % result.objective)
+        print("Best Bound: %i" % result.best_bound)
+    if result.note is not None:
+        print("Note: %s" % result.note)
+    print("Wall Time: %f s" % result.wall_time)
+    if report is not None:
+        print()
+        print(report)
+        report.write_json("report.json")
+    wait_renderings()
@@ -2,48 +2,80 @@
 This version of the scheduler is intended to provide a scheduling
 of the receipts, considering the resources as the number of free
 spaces, rather than the physical machines. The key idea is that
-we consider three different resources, with a capacity equal to
-the sum of all similar resources (Ovens, Blast Chillers and Vacuum
-Machines). With this approach, a post-processing phase will be
+identical machines are pooled in a single resource, with a capacity
+equal to the sum of their capacities (Ovens, Blast Chillers, Vacuum
+Machines and Humans). With this approach, a post-processing phase is
 needed.
 
 The reason why we're trying this is that the cumulative global
-constraint assumes that every step can be assigned to only one resource.
+constraint assumes that every step can be assigned to only one resource:
+the detailed model needs an optional interval for every compatible
+machine, and a sequence of the activities of every oven and blast chiller.
+
+Phase one is a CP-SAT model with a single interval for every step (a
+prestep and its next step form one block) and one cumulative for every
+pool: the machines compatible with some steps, that must perform all
+the steps that only they can perform. Presteps keep the duration they
+have on a machine at rest. On ovens and blast chillers the pools count
+machines too: the blocks of the same class form batches, every batch
+takes a whole machine, and the blocks joining a batch find the machine
+at temperature, with an empty prestep.
+Phase two assigns the physical machines, keeping the planned times:
+the batches are taken in the order of their planned start and every
+one goes on a compatible machine free at that time, as in the coloring
+of an interval graph. On an oven (blast chiller) the prestep lasts as
+long as the machine takes from the temperature left by the previous
+batch, never longer than planned. Only if a timing can't be kept the
+blocks are re-timed, each one starting as soon as its predecessors and
+a machine allow. Phase two takes a few milliseconds, and it is run on
+every solution found in phase one.
 '''
 
-from ortools.sat.python import cp_model
+# ortools and the bounds module are imported when they are needed:
+# importing this module does nothing, the receipes and the machines
+# are given at call time
 import collections
-from receipt import BlastStep, OvenCook, OvenFry, VacuumStep
-from machine import BlastChiller, Oven, VacuumMachine
+import heapq
+import time
+from receipt import PreStep, PreHeat, OvenCook, PreBlast, Blast, VacuumStep
+from machine import BlastChiller, Oven, VacuumMachine, CompatibilityIndex
 
 
-class VarArrayAndObjectiveSolutionPrinter(cp_model.CpSolverSolutionCallback):
-    """Print intermediate solutions."""
+def solution_printer(variables):
+    '''
+    Callback of the solver printing the intermediate solutions
+    '''
+    from ortools.sat.python import cp_model
 
-    def __init__(self, variables):
-        cp_model.CpSolverSolutionCallback.__init__(self)
-        self.__variables = variables
-        self.__solution_count = 0
+    class VarArrayAndObjectiveSolutionPrinter(cp_model.CpSolverSolutionCallback):
+        """Print intermediate solutions."""
 
-    def on_solution_callback(self):
-        print('Solution %i' % self.__solution_count)
-        print('  objective value = %i' % self.ObjectiveValue())
-        for v in self.__variables:
-            print('  %s = %i' % (v, self.Value(v)), end=' ')
-        print()
-        self.__solution_count += 1
+        def __init__(self, variables):
+            cp_model.CpSolverSolutionCallback.__init__(self)
+            self.__variables = variables
+            self.__solution_count = 0
 
-    def solution_count(self):
-        return self.__solution_count
+        def on_solution_callback(self):
+            print('Solution %i' % self.__solution_count)
+            print('  objective value = %i' % self.ObjectiveValue())
+            for v in self.__variables:
+                print('  %s = %i' % (v, self.Value(v)), end=' ')
+            print()
+            self.__solution_count += 1
+
+        def solution_count(self):
+            return self.__solution_count
+    return VarArrayAndObjectiveSolutionPrinter(variables)
 
 
 # Some useful types used below
-step_type = collections.namedtuple('step_type', 'start end interval')
-assigned_step_type = collections.namedtuple('assigned_step_type',
-                                            'start receipt index')
+# a block of steps performed together on a machine: a step alone, or a
+# prestep (None otherwise) with its next step
+block_type = collections.namedtuple('block_type', 'receipt prestep step compatible_machines')
+pooled_instance_type = collections.namedtuple('pooled_instance_type', 'model starts blocks joins obj_var bounds')
 
 
-# Ricetta: composta da step che consistono di 
+# Ricetta: composta da step che consistono di
 # durata e capabilities richieste
 # receipts_old = [
 #     [(3, [0,3]), (4, [2])],
@@ -51,206 +83,615 @@ assigned_step_type = collections.namedtuple('assigned_step_type',
 #     [(2, [3])]
 # ]
 
-receipts = [
-    [OvenCook(3, 120, 150), BlastStep(4)],
-    [OvenCook(2, 100, 130), VacuumStep(4)],
-    [OvenCook(2, 50, 90)]
-]
-
-# receipts_clusters = {
-#     "OvenCook": [step for receipt in receipts for step in receipt if isinstance(step, OvenCook)],
-#     "BlastStep": [step for receipt in receipts for step in receipt if isinstance(step, BlastStep)],
-#     "VacuumStep": [step for receipt in receipts for step in receipt if isinstance(step, VacuumStep)]
-# }
-
-EOH = sum([step.duration for receipt in receipts for step in receipt])
-print("End of Horizon: %i" % EOH)
+def example_receipts():
+    receipts = []
+    for cook, blast_or_vacuum in [(OvenCook({"duration": 3, "temperature": 150}), Blast({"duration": 4})),
+                                  (OvenCook({"duration": 2, "temperature": 130}), VacuumStep({"duration": 4})),
+                                  (OvenCook({"duration": 2, "temperature": 90}), None)]:
+        receipt = [PreHeat({"duration": 5, "temperature": cook.temperature}, cook), cook]
+        if isinstance(blast_or_vacuum, Blast):
+            receipt += [PreBlast({"duration": 3}, blast_or_vacuum), blast_or_vacuum]
+        elif blast_or_vacuum is not None:
+            receipt.append(blast_or_vacuum)
+        receipts.append(receipt)
+    return receipts
 
 # Macchine: composte da capacità e capabilities
 # machines_old = [(1,[2]), (1,[1,2]), (2,[3])]
 
-machines = [Oven(1, 0, 300, False), Oven(2, 0, 250, True), Oven(1, 0, 300, True), BlastChiller(2), VacuumMachine(2)]
-resources = { "Oven": Oven(0, 0, 0, False), "BlastChiller": BlastChiller(0), "VacuumMachine": VacuumMachine(0) }
-for machine in machines:
-    machine_name = type(machine).__name__
-    resources[machine_name].capacity = resources[machine_name].capacity + machine.capacity
-    if isinstance(machine, Oven):
-        if machine.max_temperature > resources["Oven"].max_temperature:
-            resources["Oven"].max_temperature = machine.max_temperature
-        if machine.can_fry:
-            resources["Oven"].can_fry = True
-
-def SIAF_scheduler():
-    # create the model
-    model = cp_model.CpModel()
+def example_machines():
+    return [Oven(1, 300, False), Oven(2, 250, True), Oven(1, 300, True), BlastChiller(2), VacuumMachine(2)]
 
-    # It will contain every task in their interval representation
-    all_steps = {}
 
-    # It will contain every machine variable
-    all_machines = {}
+def scheduling_blocks(receipts, compatibility_index):
+    '''
+    The blocks of the receipes (graphs or lists of steps): a prestep goes
+    with its next step, on a machine compatible with both
+    '''
+    from bounds import as_graph
 
-    # Create variables
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-            duration = step.duration
-            # each step can start in every moment
-            start_var = model.NewIntVar(0, EOH, 'start_%i_%i' % (rec_id, step_id))
-            
-            # each step can end in every moment
-            end_var = model.NewIntVar(0, EOH, 'end_%i_%i' % (rec_id, step_id))
-
-            # interval variable
-            interval_var = model.NewIntervalVar(
-                start_var, duration, end_var, 'interval_%i_%i' % (rec_id, step_id)
-            )
-
-            # update the task dictionary
-            all_steps[rec_id, step_id] = step_type(
-                start=start_var, end=end_var, interval=interval_var)
-
-            # What machines can be used for the current step?
-            # compatible_machines = []
-            # for m_id, machine in enumerate(machines):
-            #     if set(step[1]).issubset(machine[1]):
-            #         compatible_machines.append(m_id)
-
-            compatible_machines = find_compatible_machines(step)
-            # machine variable
-            machine_var = model.NewEnumeratedIntVar(
-                create_flatten_domain(compatible_machines), 
-                'machine_%i_%i' % (rec_id, step_id)
-            )
-            all_machines[rec_id, step_id] = machine_var
-
-    # Constraints definition
-
-    # Precedence constraints
+    blocks = []
     for rec_id, receipt in enumerate(receipts):
-        for step_id in range(len(receipt) - 1):
-            model.Add(
-                all_steps[(rec_id, step_id+1)].start
-                >
-                all_steps[(rec_id, step_id)].end
-            )
-
-    # Cumulative constraints
-    for m_id, machine in enumerate(machines):
-        interval_list = []
-        for rec_id, receipt in enumerate(receipts):
-            for step_id, step in enumerate(receipt):
-                # if set(step[1]).issubset(machine[1]):
-                if m_id in find_compatible_machines(step):
-                    interval_list.append(all_steps[(rec_id, step_id)].interval)
-        # for rec_id, receipt in enumerate(receipts):
-            # interval_list = [all_steps[(rec_id, step_id)].interval for step_id in range(len(receipt))]
-        model.AddCumulative(interval_list, [1]*len(interval_list), 2)
-
-    model.Add(all_machines[(2,0)] != 0)        
+        graph = as_graph(receipt)
+        paired = {}
+        for step in graph:
+            if isinstance(step, PreStep) and step.next_step in graph and not step.next_step in paired:
+                paired[step.next_step] = step
+        for step in graph:
+            if step in paired.values():
+                continue
+            prestep = paired.get(step)
+            compatible_machines = compatibility_index.compatible_machines(step)
+            if prestep is not None:
+                compatible_machines = tuple([m_id for m_id in compatibility_index.compatible_machines(prestep)
+                                             if m_id in compatible_machines])
+            blocks.append(block_type(receipt=rec_id, prestep=prestep, step=step,
+                                     compatible_machines=compatible_machines))
+    return blocks
+
+
+def block_duration(block):
+    '''
+    Time from the start of the prestep (of the step, if alone) to the
+    end of the step: the prestep lasts as on a machine at rest
+    '''
+    if block.prestep is None:
+        return block.step.duration
+    return block.prestep.duration + 1 + block.step.duration
+
+
+# Similar machines pooled in a single resource
+def pool_resources(blocks, machines):
+    '''
+    The pools of machines (the tuples of machines compatible with some
+    block) and their capacity: a pool must perform all the blocks
+    compatible only with its machines
+    '''
+    pools = {}
+    for block in blocks:
+        if block.compatible_machines != () and not block.compatible_machines in pools:
+            pools[block.compatible_machines] = sum([machines[m_id].capacity for m_id in block.compatible_machines])
+    return pools
+
+
+def batch_classes(blocks, machines):
+    '''
+    The blocks that can join a batch on an oven (blast chiller), by
+    exclusivity class and compatible machines: a dictionary (class,
+    compatible machines) -> block ids. A block can share a machine with
+    the blocks of its class if all its compatible machines are sequenced
+    and hold more than one activity
+    '''
+    from scheduler_graph import exclusivity_class, sequenced_kind
+
+    classes = {}
+    for block_id, block in enumerate(blocks):
+        if block.compatible_machines == () or isinstance(block.step, PreStep):
+            # a prestep alone doesn't leave the machine at a temperature
+            continue
+        if not all([sequenced_kind(machines[m_id]) is not None and machines[m_id].capacity > 1
+                    for m_id in block.compatible_machines]):
+            continue
+        key = (exclusivity_class(block.step), block.compatible_machines)
+        if not key in classes:
+            classes[key] = []
+        classes[key].append(block_id)
+    return classes
+
+
+def build_pooled_model(receipts, machines, report=None):
+    '''
+    The CP-SAT model of phase one: every block starts once, and the
+    blocks of every pool never exceed its capacity. On ovens and blast
+    chillers the blocks of the same class can form batches, that take a
+    whole machine (add_class_batches). Returns a pooled_instance_type,
+    with the start of every (rec_id, step)
+    '''
+    from ortools.sat.python import cp_model
+    from bounds import as_graph, compute_bounds, min_duration
+    from instrumentation import start_model, count_family
+    from scheduler_graph import exclusivity_class
+
+    compatibility_index = CompatibilityIndex(machines)
+    graphs = [as_graph(receipt) for receipt in receipts]
+    indices = [{step: index for index, step in enumerate(graph)} for graph in graphs]
+    blocks = scheduling_blocks(graphs, compatibility_index)
+    classes = batch_classes(blocks, machines)
+
+    # The horizon is the makespan of a list schedule of all the receipes,
+    # the lower bound is given by the critical paths and the machine loads
+    bounds = compute_bounds(graphs, compatibility_index, exclusivity_class)
+    EOH = bounds.eoh
+
+    model = cp_model.CpModel()
+    start_model(report, model)
+
+    # a block joining a batch finds the machine at temperature: its prestep is empty
+    batched = {}
+    for class_members in classes.values():
+        for block_id in class_members:
+            batched[block_id] = model.NewBoolVar('batched_%i' % block_id)
+
+    # start of every step, a prestep ends just before its next step. The
+    # intervals of a block: the whole block, or only its step (and the
+    # empty prestep) if it joins a batch
+    starts = {}
+    intervals = []
+    for block_id, block in enumerate(blocks):
+        rec_id, prestep, step = block.receipt, block.prestep, block.step
+        step_index = indices[rec_id][step]
+        latest_end = EOH - (bounds.tails[rec_id][step] - min_duration(step))
+        start_var = model.NewIntVar(bounds.heads[rec_id][step], latest_end - step.duration,
+                                    'start_%i_%i' % (rec_id, step_index))
+        starts[rec_id, step] = start_var
+        if prestep is None:
+            intervals.append([model.NewFixedSizeIntervalVar(start_var, step.duration,
+                                                            'block_%i_%i' % (rec_id, step_index))])
+            continue
+
+        starts[rec_id, prestep] = start_var - prestep.duration - 1
+        if block_id in batched:
+            starts[rec_id, prestep] += prestep.duration * batched[block_id]
+        model.Add(starts[rec_id, prestep] >= bounds.heads[rec_id][prestep])
+        if not block_id in batched:
+            intervals.append([model.NewFixedSizeIntervalVar(start_var - prestep.duration - 1, block_duration(block),
+                                                            'block_%i_%i' % (rec_id, step_index))])
+            continue
+        intervals.append([model.NewOptionalFixedSizeIntervalVar(start_var - prestep.duration - 1,
+                                                                block_duration(block), batched[block_id].Not(),
+                                                                'block_%i_%i' % (rec_id, step_index)),
+                          model.NewOptionalFixedSizeIntervalVar(start_var - 1, step.duration + 1, batched[block_id],
+                                                                'batched_block_%i_%i' % (rec_id, step_index))])
+    count_family(report, model, "steps")
+
+    # Precedence constraints, but the one of a prestep and its next
+    # step in the same block
+    in_block = set([(block.receipt, block.prestep, block.step) for block in blocks if block.prestep is not None])
+    for rec_id, graph in enumerate(graphs):
+        for step, successor in graph.edges():
+            if not (rec_id, step, successor) in in_block:
+                model.Add(starts[rec_id, successor] > starts[rec_id, step] + step.duration)
+    count_family(report, model, "precedence")
+
+    # Cumulative constraint of every pool, over the blocks that can only
+    # be performed by its machines
+    for pool, capacity in pool_resources(blocks, machines).items():
+        pool_intervals = [interval for block, block_intervals in zip(blocks, intervals)
+                          if block.compatible_machines != () and set(block.compatible_machines).issubset(pool)
+                          for interval in block_intervals]
+        model.AddCumulative(pool_intervals, [1] * len(pool_intervals), capacity)
+    count_family(report, model, "pooled cumulative")
+
+    # The pools of ovens and blast chillers count machines too: every
+    # batch of activities of the same class takes a whole machine
+    joins = add_class_batches(model, blocks, starts, machines, classes, batched, EOH)
+    count_family(report, model, "class batches")
 
     # Objective function
     # Our goal is to minimize the makespan, that is the total time of execution
-    obj_var = model.NewIntVar(0, EOH, 'makespan')
-    model.AddMaxEquality(
-        obj_var,
-        [all_steps[(rec_id, len(receipts[rec_id]) - 1)].end for rec_id in range(len(receipts))]
-    )
+    obj_var = model.NewIntVar(bounds.lb, EOH, 'makespan')
+    model.AddMaxEquality(obj_var, [starts[rec_id, step] + step.duration
+                                   for rec_id, graph in enumerate(graphs)
+                                   for step in graph if graph.out_degree(step) == 0])
     model.Minimize(obj_var)
-
-    
-    # Solve model
-    solver = cp_model.CpSolver()
-    status = solver.Solve(model)
-
-    print("Status of the solver: %i" % status)
-        
-    # Display results
-
-    # Print makespan
-    print("Optimal Schedule Length: %i" % solver.ObjectiveValue())
-    print()
-
-    # Create one list of assigned steps per machine
-    assigned_receipts = [[] for _ in range(len(machines))]
-    for rec_id, receipt in enumerate(receipts):
-        for step_id, step in enumerate(receipt):
-            machine = solver.Value(all_machines[(rec_id, step_id)])
-            assigned_receipts[machine].append(
-                assigned_step_type(
-                    start=solver.Value(all_steps[(rec_id, step_id)].start),
-                    receipt=rec_id,
-                    index=step_id
-                )
-            )
-
-    disp_col_width = 10
-    sol_line = ''
-    sol_line_steps = ''
-
-    print('Optimal Schedule', '\n')
-
-    for i in range(len(machines)):
-        # Sort by starting time.
-        assigned_receipts[i].sort()
-        sol_line += 'Machine ' + str(i) + ': '
-        sol_line_steps += 'Machine ' + str(i) + ': '
-
-        for assigned_step in assigned_receipts[i]:
-            name = 'step_%i_%i' % (assigned_step.receipt, assigned_step.index)
-            # Add spaces to output to align columns.
-            sol_line_steps += name + ' ' * (disp_col_width - len(name))
-            start = assigned_step.start
-            duration = receipts[assigned_step.receipt][assigned_step.index].duration
-
-            sol_tmp = '[%i,%i]' % (start, start + duration)
-            # Add spaces to output to align columns.
-            sol_line += sol_tmp + ' ' * (disp_col_width - len(sol_tmp))
-
-        sol_line += '\n'
-        sol_line_steps += '\n'
-
-    print(sol_line_steps)
-    print('Step Time Intervals\n')
-    print(sol_line)
-    print()
-
-
-# Function required to provide the (improbable) right input format to NewEnumeratedIntVar
-def create_flatten_domain(compatible_machines):
-    flatten_domain = []
-    for i, machine_id in enumerate(compatible_machines):
-        if i == 0:
-            flatten_domain.append(machine_id)
-
-        if i == len(compatible_machines)-1:
-            flatten_domain.append(machine_id)
-            return flatten_domain
-
-        if machine_id+1 != compatible_machines[i+1]:
-            flatten_domain.append(machine_id)
-            flatten_domain.append(compatible_machines[i+1])
-
-    # never used
-    return flatten_domain
-
-
-def find_compatible_machines(step):
-    if isinstance(step, OvenCook):
-        return [m_id 
-                for m_id, machine in enumerate(machines)
-                if isinstance(machine, Oven) and
-                   machine.min_temperature <= step.min_temperature and
-                   machine.max_temperature >= step.max_temperature]
-    elif isinstance(step, VacuumStep):
-        return [m_id for m_id, machine in enumerate(machines) if isinstance(machine, VacuumMachine)]
-    elif isinstance(step, BlastStep):
-        return [m_id for m_id, machine in enumerate(machines) if isinstance(machine, BlastChiller)]
-    elif isinstance(step, OvenFry):
-        return [m_id for m_id, machine in enumerate(machines) if isinstance(machine, Oven) and
-                                                                 machine.can_fry]
-
-    return []
+    count_family(report, model, "makespan")
+
+    return pooled_instance_type(model=model, starts=starts, blocks=blocks, joins=joins, obj_var=obj_var,
+                                bounds=bounds)
+
+
+def add_class_batches(model, blocks, starts, machines, classes, batched, horizon):
+    '''
+    Class-aware constraints of the pools of sequenced machines (ovens and
+    blast chillers). Every block of classes (see batch_classes) either
+    leads a batch, or joins (batched) the batch of a block of the same
+    class started before it. A batch takes a whole machine of the pool
+    from the start of the prestep of its leader to the end of its last
+    block, and holds at most as many blocks as the smallest machine
+    compatible with them. The other blocks on sequenced machines take a
+    whole machine alone. Returns the dictionary (block id, leader id) ->
+    boolean variable, true if the block joins the batch of the leader
+    '''
+    from scheduler_graph import sequenced_kind
+
+    # joins[block_id, other_id]: block_id joins the batch led by other_id
+    joins = {}
+    for (_, compatible_machines), class_members in classes.items():
+        batch_size = min([machines[m_id].capacity for m_id in compatible_machines])
+        for block_id in class_members:
+            block = blocks[block_id]
+            for other_id in class_members:
+                if other_id != block_id:
+                    other = blocks[other_id]
+                    joins[block_id, other_id] = model.NewBoolVar('joins_%i_%i' % (block_id, other_id))
+                    model.Add(starts[block.receipt, block.step] > starts[other.receipt, other.step]).OnlyEnforceIf(
+                        joins[block_id, other_id])
+        for block_id in class_members:
+            model.Add(sum([joins[block_id, other_id] for other_id in class_members if other_id != block_id])
+                      == batched[block_id])
+        for other_id in class_members:
+            other = blocks[other_id]
+            # the activities of the batch on the machine, at most batch_size at a time
+            batch_intervals = [model.NewFixedSizeIntervalVar(starts[other.receipt, other.step], other.step.duration,
+                                                             'leader_%i' % other_id)]
+            for block_id in class_members:
+                if block_id != other_id:
+                    block = blocks[block_id]
+                    model.AddImplication(joins[block_id, other_id], batched[other_id].Not())
+                    batch_intervals.append(model.NewOptionalFixedSizeIntervalVar(
+                        starts[block.receipt, block.step] - 1, block.step.duration + 1, joins[block_id, other_id],
+                        'member_%i_%i' % (block_id, other_id)))
+            model.AddCumulative(batch_intervals, [1] * len(batch_intervals), batch_size)
+
+    # the machine taken by every batch: a block alone is a batch
+    intervals = {}
+    for block_id, block in enumerate(blocks):
+        if block.compatible_machines == () or not all([sequenced_kind(machines[m_id]) is not None
+                                                       for m_id in block.compatible_machines]):
+            continue
+        first_start = starts[block.receipt, block.step] - block_duration(block) + block.step.duration
+        end = starts[block.receipt, block.step] + block.step.duration
+        if not block_id in batched:
+            intervals[block_id] = model.NewFixedSizeIntervalVar(first_start, block_duration(block),
+                                                                'batch_%i' % block_id)
+            continue
+        batch_end = model.NewIntVar(0, horizon, 'batch_end_%i' % block_id)
+        model.Add(batch_end >= end)
+        for (joining_id, other_id), join in joins.items():
+            if other_id == block_id:
+                joining = blocks[joining_id]
+                model.Add(batch_end >= starts[joining.receipt, joining.step] + joining.step.duration).OnlyEnforceIf(
+                    join)
+        # the interval wants a variable as its size
+        span = model.NewIntVar(0, horizon, 'batch_span_%i' % block_id)
+        intervals[block_id] = model.NewOptionalIntervalVar(first_start, span, batch_end, batched[block_id].Not(),
+                                                           'batch_%i' % block_id)
+
+    for pool in pool_resources(blocks, machines):
+        pool_intervals = [interval for block_id, interval in intervals.items()
+                          if set(blocks[block_id].compatible_machines).issubset(pool)]
+        if pool_intervals:
+            model.AddCumulative(pool_intervals, [1] * len(pool_intervals), len(pool))
+    return joins
+
+
+def _free_from(item):
+    # an empty item still conflicts with the instant it is placed at
+    return max(item.end, item.start + 1)
+
+
+def assign_machines(receipts, machines, blocks, planned):
+    '''
+    Phase two when the planned times can't be kept (see colour_machines):
+    every block (a block_type) goes on the compatible machine where it
+    starts first. The blocks are taken by planned start
+    (planned: (rec_id, step) -> start) among the ones whose predecessors
+    are assigned. An oven (blast chiller) performs its blocks in the order
+    they are assigned: a prestep lasts prestep_duration from the
+    temperature of the previous block, and a block of an empty prestep
+    can be batched with the activities of its class.
+    Returns a dictionary (rec_id, step) -> scheduled_type like
+    list_schedule, or None if a block has no compatible machine
+    '''
+    from bounds import as_graph
+    from list_scheduler import placed_type, scheduled_type, fits
+    from scheduler_graph import exclusivity_class, sequenced_kind, prestep_duration
+
+    graphs = [as_graph(receipt) for receipt in receipts]
+    placed = [[] for _ in machines]
+    # start of the last block and temperature it left, on the sequenced machines
+    last_starts = [0 for _ in machines]
+    temperatures = [None for _ in machines]
+    # blocks competing for every machine: the least wanted ones are tried first
+    wanted = [0 for _ in machines]
+    for block in blocks:
+        for m_id in block.compatible_machines:
+            wanted[m_id] += 1
+
+    # number of blocks not yet assigned among the predecessors of every block
+    owner = {}
+    for block_id, block in enumerate(blocks):
+        owner[block.receipt, block.step] = block_id
+        if block.prestep is not None:
+            owner[block.receipt, block.prestep] = block_id
+    waiting = [0 for _ in blocks]
+    heap = []
+    for block_id, block in enumerate(blocks):
+        graph = graphs[block.receipt]
+        for step in [block.prestep, block.step]:
+            if step is not None:
+                waiting[block_id] += len([pred for pred in graph.predecessors(step) if pred != block.prestep])
+        if waiting[block_id] == 0:
+            heapq.heappush(heap, (planned[block.receipt, block.step], block_id))
+
+    scheduled = {}
+    while heap:
+        _, block_id = heapq.heappop(heap)
+        block = blocks[block_id]
+        rec_id, prestep, step = block.receipt, block.prestep, block.step
+        graph = graphs[rec_id]
+        step_class = exclusivity_class(step)
+        # earliest start of the step, and of the prestep if any
+        est = max([scheduled[(rec_id, pred)].end + 1 for pred in graph.predecessors(step) if pred != prestep],
+                  default=0)
+        pre_est = 0
+        if prestep is not None:
+            pre_est = max([scheduled[(rec_id, pred)].end + 1 for pred in graph.predecessors(prestep)], default=0)
+
+        best = None
+        for m_id in block.compatible_machines:
+            machine = machines[m_id]
+            items = placed[m_id]
+            sequenced = sequenced_kind(machine) is not None
+            floor = last_starts[m_id] if sequenced else 0
+
+            if prestep is not None:
+                pre_dur = prestep_duration(prestep, temperatures[m_id]) if sequenced else prestep.duration
+                # a machine already at the temperature can share the block
+                # with the activities of its class
+                exclusive = pre_dur > 0 or step_class is None
+                # t is the start of the step, the block starts at t - pre_dur - 1
+                first = max(est, pre_est + pre_dur + 1, floor + pre_dur + 1)
+                candidates = [first] + sorted([_free_from(item) + pre_dur + 1 for item in items
+                                               if _free_from(item) + pre_dur + 1 > first])
+                for t in candidates:
+                    if fits(items, machine.capacity, t - pre_dur - 1, t + step.duration, step_class, exclusive):
+                        if best is None or (t, wanted[m_id]) < best[:2]:
+                            best = (t, wanted[m_id], m_id, pre_dur, exclusive)
+                        break
+            else:
+                first = max(est, floor)
+                candidates = [first] + sorted([_free_from(item) for item in items if _free_from(item) > first])
+                for t in candidates:
+                    if fits(items, machine.capacity, t, t + step.duration, step_class, isinstance(step, PreStep)):
+                        if best is None or (t, wanted[m_id]) < best[:2]:
+                            best = (t, wanted[m_id], m_id, 0, isinstance(step, PreStep))
+                        break
+
+        if best is None:
+            return None
+
+        t, _, m_id, pre_dur, exclusive = best
+        block_start = t
+        if prestep is not None:
+            block_start = t - pre_dur - 1
+            scheduled[(rec_id, prestep)] = scheduled_type(start=block_start, end=block_start + pre_dur, machine=m_id)
+        scheduled[(rec_id, step)] = scheduled_type(start=t, end=t + step.duration, machine=m_id)
+        placed[m_id].append(placed_type(start=block_start, end=t + step.duration, step_class=step_class,
+                                        exclusive=exclusive))
+        if sequenced_kind(machines[m_id]) is not None:
+            last_starts[m_id] = block_start
+            temperatures[m_id] = step.temperature
+
+        # release the blocks waiting for the steps just assigned
+        for done_step in [prestep, step]:
+            if done_step is None:
+                continue
+            for succ in graph.successors(done_step):
+                if succ == step:
+                    continue
+                succ_id = owner[rec_id, succ]
+                waiting[succ_id] -= 1
+                if waiting[succ_id] == 0:
+                    succ_block = blocks[succ_id]
+                    heapq.heappush(heap, (planned[succ_block.receipt, succ_block.step], succ_id))
+
+    if len(scheduled) != sum([graph.number_of_nodes() for graph in graphs]):
+        return None
+    return scheduled
+
+
+def colour_machines(receipts, machines, blocks, planned, leaders=None):
+    '''
+    Phase two: the steps keep the start planned by phase one (planned:
+    (rec_id, step) -> start) and get a machine, as in the coloring of an
+    interval graph. On ovens and blast chillers a batch (a block and the
+    blocks joining it, leaders: block id -> id of the block leading its
+    batch) takes a whole machine until its last block ends, elsewhere
+    every block takes a place. Taken by planned start, every batch (block)
+    goes on a compatible machine free at that time, the one reaching the
+    temperature of its prestep first: the prestep lasts prestep_duration
+    from the temperature of the previous batch, so it starts later than
+    planned, never earlier, and the presteps of the blocks joining a
+    batch are empty. Returns a dictionary (rec_id, step) -> scheduled_type
+    like list_schedule, or None if a batch (block) finds no machine at its
+    time
+    '''
+    from list_scheduler import placed_type, scheduled_type, fits
+    from scheduler_graph import exclusivity_class, sequenced_kind, prestep_duration
+
+    if leaders is None:
+        leaders = {}
+    placed = [[] for _ in machines]
+    # start of the last block and temperature it left, on the sequenced machines
+    last_starts = [0 for _ in machines]
+    temperatures = [None for _ in machines]
+    # blocks competing for every machine: the least wanted ones are tried first
+    wanted = [0 for _ in machines]
+    for block in blocks:
+        for m_id in block.compatible_machines:
+            wanted[m_id] += 1
+
+    def planned_start(block):
+        if block.prestep is None:
+            return planned[block.receipt, block.step]
+        return planned[block.receipt, block.prestep]
+
+    def is_sequenced(block):
+        return all([sequenced_kind(machines[m_id]) is not None for m_id in block.compatible_machines])
+
+    batches = {}
+    for block_id in range(len(blocks)):
+        if not block_id in leaders:
+            batches[block_id] = [block_id]
+    for block_id, leader_id in sorted(leaders.items()):
+        batches[leader_id].append(block_id)
+
+    scheduled = {}
+    for leader_id in sorted(batches, key=lambda leader_id: (planned_start(blocks[leader_id]), leader_id)):
+        leader = blocks[leader_id]
+        members = sorted([blocks[block_id] for block_id in batches[leader_id]],
+                         key=lambda block: planned[block.receipt, block.step])
+        sequenced = is_sequenced(leader)
+        end = max([planned[block.receipt, block.step] + block.step.duration for block in members])
+
+        best = None
+        for m_id in leader.compatible_machines:
+            machine = machines[m_id]
+            temperature = temperatures[m_id]
+            # start and end of the prestep of every member
+            presteps = []
+            for block in members:
+                t = planned[block.receipt, block.step]
+                pre_dur = 0
+                if block.prestep is not None:
+                    pre_dur = prestep_duration(block.prestep, temperature) if sequenced else block.prestep.duration
+                    # a longer prestep than planned would start before its predecessors end
+                    if t - pre_dur - 1 < planned[block.receipt, block.prestep]:
+                        break
+                presteps.append((t - pre_dur - 1 if block.prestep is not None else t, pre_dur))
+                temperature = block.step.temperature
+            if len(presteps) < len(members):
+                continue
+
+            block_start = presteps[0][0]
+            if sequenced:
+                # the machine is taken by the batch alone
+                if block_start < last_starts[m_id] or not fits(placed[m_id], machine.capacity, block_start, end,
+                                                               None, True):
+                    continue
+            else:
+                step = leader.step
+                if not fits(placed[m_id], machine.capacity, block_start, end, exclusivity_class(step),
+                            isinstance(step, PreStep)):
+                    continue
+            if best is None or (presteps[0][1], wanted[m_id]) < best[:2]:
+                best = (presteps[0][1], wanted[m_id], m_id, presteps)
+
+        if best is None:
+            return None
+
+        _, _, m_id, presteps = best
+        for block, (block_start, pre_dur) in zip(members, presteps):
+            t = planned[block.receipt, block.step]
+            if block.prestep is not None:
+                scheduled[(block.receipt, block.prestep)] = scheduled_type(start=block_start,
+                                                                           end=block_start + pre_dur, machine=m_id)
+            scheduled[(block.receipt, block.step)] = scheduled_type(start=t, end=t + block.step.duration,
+                                                                    machine=m_id)
+        step = leader.step
+        placed[m_id].append(placed_type(start=presteps[0][0], end=end, step_class=exclusivity_class(step),
+                                        exclusive=sequenced or isinstance(step, PreStep)))
+        if sequenced:
+            last_starts[m_id] = presteps[-1][0]
+            temperatures[m_id] = members[-1].step.temperature
+
+    return scheduled
+
+
+def assignment_collector(receipts, machines, instance):
+    '''
+    Callback of the solver assigning the machines (phase two) at every
+    solution of the pooled model (a pooled_instance_type). The machines
+    are given to the blocks at their planned times (colour_machines), and
+    only if that isn't possible the blocks are re-timed (assign_machines).
+    Its best attribute is the shortest assignment found, None until then,
+    and retimed tells if it was re-timed. The search stops if it meets
+    the lower bound
+    '''
+    from ortools.sat.python import cp_model
+
+    class AssignmentCollector(cp_model.CpSolverSolutionCallback):
+        """Assign the machines of the intermediate solutions."""
+
+        def __init__(self):
+            cp_model.CpSolverSolutionCallback.__init__(self)
+            self.best = None
+            self.makespan = None
+            self.retimed = None
+
+        def on_solution_callback(self):
+            planned = {key: self.Value(start) for key, start in instance.starts.items()}
+            leaders = {block_id: leader_id for (block_id, leader_id), join in instance.joins.items()
+                       if self.Value(join)}
+            retimed = False
+            scheduled = colour_machines(receipts, machines, instance.blocks, planned, leaders)
+            if scheduled is None:
+                retimed = True
+                scheduled = assign_machines(receipts, machines, instance.blocks, planned)
+            if scheduled is None:
+                return
+            makespan = max([scheduled_step.end for scheduled_step in scheduled.values()], default=0)
+            if self.best is None or (makespan, retimed) < (self.makespan, self.retimed):
+                self.best = scheduled
+                self.makespan = makespan
+                self.retimed = retimed
+            if makespan <= instance.bounds.lb:
+                self.StopSearch()
+    return AssignmentCollector()
+
+
+def aggregated_scheduler(receipts, machines, config=None, report=None):
+    '''
+    Schedules the receipes in two phases: the timing against the pooled
+    machines, solved by CP-SAT with the given configuration (a
+    solver_config_type), then the assignment of the physical machines.
+    Returns a solve_result_type like SIAF_scheduler: the objective is
+    the makespan after the assignment, proven optimal only if it meets
+    the lower bound at the planned times. If no timing of phase one
+    could be kept the schedule is re-timed by the assignment, and its
+    note says so
+    '''
+    from ortools.sat.python import cp_model
+    from instrumentation import phase
+    from list_scheduler import schedule_by_machine
+    from solver_config import solver_config_type, apply_solver_config, solve_result_type
+
+    if config is None:
+        config = solver_config_type()
+    start_time = time.perf_counter()
+
+    with phase(report, "build"):
+        instance = build_pooled_model(receipts, machines, report)
+
+    # the machines are assigned at every solution of phase one: the
+    # shortest timing against the pools isn't always the best assigned
+    solver = apply_solver_config(cp_model.CpSolver(), config)
+    collector = assignment_collector(receipts, machines, instance)
+    with phase(report, "solve"):
+        status = solver.Solve(instance.model, collector)
+    scheduled = collector.best
+
+    if scheduled is None:
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            status = cp_model.UNKNOWN
+        return solve_result_type(status=status,
+                                 status_name=solver.StatusName(status),
+                                 objective=None,
+                                 best_bound=None,
+                                 wall_time=time.perf_counter() - start_time,
+                                 schedule=None)
+
+    makespan = max([scheduled_step.end for scheduled_step in scheduled.values()], default=0)
+    # a re-timed schedule isn't a solution of the model that was solved
+    status = cp_model.OPTIMAL if makespan <= instance.bounds.lb and not collector.retimed else cp_model.FEASIBLE
+    return solve_result_type(status=status,
+                             status_name=solver.StatusName(status),
+                             objective=makespan,
+                             best_bound=instance.bounds.lb,
+                             wall_time=time.perf_counter() - start_time,
+                             schedule=schedule_by_machine(receipts, scheduled, len(machines)),
+                             note="re-timed: the planned times couldn't be kept on the machines"
+                             if collector.retimed else None)
 
 
 if __name__ == '__main__':
-    SIAF_scheduler()
+    result = aggregated_scheduler(example_receipts(), example_machines())
+    print("Status of the solver: %s" % result.status_name)
+    print("Schedule Length: %i" % result.objective)
+    if result.note is not None:
+        print("Note: %s" % result.note)
+    for m_id, assigned_steps in enumerate(result.schedule):
+        print("Machine %i: %s" % (m_id, " ".join(["step_%i_%i [%i,%i]" % (
+            assigned_step.receipt, assigned_step.index, assigned_step.start,
+            assigned_step.start + assigned_step.duration) for assigned_step in assigned_steps])))
@@ -0,0 +1,47 @@
+'''
+Parameters of the CP-SAT solver used by the schedulers, read from a JSON
+configuration file and overridden by the arguments of the single call.
+A missing (or null) parameter keeps the default value of the solver.
+'''
+
+import collections
+import json
+import os
+
+
+solver_config_type = collections.namedtuple('solver_config_type',
+                                            'num_search_workers max_time_in_seconds '
+                                            'relative_gap_limit absolute_gap_limit random_seed')
+solver_config_type.__new__.__defaults__ = (None,) * len(solver_config_type._fields)
+
+# note: a remark of the engine on the schedule, None if there isn't any
+solve_result_type = collections.namedtuple('solve_result_type',
+                                           'status status_name objective best_bound wall_time schedule note')
+solve_result_type.__new__.__defaults__ = (None,)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "solver_config.json")
+
+
+def load_solver_config(config_path=None, **overrides):
+    '''
+    Configuration given by the file (if any) updated with the not None overrides
+    '''
+    parameters = {}
+    if config_path is not None:
+        with open(config_path, "r") as config_file:
+            parameters = json.load(config_file)
+
+    parameters.update({name: value for name, value in overrides.items() if value is not None})
+
+    unknown = set(parameters) - set(solver_config_type._fields)
+    if unknown:
+        raise ValueError("Unknown solver parameters: %s" % ", ".join(sorted(unknown)))
+
+    return solver_config_type(**parameters)
+
+
+def apply_solver_config(solver, config):
+    for name, value in config._asdict().items():
+        if value is not None:
+            setattr(solver.parameters, name, value)
+    return solver
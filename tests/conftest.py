@@ -0,0 +1,28 @@
+import os
+import sys
+
+# the modules of the schedulers are at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def workload(tmp_path, monkeypatch):
+    '''
+    Returns a function loading the receipes of a synthetic instance
+    (instance_spec_type arguments), written as workflows in tmp_path:
+    the receipes, the exporter of the first one and the machines
+    '''
+    from benchmark.generator import instance_spec_type, generate_instance, write_workflows
+    from scheduler_graph import load_receipts
+
+    # the schedulers write schedule.txt and the new workflow in the current directory
+    monkeypatch.chdir(tmp_path)
+
+    def load(*spec, copies=1):
+        instance = generate_instance(instance_spec_type(*spec))
+        paths = write_workflows(instance.workflows, str(tmp_path))
+        receipts, exporter = load_receipts([path for path in paths for _ in range(copies)])
+        return receipts, exporter, instance.machines
+    return load
@@ -0,0 +1,70 @@
+'''
+Feasibility of a schedule (the list of steps assigned to every machine,
+as returned by every engine) against the rules of the detailed model
+'''
+
+from machine import CompatibilityIndex
+from receipt import PreStep
+from scheduler_graph import exclusivity_class, sequenced_kind, prestep_duration, get_node_from_graph
+
+
+def schedule_errors(receipts, machines, schedule, releases=None):
+    '''
+    List of the violated rules, empty if the schedule is feasible
+    '''
+    compatibility_index = CompatibilityIndex(machines)
+    errors = []
+    placed = {}
+    for m_id, assigned_steps in enumerate(schedule):
+        for assigned_step in assigned_steps:
+            placed[assigned_step.receipt, assigned_step.index] = (m_id, assigned_step.start,
+                                                                  assigned_step.start + assigned_step.duration)
+
+    for rec_id, receipt in enumerate(receipts):
+        for index in range(receipt.number_of_nodes()):
+            step = get_node_from_graph(receipt, index)
+            if not (rec_id, index) in placed:
+                errors.append(("missing", rec_id, index))
+                continue
+            m_id, start, end = placed[rec_id, index]
+            if not m_id in compatibility_index.compatible_machines(step):
+                errors.append(("compatibility", rec_id, index))
+            if isinstance(step, PreStep):
+                if end - start > step.duration:
+                    errors.append(("prestep duration", rec_id, index))
+                next_index = receipt.nodes[step.next_step]["index"]
+                if placed[rec_id, next_index][0] != m_id:
+                    errors.append(("prestep machine", rec_id, index))
+            elif end - start != step.duration:
+                errors.append(("duration", rec_id, index))
+            if releases is not None and start < releases[rec_id]:
+                errors.append(("release", rec_id, index))
+            for successor in receipt.successors(step):
+                if placed[rec_id, receipt.nodes[successor]["index"]][1] <= end:
+                    errors.append(("precedence", rec_id, index))
+
+    for m_id, machine in enumerate(machines):
+        activities = [(get_node_from_graph(receipts[assigned_step.receipt], assigned_step.index),
+                       assigned_step.start, assigned_step.start + assigned_step.duration)
+                      for assigned_step in schedule[m_id]]
+        for instant in range(max([end for _, _, end in activities], default=0)):
+            running = [step for step, start, end in activities if start <= instant < end]
+            if len(running) > machine.capacity:
+                errors.append(("capacity", m_id, instant))
+            if len(set([exclusivity_class(step) for step in running])) > 1:
+                errors.append(("class exclusivity", m_id, instant))
+
+        if sequenced_kind(machine) is None:
+            continue
+        # a prestep starts from the temperature of the activity before its
+        # next step on the machine, the last one started
+        holding = [activity for activity in activities if not isinstance(activity[0], PreStep)]
+        for prestep, start, end in activities:
+            if not isinstance(prestep, PreStep):
+                continue
+            next_start = [activity for activity in holding if activity[0] == prestep.next_step][0][1]
+            before = [activity for activity in holding if activity[1] <= next_start and activity[0] != prestep.next_step]
+            temperature = max(before, key=lambda activity: activity[1])[0].temperature if before else None
+            if end - start < prestep_duration(prestep, temperature):
+                errors.append(("prestep too short", m_id, start))
+    return errors
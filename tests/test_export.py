@@ -0,0 +1,50 @@
+import json
+import pickle
+
+
+def step_ids(workflow):
+    '''
+    Ids of the steps of an exported workflow, wait steps and sequences excluded
+    '''
+    ids = []
+    if isinstance(workflow, dict):
+        if workflow.get("StepType", "").startswith("WorkflowCore.Steps.") and not "FakeStep" in workflow["StepType"]:
+            ids.append(workflow["Id"])
+        workflow = list(workflow.values())
+    if isinstance(workflow, list):
+        for item in workflow:
+            ids += step_ids(item)
+    return ids
+
+
+def test_orders_of_the_same_receipe_are_distinct(workload):
+    receipts, _, _ = workload(1, 6, 2, 2, 1, 1, 1, 3, copies=2)
+    first, second = [list(receipt) for receipt in receipts]
+
+    assert set(first).isdisjoint(second)
+
+
+def test_reloaded_order_is_the_same(workload):
+    first, _, _ = workload(1, 6, 2, 2, 1, 1, 1, 3, copies=2)
+    again, _, _ = workload(1, 6, 2, 2, 1, 1, 1, 3, copies=2)
+
+    for receipt, reloaded in zip(first, again):
+        assert set(receipt) == set(reloaded)
+        assert sorted([hash(step) for step in receipt]) == sorted([hash(step) for step in reloaded])
+    # a copy made in another process is the same step
+    step = next(iter(first[0]))
+    assert pickle.loads(pickle.dumps(step)) == step
+    assert hash(pickle.loads(pickle.dumps(step))) == hash(step)
+
+
+def test_export_keeps_every_order(workload):
+    from scheduler_graph import schedule_receipts
+
+    receipts, exporter, machines = workload(1, 6, 2, 2, 1, 1, 1, 3, copies=2)
+    result = schedule_receipts(receipts, machines, "list", exporter=exporter)
+    assert result.schedule is not None
+
+    with open("new_workflow.json") as f:
+        ids = step_ids(json.load(f))
+    assert len(ids) == sum([receipt.number_of_nodes() for receipt in receipts])
+    assert len(set(ids)) == len(ids)
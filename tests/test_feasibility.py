@@ -0,0 +1,99 @@
+import networkx as nx
+import pytest
+
+from schedule_checks import schedule_errors
+
+
+def order(receipe, durations, temperature):
+    '''
+    Hand-made receipe: a human step, a fry and a cook with its preheat
+    '''
+    from receipt import HumanStep, OvenFry, PreHeat, OvenCook
+    from utils import index_graph
+
+    human, fry, preheat, cook = durations
+    cook = OvenCook({"receipe": receipe, "step": "S4", "duration": cook, "temperature": temperature})
+    graph = nx.DiGraph()
+    nx.add_path(graph, [HumanStep({"receipe": receipe, "step": "S1", "duration": human}),
+                        OvenFry({"receipe": receipe, "step": "S2", "duration": fry}),
+                        PreHeat({"receipe": receipe, "step": "S3", "duration": preheat, "temperature": temperature},
+                                cook),
+                        cook])
+    return index_graph(graph)
+
+
+@pytest.mark.parametrize("engine, parameters", [
+    ("cp", {"max_time_in_seconds": 10, "num_search_workers": 1}),
+    ("list", {}),
+    ("pooled", {"max_time_in_seconds": 10, "num_search_workers": 1}),
+])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_engines_give_feasible_schedules(workload, engine, parameters, seed):
+    from scheduler_graph import schedule_receipts
+
+    receipts, _, machines = workload(4, 6, 2, 2, 1, 1, 1, seed)
+    result = schedule_receipts(receipts, machines, engine, **parameters)
+
+    assert result.schedule is not None
+    assert schedule_errors(receipts, machines, result.schedule) == []
+    assert result.objective == max([assigned_step.start + assigned_step.duration
+                                    for assigned_steps in result.schedule for assigned_step in assigned_steps])
+
+
+def test_pooled_engine_keeps_the_planned_times(workload):
+    from scheduler_graph import schedule_receipts
+
+    receipts, _, machines = workload(5, 8, 3, 2, 1, 1, 1, 2)
+    result = schedule_receipts(receipts, machines, "pooled", max_time_in_seconds=10, num_search_workers=1)
+
+    assert result.note is None
+    assert result.best_bound <= result.objective
+
+
+def test_rolling_horizon_respects_releases(workload):
+    from rolling_horizon import order_type, plan_day
+
+    receipts, _, machines = workload(6, 6, 3, 2, 1, 1, 1, 1)
+    releases = [order_id * 20 for order_id in range(len(receipts))]
+    plan = plan_day([order_type(release=release, receipt=receipt) for release, receipt in zip(releases, receipts)],
+                    machines, window=60, stride=30, max_time_in_seconds=5, num_search_workers=1)
+
+    assert len(plan.windows) > 1
+    assert schedule_errors(receipts, machines, plan.schedule, releases) == []
+
+
+@pytest.mark.parametrize("seed", [0, 3, 6, 9])
+def test_default_hint_is_feasible(workload, seed):
+    from ortools.sat.python import cp_model
+    from scheduler_graph import build_model
+
+    receipts, _, machines = workload(4, 6, 2, 2, 1, 1, 1, seed)
+    instance = build_model(receipts, machines)
+    solver = cp_model.CpSolver()
+    solver.parameters.fix_variables_to_their_hinted_value = True
+    solver.parameters.num_search_workers = 1
+    solver.parameters.max_time_in_seconds = 10
+
+    assert instance.bounds.heuristic is not None
+    assert solver.Solve(instance.model) in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+    assert solver.ObjectiveValue() <= instance.bounds.eoh
+
+
+def test_reschedule_keeps_the_started_presteps_valid(tmp_path, monkeypatch):
+    from machine import Oven, Human
+    from scheduler_graph import SIAF_scheduler, reschedule
+
+    monkeypatch.chdir(tmp_path)
+    # the empty preheat of R0 is valid only after the preheat of R2
+    receipts = [order('"R0"', (2, 5, 3, 3), 200), order('"R1"', (4, 1, 4, 6), 180),
+                order('"R2"', (3, 5, 8, 5), 200)]
+    machines = [Oven(2, 300, True), Oven(1, 300, False), Human(1)]
+    first = SIAF_scheduler(receipts, machines, max_time_in_seconds=10, num_search_workers=1)
+    assert schedule_errors(receipts, machines, first.schedule) == []
+
+    for current_time in range(int(first.objective) + 1):
+        new_receipts = [order('"R3"', (2, 2, 5, 5), 200)]
+        result = reschedule(receipts, machines, first.schedule, current_time, new_receipts,
+                            max_time_in_seconds=10, num_search_workers=1)
+        assert result.schedule is not None
+        assert schedule_errors(receipts + new_receipts, machines, result.schedule) == [], current_time
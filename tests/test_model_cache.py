@@ -0,0 +1,50 @@
+import os
+
+from schedule_checks import schedule_errors
+
+
+def solve(instance, machines):
+    from ortools.sat.python import cp_model
+    from scheduler_graph import extract_schedule
+
+    solver = cp_model.CpSolver()
+    solver.parameters.num_search_workers = 1
+    solver.parameters.max_time_in_seconds = 10
+    status = solver.Solve(instance.model)
+    assert status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+    return solver.ObjectiveValue(), extract_schedule(solver, instance, machines)
+
+
+def test_cache_hit_gives_the_built_model(workload, tmp_path):
+    from model_cache import ModelCache
+    from scheduler_graph import build_model
+
+    cache = ModelCache(str(tmp_path / "cache"))
+    receipts, _, machines = workload(3, 6, 2, 2, 1, 1, 1, 4)
+    built = build_model(receipts, machines, cache=cache)
+    assert len([name for name in os.listdir(cache.directory) if name.endswith(".json")]) == 1
+
+    # the same workflows loaded again: other step objects, same instance
+    receipts, _, machines = workload(3, 6, 2, 2, 1, 1, 1, 4)
+    cached = build_model(receipts, machines, cache=cache)
+
+    assert cached.model is not built.model
+    # the text format of the protos, that the cache stores
+    assert str(cached.model.Proto()) == str(built.model.Proto())
+    assert cached.bounds.lb == built.bounds.lb and cached.bounds.eoh == built.bounds.eoh
+    built_objective, built_schedule = solve(built, machines)
+    cached_objective, cached_schedule = solve(cached, machines)
+    assert cached_objective == built_objective
+    assert schedule_errors(receipts, machines, cached_schedule) == []
+
+
+def test_cache_miss_on_another_instance(workload, tmp_path):
+    from model_cache import ModelCache
+    from scheduler_graph import build_model
+
+    cache = ModelCache(str(tmp_path / "cache"))
+    receipts, _, machines = workload(3, 6, 2, 2, 1, 1, 1, 4)
+    build_model(receipts, machines, cache=cache)
+    build_model(receipts, machines, cache=cache, current_time=5)
+
+    assert len([name for name in os.listdir(cache.directory) if name.endswith(".json")]) == 2
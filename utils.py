@@ -1,7 +1,9 @@
 from receipt import *
 import networkx as nx
-import matplotlib.pyplot as plt
+from rendering import render_graph
 import json, pprint
+import collections
+import bisect
 import warnings
 
 
@@ -19,9 +21,10 @@ def read_steps(filepath):
         return step_dict
 
 
-def create_graph(filepath):
+def create_graph(filepath, render_path=None):
     '''
-    Given the filepath containing the receipe, it returns the networkx digraph
+    Given the filepath containing the receipe, it returns the networkx digraph.
+    If render_path is given, the picture of the graph is written there
     '''
     step_dict = read_steps(filepath)
     g = nx.DiGraph()
@@ -36,12 +39,26 @@ def create_graph(filepath):
 
             g.add_edge(step_dict[source], step_dict[dest])
 
-    nx.draw(g, with_labels=True)
-    plt.show()
+    index_graph(g)
+
+    if render_path is not None:
+        render_graph(g, render_path)
 
     return step_dict, g
 
 
+def index_graph(graph):
+    '''
+    Give every step of a receipe graph a dense integer id, following the order
+    in which the graph yields its nodes: the id of a step is stored in its "index"
+    attribute, and graph.graph["nodes"] is the lookup array from ids to steps
+    '''
+    graph.graph["nodes"] = list(graph.nodes())
+    for index, node in enumerate(graph.graph["nodes"]):
+        graph.nodes[node]["index"] = index
+    return graph
+
+
 def get_steps_objects(step_list):
     '''
     Translate the string format of the elements of a step list in thier corresponding objects
@@ -62,7 +79,7 @@ def get_steps_objects(step_list):
                                                     "temperature": temperature
                                                 })
         elif step_type == "ph":
-            temperature = step_dict["oc" + step_id].attributes["temperature"]
+            temperature = step_dict["oc" + step_id].temperature
             step_dict[step_type + step_id] = PreHeat(
                                                 {
                                                     "duration": step_duration,
@@ -104,11 +121,17 @@ class WFCoreUtils:
         "HumanStep": HUMAN_STEP_ID
     }
 
-    def __init__(self, wfcore_path):
+    '''
+    order tells apart the orders of the same receipe scheduled together
+    (its position in the batch, for instance): the steps of an order are
+    the same whenever the workflow is loaded
+    '''
+    def __init__(self, wfcore_path, order=None):
         with open(wfcore_path) as f:
             wfcore_json_str = f.read()
             self.wfcore_json = json.loads(wfcore_json_str)
             self.receipe_name = self.wfcore_json["Id"]
+            self.order = order
             self.step_dict = {}
             self.graph = nx.DiGraph()
 
@@ -118,27 +141,48 @@ class WFCoreUtils:
             self.incoming = {}
             self.parallel_index = 0
             self.n_fake = 0
+            self.receipe_labels = {}
             self.new_json = {}
             self.new_json["Id"] = "New Workflow"
             self.new_json["Version"] = 1
             self.new_json["Steps"] = []
 
+            # every Id of the workflow, associated to its json nodes and to the
+            # sequences containing them: built once, so that a lookup is O(1)
+            self.id_index = {}
+            self.parent_index = {}
+            self.__index_ids(self.wfcore_json, None)
+
 
     '''
-    Get the json form of a step giving its id
+    Index every json node with an Id, in the order of a depth-first visit
+    of the workflow, together with the sequence (list) containing it
     '''
-    def get_step_from_id(self, step_id):
-        # step_list = self.wfcore_json["Steps"]
-        return self.__get_step_from_id_rec(step_id, self.wfcore_json)
-
-    def __get_step_from_id_rec(self, step_id, json):
+    def __index_ids(self, json, parent):
         for k, v in (json.items() if isinstance(json, dict) else
                      enumerate(json) if isinstance(json, list) else []):
-            if k == "Id" and v == step_id:
-                yield json
+            if k == "Id" and isinstance(json, dict):
+                if not v in self.id_index:
+                    self.id_index[v] = []
+                    self.parent_index[v] = []
+                self.id_index[v].append(json)
+                self.parent_index[v].append(parent)
             elif isinstance(v, (dict, list)):
-                for result in self.__get_step_from_id_rec(step_id, v):
-                    yield result
+                self.__index_ids(v, json if isinstance(json, list) else parent)
+
+
+    '''
+    Get the json form of a step giving its id
+    '''
+    def get_step_from_id(self, step_id):
+        return iter(self.id_index.get(step_id, []))
+
+
+    '''
+    Get the sequence (list of steps) containing the step with the given id
+    '''
+    def get_parent_sequence(self, step_id):
+        return self.parent_index.get(step_id, [None])[0]
 
 
     '''
@@ -162,20 +206,20 @@ class WFCoreUtils:
             step_duration = step_json["Inputs"]["Duration"]
             if (step_json["StepType"] == self.OVEN_STEP_ID):
                 if step_json["Inputs"]["OvenValue1"] == self.PREHEAT_STEP_ID:
-                    self.step_dict[step_id] = PreHeat({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "duration": step_duration}, None)
+                    self.step_dict[step_id] = PreHeat({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "order": self.order, "duration": step_duration}, None)
                 else:
                     step_temperature = step_json["Inputs"]["OvenValue2"]
-                    self.step_dict[step_id] = OvenCook({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "duration": step_duration, "temperature": step_temperature})
+                    self.step_dict[step_id] = OvenCook({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "order": self.order, "duration": step_duration, "temperature": step_temperature})
             elif (step_json["StepType"] == self.BLAST_STEP_ID):
                 if step_json["Inputs"]["BlastValue1"] == self.PREBLAST_STEP_ID:
-                    self.step_dict[step_id] = PreBlast({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "duration": step_duration}, None)
+                    self.step_dict[step_id] = PreBlast({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "order": self.order, "duration": step_duration}, None)
                 else:
                     step_temperature = step_json["Inputs"]["BlastValue2"]
-                    self.step_dict[step_id] = Blast({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "duration": step_duration, "temperature": step_temperature})
+                    self.step_dict[step_id] = Blast({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "order": self.order, "duration": step_duration, "temperature": step_temperature})
             elif (step_json["StepType"] == self.HUMAN_STEP_ID):
-                self.step_dict[step_id] = HumanStep({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "duration": step_duration})
+                self.step_dict[step_id] = HumanStep({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "order": self.order, "duration": step_duration})
             elif (step_json["StepType"] == self.VACUUM_STEP_ID):
-                self.step_dict[step_id] = VacuumStep({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "duration": step_duration})
+                self.step_dict[step_id] = VacuumStep({"receipe": "\"" + self.receipe_name + "\"", "step": "\"" + step_id + "\"", "order": self.order, "duration": step_duration})
 
         elif isinstance(step_json, list):
             for step in step_json:
@@ -194,18 +238,20 @@ class WFCoreUtils:
 
             for next_step_id in next_steps_id:
                 if isinstance(self.step_dict[step_id], PreHeat) and isinstance(self.step_dict[next_step_id], OvenCook):
-                    self.step_dict[step_id].attributes["temperature"] = self.step_dict[next_step_id].attributes["temperature"]
+                    self.step_dict[step_id].temperature = self.step_dict[next_step_id].temperature
                     self.step_dict[step_id].next_step = self.step_dict[next_step_id]
                 if isinstance(self.step_dict[step_id], PreBlast) and isinstance(self.step_dict[next_step_id], Blast):
-                    self.step_dict[step_id].attributes["temperature"] = self.step_dict[next_step_id].attributes["temperature"]
+                    self.step_dict[step_id].temperature = self.step_dict[next_step_id].temperature
                     self.step_dict[step_id].next_step = self.step_dict[next_step_id]
                 self.graph.add_edge(self.step_dict[step_id], self.step_dict[next_step_id])
 
-        return self.graph
+        return index_graph(self.graph)
 
-    def draw_graph(self):
-        nx.draw(self.graph, with_labels=True)
-        plt.show()
+    '''
+    Write the picture of the workflow graph to a file, in background
+    '''
+    def draw_graph(self, path="workflow.png"):
+        return render_graph(self.graph, path)
 
 
     def get_next_steps(self, step_json):
@@ -228,23 +274,27 @@ class WFCoreUtils:
         return []
 
 
-    def create_graph_from_schedule(self, scheduled_graphs):
+    def create_graph_from_schedule(self, scheduled_graphs, render_path=None, output_path="new_workflow.json"):
         """
         Create a new workflow in networkx DiGraph format, starting from
-        the output obtained by the scheduler. Currently only supported for
-        two workflows.
+        the output obtained by the scheduler, for any number of workflows.
+        Every step is made a successor of the step (or of the steps
+        ending together) before it on the same machine, when that step
+        belongs to another workflow, whatever the time between them.
+        The new workflow is also written to output_path.
 
         Parameters
         ----------
-        graph_1: networkx.classes.digraph.DiGraph
-            Graph representation of the 1st workflow
+        scheduled_graphs: list of networkx.classes.digraph.DiGraph
+            Graph representations of the workflows, where every step has
+            the "start", "end" and "resource" attributes given by the scheduler
 
-        graph_2: networkx.classes.digraph.DiGraph
-            Graph representation of the 2nd workflow
+        render_path: str, optional
+            If given, the picture of the new workflow is written there,
+            in background
 
-        schedule: dict
-            Dictionary containing start-times and end-times
-            associated to each step of the receipes
+        output_path: str, optional
+            File of the new workflow, new_workflow.json by default
 
         Returns
         -------
@@ -257,6 +307,16 @@ class WFCoreUtils:
         starts, ends, machines = {}, {}, {}
         final_graph = nx.DiGraph()
 
+        # the orders of the same receipe have distinct ids in the new workflow
+        orders = collections.Counter()
+        for scheduled_graph in scheduled_graphs:
+            for step in scheduled_graph:
+                orders[step.receipe] += 1
+                label = step.receipe if orders[step.receipe] == 1 else \
+                    step.receipe[:-1] + "#" + str(orders[step.receipe]) + step.receipe[-1]
+                self.receipe_labels[step.receipe, step.order] = label
+                break
+
         for scheduled_graph in scheduled_graphs:
             starts[scheduled_graph] = nx.get_node_attributes(scheduled_graph, "start")
             ends[scheduled_graph] = nx.get_node_attributes(scheduled_graph, "end")
@@ -264,62 +324,69 @@ class WFCoreUtils:
 
             final_graph = nx.compose(final_graph, scheduled_graph)
 
+        # otherwise the composed graph keeps the ids of the last receipe
+        index_graph(final_graph)
+
         # pprint.pprint(starts)
 
-        for scheduled_graph in scheduled_graphs:
-            for scheduled_step in scheduled_graph:
-                if (scheduled_graph.in_degree(scheduled_step) != 0):
-                    # inter_precedences is True if a precedence among different receipes is found
-                    inter_precedences = True
-                    for predecessor in scheduled_graph.predecessors(scheduled_step):
-                        # if in the schedule a step is immediately preceded by one of the previous step,
-                        # it means that there are not inter precedences to add
-                        if ends[scheduled_graph][predecessor] == starts[scheduled_graph][scheduled_step] - 1:
-                            inter_precedences = False
-                    
-                    if inter_precedences:
-                        # print(scheduled_step)
-                        for other_scheduled_graph in scheduled_graphs:
-                            if not nx.is_isomorphic(scheduled_graph, other_scheduled_graph):
-                                for other_scheduled_step in other_scheduled_graph:
-                                    if (ends[other_scheduled_graph][other_scheduled_step] + 1 == starts[scheduled_graph][scheduled_step]
-                                        and
-                                        machines[other_scheduled_graph][other_scheduled_step] == machines[scheduled_graph][scheduled_step]):
-                                        final_graph.add_edge(other_scheduled_step, scheduled_step)
+        # timeline of every machine: the steps performed by it, sorted by end
+        # (ties in the order of the workflows and of their steps)
+        timelines = {}
+        positions = {}
+        for graph_id, scheduled_graph in enumerate(scheduled_graphs):
+            for step_id, scheduled_step in enumerate(scheduled_graph):
+                machine = machines[scheduled_graph][scheduled_step]
+                if not machine in timelines:
+                    timelines[machine] = []
+                timelines[machine].append((ends[scheduled_graph][scheduled_step], graph_id, step_id, scheduled_step))
+        for timeline in timelines.values():
+            timeline.sort(key=lambda entry: entry[:3])
+            for position, (_, graph_id, step_id, _) in enumerate(timeline):
+                positions[(graph_id, step_id)] = position
+        timeline_ends = {machine: [entry[0] for entry in timeline] for machine, timeline in timelines.items()}
+
+        for graph_id, scheduled_graph in enumerate(scheduled_graphs):
+            for step_id, scheduled_step in enumerate(scheduled_graph):
+                start = starts[scheduled_graph][scheduled_step]
+                machine = machines[scheduled_graph][scheduled_step]
+
+                # the steps before it on the machine end by its start, and
+                # come first in the timeline (an empty step ends at its start)
+                timeline = timelines[machine]
+                last = min(bisect.bisect_right(timeline_ends[machine], start), positions[(graph_id, step_id)])
+                if last == 0:
+                    continue
+                first = bisect.bisect_left(timeline_ends[machine], timeline_ends[machine][last - 1])
+                for _, other_graph_id, _, other_scheduled_step in timeline[first:last]:
+                    if other_graph_id != graph_id:
+                        final_graph.add_edge(other_scheduled_step, scheduled_step)
+
+        if render_path is not None:
+            render_graph(final_graph, render_path)
 
-                else:
-                    if starts[scheduled_graph][scheduled_step] != 0:
-                        for other_scheduled_graph in scheduled_graphs:
-                            if not nx.is_isomorphic(scheduled_graph, other_scheduled_graph):
-                                for other_scheduled_step in other_scheduled_graph:
-                                    if ((ends[other_scheduled_graph][other_scheduled_step] + 1 == starts[scheduled_graph][scheduled_step]
-                                         or
-                                         ends[other_scheduled_graph][other_scheduled_step] == starts[scheduled_graph][scheduled_step])
-                                        and
-                                        machines[other_scheduled_graph][other_scheduled_step] == machines[scheduled_graph][scheduled_step]):
-                                        print(scheduled_step.attributes["receipe"] + " " + scheduled_step.attributes["step"])
-                                        final_graph.add_edge(other_scheduled_step, scheduled_step)
-
-        nx.draw(final_graph, with_labels=True)
-        plt.show()
-        
         scheduled_json = self.create_json_from_graph(final_graph)
 
         # pprint.pprint(self.create_json_from_graph(final_graph))
 
         # pprint.pprint(self.visited)
 
-        with open("new_workflow.json", "w") as f:
-            json.dump(scheduled_json, f, indent=4)            
+        with open(output_path, "w") as f:
+            json.dump(scheduled_json, f, indent=4)
+
+        return final_graph
         
     
     def create_json_from_graph(self, graph):
 
         starting_nodes = self.find_starting_nodes(graph)
 
-        for step in graph:
-            self.incoming[step] = sum([len(list(nx.all_simple_paths(graph, starting_step, step))) 
-                                       for starting_step in starting_nodes])
+        # number of paths from the starting nodes to every step: in topological
+        # order, the paths to a step are the paths to its predecessors
+        for step in nx.topological_sort(graph):
+            if graph.in_degree(step) == 0:
+                self.incoming[step] = 1
+            else:
+                self.incoming[step] = sum([self.incoming[predecessor] for predecessor in graph.predecessors(step)])
 
         # pprint.pprint(self.incoming)
        
@@ -331,15 +398,15 @@ class WFCoreUtils:
 
             # This condition is not verified if at the beginning there is a parallel after another parallel
             # Check get_parallel_json_step to undestand
-            if self.new_json == [] or self.new_json["Steps"][0] != 0: 
+            if self.new_json["Steps"] == [] or self.new_json["Steps"][0] != 0: 
                 self.new_json["Steps"].append(json_step)
                 self.new_json["Steps"].append(wait_json_step)
 
                 if json_parallel:
                     self.new_json["Steps"].append(json_parallel)
             else:
-                self.new_json["Steps"][0](json_step)
-                self.new_json["Steps"].insert(1, json_step)
+                self.new_json["Steps"][0] = json_step
+                self.new_json["Steps"].insert(1, wait_json_step)
 
                 if json_parallel:
                     self.new_json["Steps"].insert(2, json_parallel)
@@ -349,14 +416,13 @@ class WFCoreUtils:
             self.n_parallels = self.n_parallels + 1
             # This condition is not verified if at the beginning there is a parallel after another parallel
             # Check get_parallel_json_step to undestand
-            if self.new_json == [] or self.new_json["Steps"][0] != 0: 
+            if self.new_json["Steps"] == [] or self.new_json["Steps"][0] != 0: 
                 self.new_json["Steps"].append(json_parallel)
             else:
                 self.new_json["Steps"][0] = json_parallel
 
         for step in graph:
             if not (step in self.visited):
-                print(step.attributes["receipe"] + step.attributes["step"])
                 json_step, wait_json_step, json_parallel = self.get_json_from_step(step, list(graph.successors(step)), graph)
 
                 self.new_json["Steps"].append(json_step)
@@ -376,12 +442,20 @@ class WFCoreUtils:
                 self.visited.append(step)
         return starting_nodes
 
+    '''
+    Id of a step in the new workflow: its receipe (numbered, if there are
+    more orders of it) and its id in the receipe
+    '''
+    def get_json_id(self, step):
+        return self.receipe_labels.get((step.receipe, step.order), step.receipe)[:-1] + ";" + step.step_id[1:]
+
     def get_json_from_step(self, step, next_steps, graph):
         
         json_step = {}
-        json_step["Id"] = step.attributes["receipe"][:-1] + ";" + step.attributes["step"][1:]
+        json_step["Id"] = self.get_json_id(step)
         json_step["StepType"] = self.STEP_MAP[step.__class__.__name__]
-        json_step["Inputs"] = step.attributes
+        # a copy: the inputs of the workflow get attributes that the step doesn't have
+        json_step["Inputs"] = dict(step.attributes)
         json_step["NextStepId"] = "\"wait_" + json_step["Id"][1:]
         if self.incoming[step] > 1:
             json_step["Inputs"]["Ingoing"] = self.incoming[step]
@@ -399,9 +473,7 @@ class WFCoreUtils:
         json_parallel = 0
 
         if len(next_steps) == 1:
-            wait_json_step["NextStepId"] = (next_steps[0].attributes["receipe"][:-1] +
-                                            ";" +
-                                            next_steps[0].attributes["step"][1:])
+            wait_json_step["NextStepId"] = self.get_json_id(next_steps[0])
         elif len(next_steps) > 1:
             wait_json_step["NextStepId"] = "parallel_" + str(self.n_parallels)
             json_parallel = self.get_parallel_json_step(next_steps, graph)
@@ -436,7 +508,7 @@ class WFCoreUtils:
                 fake_activity = {
                     "Id": "\"fake_" + str(self.n_fake) + "\"",
                     "StepType": "WorkflowCore.Steps.FakeStep, ProvaWOrkflowCorewebapp",
-                    "NextStepId": next_step.attributes["receipe"][:-1] + ";" + next_step.attributes["step"][1:]
+                    "NextStepId": self.get_json_id(next_step)
                 }
                 self.n_fake += 1
 